@@ -0,0 +1,312 @@
+"""
+Run a Quirk program over many rows of input at once.
+
+    result = batch.run_batch(tree, {"a": [1, 2, 3], "b": [4, 5, 6]})
+    result.printed[0]   # what the first print printed, one value per row
+    result.output(1)    # everything row 1 printed, as quirk.run_to_string()
+
+Each row binds the top-level names to its value from every column before the
+program runs, the way a scope passed to quirk.execute() would. Instead of
+running the program once per row, the columns are bound as NumPy arrays and
+the program is run once: the engines do their arithmetic with Python's
+operators, which NumPy applies element-wise, so every <Expression> and <Term>
+computes the values of all the rows in one go. ^ is the exception: NumPy's
+power doesn't round every result the way Python's ** does, so a Column raises
+its rows to a power one at a time with Python floats (see python_power()). A
+function is evaluated over the rows by passing it the bound names:
+
+    function baz_func(a, b){
+      return a * b + 1
+    }
+    print baz_func(a, b)
+
+Quirk has no branches, so every row runs the same statements and a program
+can be run this way as long as its arithmetic doesn't go wrong. It mustn't
+differ from running the rows one by one, though, and NumPy doesn't raise
+errors the way Python's floats do (1 / 0 is inf, and (-8) ^ 0.5 is nan rather
+than a complex number). So the arrays are computed with every NumPy
+floating-point error except underflow raised, and whenever running a set of
+rows raises one, the set is split in half and each half is run again. A
+single row is run on its own with plain floats. A row that NumPy can't
+compute thus costs a handful of runs over fewer and fewer rows and gives
+exactly the result it would have given by itself, including any error. Any
+other exception (an undeclared function, say) makes every row of the set run
+on its own.
+
+Needs NumPy, which isn't needed by anything else.
+
+    python batch.py [--engine tree|closure|vm] program.q rows.csv
+
+runs program.q over the rows of a CSV file with a header line of names and
+writes a CSV file with a column for each print statement; rows that raised an
+error are reported on stderr.
+"""
+import io
+import sys
+import csv
+import argparse
+
+import quirk
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Starts each line that Column.__str__() prints in place of an array
+marker = "\0column:"
+
+
+if numpy is not None:
+    class Column(numpy.ndarray):
+        """
+        An array of values, one per row, that prints as a marker.
+
+        The engines print str() of a value, so printing a Column puts it in
+        the printed list of its class, where run_rows() looks it up again by
+        its marker. run_batch() makes a subclass with a list of its own for
+        every call, so calls on different threads don't share one. NumPy
+        keeps the type through arithmetic, so every value computed from a
+        Column is one of the same class.
+        """
+
+        printed = None
+
+        def __str__(self):
+            self.printed.append(self)
+            return "%s%d" % (marker, len(self.printed) - 1)
+
+        def __pow__(self, exponent):
+            return python_power(self, exponent)
+
+        def __rpow__(self, base):
+            return python_power(base, self)
+
+
+def python_power(base, exponent):
+    """
+    Return base ** exponent, where one of them is a Column, computed row by
+    row with Python's float **. NumPy's power gives -0.0 ^ 0.5 as -0.0 and
+    rounds some other results differently, so the rows wouldn't print what
+    they print by themselves.
+
+    Python raises ZeroDivisionError and OverflowError itself, and run_rows()
+    splits the rows on those as on NumPy's errors. A negative number to a
+    fractional power is a complex number, which a Column can't hold, so that
+    raises FloatingPointError for its row to be run on its own.
+    """
+    column_type = type(base) if isinstance(base, Column) else type(exponent)
+    (bases, exponents) = numpy.broadcast_arrays(numpy.asarray(base),
+                                                numpy.asarray(exponent))
+    values = [x ** y for (x, y) in zip(bases.ravel().tolist(),
+                                       exponents.ravel().tolist())]
+    if any(isinstance(value, complex) for value in values):
+        raise FloatingPointError("complex result in a power")
+    return numpy.array(values, dtype=float).reshape(bases.shape).view(
+        column_type)
+
+
+class Batch(object):
+    """
+    The results of run_batch().
+
+    rows - the number of rows
+    printed - one array for every print statement the program ran, with the
+        value each row printed: floats if every row printed a number, and
+        otherwise objects, with the text of anything else that was printed
+        and None for rows that raised an error before getting there
+    scope - maps each top-level name bound to a number to an array of its
+        values at the end of the program, like printed
+    errors - maps the index of each row that raised an exception to it
+    """
+
+    def __init__(self, rows, printed, scope, errors):
+        self.rows = rows
+        self.printed = printed
+        self.scope = scope
+        self.errors = errors
+
+    def output(self, row):
+        """Return the text the program printed for a row."""
+        lines = []
+        for values in self.printed:
+            value = values[row]
+            if value is None:
+                break
+            lines.append(printed_text(value) + "\n")
+        return "".join(lines)
+
+
+def run_batch(tree, columns, engine="closure"):
+    """
+    Run a parse tree once for every row of columns and return a Batch.
+
+    columns - maps top-level names to sequences of values, one per row. A
+        name bound to a number instead has that value in every row.
+    engine - the name of the execution engine in quirk.engines to use.
+    """
+    if numpy is None:
+        raise ImportError("batch evaluation needs NumPy")
+    column_type = type("Column", (Column,), {"printed": []})
+    arrays = {}
+    rows = None
+    for (name, values) in columns.items():
+        if isinstance(values, (int, float)):
+            arrays[name] = float(values)
+            continue
+        values = numpy.asarray(values, dtype=float)
+        if rows is None:
+            rows = len(values)
+        elif len(values) != rows:
+            raise ValueError("column %s has %d rows, not %d" %
+                             (name, len(values), rows))
+        arrays[name] = values.view(column_type)
+    if rows is None:
+        rows = 1
+
+    results = run_rows(tree, arrays, column_type.printed, 0, rows, engine)
+    printed_count = max(len(lines) for (start, end, lines, scope, error)
+                        in results)
+    printed = [gather([(start, end, lines[index])
+                       for (start, end, lines, scope, error) in results
+                       if index < len(lines)], rows)
+               for index in range(printed_count)]
+    names = set()
+    for (start, end, lines, scope, error) in results:
+        names.update(scope)
+    scope = dict((name, gather([(start, end, values[name])
+                                for (start, end, lines, values, error)
+                                in results if name in values], rows))
+                 for name in sorted(names))
+    errors = dict((start, error)
+                  for (start, end, lines, scope, error) in results
+                  if error is not None)
+    return Batch(rows, printed, scope, errors)
+
+
+def run_rows(tree, arrays, printed, start, end, engine):
+    """
+    Run a parse tree over rows start to end of arrays, whose Columns put
+    themselves in the list printed when they're printed.
+
+    Returns a list of (start, end, lines, scope, error) tuples for sets of
+    rows that together cover them, in order: lines has an array of values
+    (or a single value for all the rows) for each print, and scope one for
+    each number the program bound. error is the exception a single row
+    raised, and None otherwise.
+    """
+    if end - start == 1:
+        return [run_row(tree, arrays, start, engine)]
+    scope = dict((name, values[start:end] if isinstance(values, Column)
+                  else values)
+                 for (name, values) in arrays.items())
+    out = io.StringIO()
+    del printed[:]
+    try:
+        with numpy.errstate(all="raise", under="ignore"):
+            quirk.engines[engine](tree, scope, out)
+    except ArithmeticError:
+        middle = (start + end) // 2
+        return (run_rows(tree, arrays, printed, start, middle, engine) +
+                run_rows(tree, arrays, printed, middle, end, engine))
+    except Exception:
+        return [run_row(tree, arrays, row, engine)
+                for row in range(start, end)]
+    lines = []
+    for line in out.getvalue().splitlines():
+        if line.startswith(marker):
+            column = printed[int(line[len(marker):])]
+            lines.append(numpy.asarray(column))
+        else:
+            lines.append(value_of(line))
+    del printed[:]
+    return [(start, end, lines, numbers(scope), None)]
+
+
+def run_row(tree, arrays, row, engine):
+    """Run a parse tree on its own for a single row, with plain floats."""
+    scope = dict((name, float(values[row]) if isinstance(values, Column)
+                  else values)
+                 for (name, values) in arrays.items())
+    out = io.StringIO()
+    error = None
+    try:
+        quirk.engines[engine](tree, scope, out)
+    except Exception as e:
+        error = e
+    lines = [value_of(line) for line in out.getvalue().splitlines()]
+    return (row, row + 1, lines, numbers(scope), error)
+
+
+def value_of(line):
+    """Return a printed line as a float if it is a number, else as text."""
+    try:
+        return float(line)
+    except ValueError:
+        return line
+
+
+def printed_text(value):
+    """Return the line a print of value writes, without the newline."""
+    if isinstance(value, float):
+        return str(float(value))
+    return str(value)
+
+
+def numbers(scope):
+    """Return the names in scope bound to numbers or arrays of numbers."""
+    return dict((name, numpy.asarray(value) if isinstance(value, Column)
+                 else value)
+                for (name, value) in scope.items()
+                if isinstance(value, (float, complex, numpy.ndarray)))
+
+
+def gather(parts, rows):
+    """
+    Return an array of rows values from (start, end, values) parts, where
+    values is an array or a single value for rows start to end, and None
+    for the rows no part covers. The array holds floats if it can.
+    """
+    values = numpy.full(rows, None, dtype=object)
+    covered = 0
+    for (start, end, part) in parts:
+        values[start:end] = part
+        covered += end - start
+    if covered < rows:
+        return values
+    try:
+        return values.astype(float)
+    except (TypeError, ValueError):
+        return values
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(
+        description="Run a Quirk program over the rows of a CSV file")
+    arg_parser.add_argument("program")
+    arg_parser.add_argument("rows")
+    arg_parser.add_argument("--engine", choices=sorted(quirk.engines),
+                            default="closure",
+                            help="execution engine (default: closure)")
+    args = arg_parser.parse_args()
+
+    with open(args.program) as source_file:
+        tree = quirk.parse(source_file.read())
+    with open(args.rows, newline="") as rows_file:
+        reader = csv.reader(rows_file)
+        header = next(reader)
+        table = list(reader)
+    columns = dict((name, [float(row[index]) for row in table])
+                   for (index, name) in enumerate(header))
+    result = run_batch(tree, columns, args.engine)
+
+    writer = csv.writer(sys.stdout)
+    writer.writerow(["print%d" % index
+                     for index in range(len(result.printed))])
+    for row in range(result.rows):
+        writer.writerow(["" if values[row] is None
+                         else printed_text(values[row])
+                         for values in result.printed])
+    for (row, error) in sorted(result.errors.items()):
+        sys.stderr.write("row %d: %s: %s\n" %
+                         (row, type(error).__name__, error))
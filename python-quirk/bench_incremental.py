@@ -0,0 +1,99 @@
+"""
+Incremental re-parse benchmark.
+
+Builds programs of 1k to 100k statements, makes the same one-line edit in the
+middle of each with incremental.Document.edit(), and prints the time it took
+next to the time quirk.parse() takes over the whole edited program. The edit
+time should stay flat as the program grows, while the full parse grows with
+it. Each edited tree is checked against the full parse.
+
+    python bench_incremental.py [--max-statements N] [--repeat N]
+"""
+import io
+import sys
+import time
+import argparse
+
+import quirk
+import treeformat
+import incremental
+
+# One of every statement shape. Programs are built by repeating these.
+statement_templates = [
+    "function f(a, b){\n  var y = a - +b\n  return y, a ^ 2\n}",
+    "var x = (5 * 2) / 5",
+    "var v, w = f(-5, +2)",
+    "print 1 + 4 - 3",
+    "print f(x, 2):1 * (v - w)",
+]
+
+# The line the edit replaces, and the two lines it alternately puts there
+edited_line = "print 0"
+replacements = ["print x * (v + 1)", "print 2 ^ x"]
+
+
+def make_source(statement_count):
+    """Return source of statement_count statements with edited_line in the
+    middle."""
+    lines = [statement_templates[i % len(statement_templates)]
+             for i in range(statement_count - 1)]
+    lines.insert(len(lines) // 2, edited_line)
+    return "\n".join(lines) + "\n"
+
+
+def time_edits(document, repeat):
+    """
+    Return the best wall time of repeat edits of the edited line, which
+    alternate between the replacements.
+    """
+    start = document.source.index(edited_line)
+    end = start + len(edited_line)
+    best = None
+    for i in range(repeat):
+        text = replacements[i % len(replacements)]
+        before = time.perf_counter()
+        document.edit(start, end, text)
+        elapsed = time.perf_counter() - before
+        end = start + len(text)
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def encode(tree):
+    """
+    Return the binary encoding of tree; comparing these avoids recursing down
+    the Program chain of a large tree.
+    """
+    out = io.BytesIO()
+    treeformat.write_tree(tree, out)
+    return out.getvalue()
+
+
+def time_full_parse(source):
+    """Return the parse tree of source and the wall time quirk.parse took."""
+    before = time.perf_counter()
+    tree = quirk.parse(source)
+    return (tree, time.perf_counter() - before)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--max-statements", type=int, default=100000)
+    arg_parser.add_argument("--repeat", type=int, default=20)
+    args = arg_parser.parse_args()
+
+    print("%10s %14s %14s %10s" % ("statements", "full parse s", "edit s",
+                                   "speedup"))
+    size = 1000
+    while size <= args.max_statements:
+        document = incremental.Document(make_source(size))
+        edit_seconds = time_edits(document, args.repeat)
+        (tree, parse_seconds) = time_full_parse(document.source)
+        if encode(tree) != encode(document.tree):
+            raise Exception("incremental tree differs from the full parse")
+        print("%10d %14.4f %14.6f %9.0fx" % (size, parse_seconds,
+                                             edit_seconds,
+                                             parse_seconds / edit_seconds))
+        sys.stdout.flush()
+        size *= 10
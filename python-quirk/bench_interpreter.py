@@ -0,0 +1,87 @@
+"""
+Interpreter engine benchmark.
+
+Runs the same generated, arithmetic-heavy Quirk program on each execution
+engine in quirk.engines and prints the best time of several runs. The program
+declares a few small helper functions and calls them many times, which is
+where walking the tree node by node costs the most. The helpers are pure, so
+--memoize shows what memoizing them (see memo.py) saves, and they have
+constant subexpressions for --optimize (see optimizer.py) to fold.
+
+    python bench_interpreter.py [--calls N] [--repeat N] [--memoize N]
+                                [--optimize]
+"""
+import os
+import sys
+import time
+import argparse
+
+import memo
+import quirk
+import optimizer
+
+helper_functions = """
+function scale(a, b){
+  var s = a * b + (a - b) / 2
+  return s, s ^ 2
+}
+
+function poly(x){
+  var y = x ^ 3 - 2 * x ^ 2 + x / 4 - 1
+  return y
+}
+
+function pair(a, b){
+  return poly(a) + poly(b), scale(a, b):1
+}
+"""
+
+call_templates = [
+    "var r%d = scale(%d, 3):0 * poly(2) - 7 / (1 + %d)",
+    "var p%d, q%d = pair(%d, 2)",
+    "print poly(%d) + scale(1, %d):1 - pair(3, 4):0",
+]
+
+
+def make_source(calls):
+    """Return Quirk source with the helper functions and calls statements."""
+    lines = [helper_functions]
+    for i in range(calls):
+        template = call_templates[i % len(call_templates)]
+        lines.append(template % ((i,) * template.count("%d")))
+    return "\n".join(lines) + "\n"
+
+
+def time_engine(tree, engine, repeat):
+    """Return the best wall time of repeat runs of tree on engine."""
+    best = None
+    with open(os.devnull, "w") as devnull:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            quirk.execute(tree, devnull, engine)
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best:
+                best = elapsed
+    return best
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--calls", type=int, default=3000)
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--memoize", type=int, default=0, metavar="N")
+    arg_parser.add_argument("--optimize", action="store_true")
+    args = arg_parser.parse_args()
+    memo.memo_size = args.memoize
+
+    tree = quirk.parse(make_source(args.calls))
+    if args.optimize:
+        tree = optimizer.optimize(tree)
+    baseline = None
+    print("%10s %12s %10s" % ("engine", "seconds", "speedup"))
+    for engine in quirk.engines:
+        seconds = time_engine(tree, engine, args.repeat)
+        if baseline is None:
+            baseline = seconds
+        print("%10s %12.4f %9.1fx" % (engine, seconds, baseline / seconds))
+        sys.stdout.flush()
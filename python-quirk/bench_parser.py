@@ -0,0 +1,82 @@
+"""
+Parser scaling benchmark.
+
+Times fastparser.parse() (and, where it fits in the recursion limit,
+parser.parse() in packrat mode) on generated token lists from 1k to 1M tokens
+and prints the time per token for each size. Time per token should stay flat
+as the input grows if parsing is linear.
+
+    python bench_parser.py [--max-tokens N] [--repeat N]
+"""
+import sys
+import time
+import argparse
+
+import lexer
+import parser
+import fastparser
+
+# One of every statement shape, written as token lists. Programs are built by
+# repeating these until the requested number of tokens is reached.
+statement_templates = [
+    "FUNCTION IDENT:f LPAREN IDENT:a COMMA IDENT:b RPAREN LBRACE "
+    "VAR IDENT:y ASSIGN IDENT:a SUB ADD IDENT:b "
+    "RETURN IDENT:y COMMA IDENT:a EXP NUMBER:2 RBRACE",
+    "VAR IDENT:x ASSIGN LPAREN NUMBER:5 MULT NUMBER:2 RPAREN DIV NUMBER:5",
+    "VAR IDENT:v COMMA IDENT:w ASSIGN IDENT:f LPAREN SUB NUMBER:5 COMMA "
+    "ADD NUMBER:2 RPAREN",
+    "PRINT NUMBER:1 ADD NUMBER:4 SUB NUMBER:3",
+    "PRINT IDENT:f LPAREN IDENT:x COMMA NUMBER:2 RPAREN COLON NUMBER:1 "
+    "MULT LPAREN IDENT:v SUB IDENT:w RPAREN",
+]
+statement_templates = [lexer.read_tokens(t) for t in statement_templates]
+
+
+def make_tokens(token_count):
+    """Return a token list (ending in EOF) of roughly token_count tokens."""
+    tokens = []
+    i = 0
+    while len(tokens) < token_count:
+        tokens.extend(statement_templates[i % len(statement_templates)])
+        i += 1
+    tokens.append(lexer.eofToken)
+    return tokens
+
+
+def time_parse(parse, tokens, repeat):
+    """Return the best wall time of repeat calls to parse(tokens)."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        (result, ret_index, tree) = parse(tokens)
+        elapsed = time.perf_counter() - start
+        if not result or tokens[ret_index].kind != lexer.EOF:
+            raise Exception("benchmark input did not parse")
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--max-tokens", type=int, default=1000000)
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    args = arg_parser.parse_args()
+
+    print("%10s %12s %12s %14s" % ("tokens", "engine", "seconds", "us/token"))
+    size = 1000
+    while size <= args.max_tokens:
+        tokens = make_tokens(size)
+        engines = [("fastparser", fastparser.parse),
+                   ("packrat", parser.parse)]
+        for (engine, parse) in engines:
+            try:
+                seconds = time_parse(parse, tokens, args.repeat)
+            except RecursionError:
+                print("%10d %12s %12s %14s" % (len(tokens), engine, "-",
+                                               "recursion"))
+                continue
+            print("%10d %12s %12.4f %14.3f" % (len(tokens), engine, seconds,
+                                               seconds * 1e6 / len(tokens)))
+        sys.stdout.flush()
+        size *= 10
@@ -0,0 +1,265 @@
+"""
+Scaling benchmark for each stage of running a Quirk program.
+
+Generates Quirk programs of growing size and times lexer.lex(), the
+<Program> rule of parser.py and running the tree on each execution engine in
+quirk.engines separately, reporting tokens per second for the lexer, parse
+tree nodes per second for the other stages, and the peak memory each stage
+allocates. The shape of the programs is set by:
+
+    --sizes      the numbers of top-level statements to try
+    --depth      how deeply the parentheses of each expression nest
+    --functions  how many functions the program declares
+    --fan-out    how many calls of other functions each function makes
+
+Function n only calls functions declared before it, picked at random, so a
+call of the last function makes up to fan-out ^ functions calls in all.
+Generated programs never raise errors. Times are the best of --repeat runs;
+peak memory comes from a separate run under tracemalloc, which would
+otherwise slow the timed runs down. --json saves the results, and --compare
+prints how much faster or slower each stage is than in a saved file.
+
+    python bench_scaling.py [--sizes N,N,...] [--depth N] [--functions N]
+                            [--fan-out N] [--engine NAME ...] [--repeat N]
+                            [--seed N] [--json FILE] [--compare FILE]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tracemalloc
+
+import lexer
+import quirk
+import parser
+
+operators = ["+", "-", "*", "/"]
+
+
+def make_expression(rng, depth, names):
+    """
+    Return the text of an expression with parentheses nested depth deep,
+    reading the given names. Only constants are divided by or raised to a
+    power, so the expression can't raise an error.
+    """
+    if depth == 0:
+        if names and rng.random() < 0.6:
+            return rng.choice(names)
+        return "%d" % rng.randint(1, 9)
+    inner = make_expression(rng, depth - 1, names)
+    operator = rng.choice(operators)
+    if operator == "/":
+        return "(%s / %d)" % (inner, rng.randint(2, 9))
+    if rng.random() < 0.2:
+        return "(%s %s 2 ^ %d)" % (inner, operator, rng.randint(1, 3))
+    leaf = make_expression(rng, 0, names)
+    if rng.random() < 0.5:
+        return "(%s %s %s)" % (inner, operator, leaf)
+    return "(%s %s %s)" % (leaf, operator, inner)
+
+
+def make_call(rng, function, names):
+    """Return the text of a call of function number function."""
+    args = ", ".join(rng.choice(names) for _ in range(2))
+    return "f%d(%s):%d" % (function, args, rng.randint(0, 1))
+
+
+def make_function(rng, number, depth, fan_out):
+    """Return the text of function number, which calls fan_out others."""
+    lines = ["function f%d(a, b){" % number]
+    names = ["a", "b"]
+    for i in range(fan_out if number > 0 else 0):
+        callee = rng.randrange(number)
+        lines.append("  var c%d = %s" % (i, make_call(rng, callee, names)))
+        names.append("c%d" % i)
+    lines.append("  var t = %s" % make_expression(rng, depth, names))
+    lines.append("  return t, %s" % make_expression(rng, depth, names + ["t"]))
+    lines.append("}")
+    return "\n".join(lines)
+
+
+def make_source(statements, depth, functions, fan_out, seed):
+    """
+    Return the source text of a program with functions functions and
+    statements top-level statements: a mix of single and multiple
+    assignments and prints, with expressions nested depth deep and calls
+    of the functions.
+    """
+    rng = random.Random(seed)
+    parts = [make_function(rng, number, depth, fan_out)
+             for number in range(functions)]
+    names = []
+    for i in range(statements):
+        kind = rng.randrange(4)
+        if kind == 0 or len(names) < 2:
+            parts.append("var v%d = %s" %
+                         (i, make_expression(rng, depth, names)))
+            names.append("v%d" % i)
+        elif kind == 1 and functions:
+            parts.append("var v%d, w%d = f%d(%s, %s)" %
+                         (i, i, rng.randrange(functions),
+                          rng.choice(names), rng.choice(names)))
+            names.extend(["v%d" % i, "w%d" % i])
+        elif kind == 2 and functions:
+            call = make_call(rng, rng.randrange(functions), names)
+            parts.append("var v%d = %s - %s" %
+                         (i, call, make_expression(rng, depth, names)))
+            names.append("v%d" % i)
+        else:
+            parts.append("print %s" % make_expression(rng, depth, names))
+        # Reading only recent names keeps values from compounding into inf
+        # over the whole program.
+        names = names[-8:]
+    return "\n".join(parts) + "\n"
+
+
+def count_nodes(tree):
+    """Return the number of nodes (not tokens) in a parse tree."""
+    count = 0
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(child for child in node[1:] if isinstance(child, list))
+    return count
+
+
+def lex_stage(source):
+    """Lex source into a token list ending in EOF."""
+    tokens = lexer.lex(source)
+    tokens.append(lexer.eofToken)
+    return tokens
+
+
+def parse_stage(tokens):
+    """Parse a token list from <Program> with parser.py."""
+    (result, ret_index, tree) = parser.parse(tokens)
+    if not result or tokens[ret_index].kind != lexer.EOF:
+        raise Exception("benchmark input did not parse")
+    return tree
+
+
+def time_stage(stage, arg, repeat):
+    """
+    Return the best wall time of repeat calls of stage(arg), the peak
+    memory in bytes a further call allocates, and what stage returned.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = stage(arg)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    tracemalloc.start()
+    try:
+        stage(arg)
+        (current, peak) = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return (best, peak, result)
+
+
+def run_size(statements, args):
+    """Return the results for a program of statements statements."""
+    source = make_source(statements, args.depth, args.functions,
+                         args.fan_out, args.seed)
+    stages = {}
+
+    (seconds, peak, tokens) = time_stage(lex_stage, source, args.repeat)
+    stages["lex"] = {"seconds": seconds, "peak_bytes": peak,
+                     "tokens_per_second": len(tokens) / seconds}
+
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, 10000))
+    try:
+        (seconds, peak, tree) = time_stage(parse_stage, tokens, args.repeat)
+    finally:
+        sys.setrecursionlimit(limit)
+    nodes = count_nodes(tree)
+    stages["parse"] = {"seconds": seconds, "peak_bytes": peak,
+                       "nodes_per_second": nodes / seconds}
+
+    with open(os.devnull, "w") as devnull:
+        for engine in args.engine:
+            def execute(tree):
+                quirk.execute(tree, devnull, engine)
+            (seconds, peak, result) = time_stage(execute, tree, args.repeat)
+            stages[engine] = {"seconds": seconds, "peak_bytes": peak,
+                              "nodes_per_second": nodes / seconds}
+    return {"statements": statements, "bytes": len(source),
+            "tokens": len(tokens), "nodes": nodes, "stages": stages}
+
+
+def compare(results, old_path):
+    """
+    Print the speedup of every stage in results over the same stage for the
+    same number of statements in the results saved in old_path.
+    """
+    with open(old_path) as old_file:
+        old = json.load(old_file)
+    old_sizes = dict((size["statements"], size) for size in old["sizes"])
+    print("\n%10s %10s %12s %12s %9s" % ("statements", "stage", "old", "new",
+                                          "speedup"))
+    for size in results["sizes"]:
+        old_size = old_sizes.get(size["statements"])
+        if old_size is None:
+            continue
+        for (stage, new_stage) in size["stages"].items():
+            old_stage = old_size["stages"].get(stage)
+            if old_stage is None:
+                continue
+            print("%10d %10s %12.4f %12.4f %8.2fx" % (
+                size["statements"], stage, old_stage["seconds"],
+                new_stage["seconds"],
+                old_stage["seconds"] / new_stage["seconds"]))
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--sizes", default="100,300,1000,3000",
+                            help="comma-separated statement counts")
+    arg_parser.add_argument("--depth", type=int, default=4)
+    arg_parser.add_argument("--functions", type=int, default=6)
+    arg_parser.add_argument("--fan-out", type=int, default=2)
+    arg_parser.add_argument("--engine", action="append",
+                            choices=sorted(quirk.engines),
+                            help="engine to run (default: all of them)")
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--json", metavar="FILE",
+                            help="save the results to FILE")
+    arg_parser.add_argument("--compare", metavar="FILE",
+                            help="compare with results saved by --json")
+    args = arg_parser.parse_args()
+    if not args.engine:
+        args.engine = list(quirk.engines)
+
+    results = {
+        "python": platform.python_version(),
+        "parameters": {"depth": args.depth, "functions": args.functions,
+                       "fan_out": args.fan_out, "repeat": args.repeat,
+                       "seed": args.seed},
+        "sizes": [],
+    }
+    print("%10s %10s %10s %12s %14s %12s" % (
+        "statements", "tokens", "stage", "seconds", "per second", "peak KiB"))
+    for statements in [int(size) for size in args.sizes.split(",")]:
+        size = run_size(statements, args)
+        results["sizes"].append(size)
+        for (stage, stage_results) in size["stages"].items():
+            rate = stage_results.get("tokens_per_second",
+                                     stage_results.get("nodes_per_second"))
+            print("%10d %10d %10s %12.4f %14.0f %12.1f" % (
+                statements, size["tokens"], stage, stage_results["seconds"],
+                rate, stage_results["peak_bytes"] / 1024.0))
+        sys.stdout.flush()
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump(results, json_file, indent=1)
+            json_file.write("\n")
+    if args.compare:
+        compare(results, args.compare)
@@ -0,0 +1,601 @@
+"""
+Bytecode compiler and stack virtual machine for Quirk.
+
+compile_program() turns a parse tree into a Code object: a flat array of
+(opcode, argument) integer pairs plus the constants, names and nested
+function Code objects the instructions refer to. run_code() executes it on an
+operand stack. Calls push a frame on an explicit frame stack instead of
+recursing in Python, and operator chains are flattened by the compiler, so
+neither compiling nor running recurses over Expression/Term/Factor nodes.
+The frame stack is still limited to sys.getrecursionlimit() frames, so a
+program that recurses forever raises RecursionError as it does on the other
+engines.
+
+Scopes are the same dicts with a "__parent__" link as in interpreter.py, and
+programs print the same output. dump_code() and load_code() convert a Code
+object to and from bytes.
+
+As a script it reads a parse tree from parser.py (or previously compiled
+code) and runs it, or with --output writes the compiled code to a file:
+
+    python lexer.py < x.q | python parser.py | python bytecode.py
+    python lexer.py < x.q | python parser.py | python bytecode.py -o x.qc
+    python bytecode.py x.qc
+
+Instructions (arg is ignored where it isn't mentioned):
+    LOAD_CONST i      push consts[i]
+    LOAD_NAME i       push the value bound to names[i]
+    NEGATE            replace the top of the stack with its negation
+    BINARY_ADD ... BINARY_POW
+                      pop right, pop left, push left <op> right
+    CALL n            pop n arguments and a function, run the function in a
+                      new scope whose __parent__ is the current one
+    CALL_ITEM n       CALL, for a call whose result goes straight to the
+                      INDEX_RESULT k after it: the callee's SKIP_VALUEs skip
+                      every value but k (see lazy.py)
+    SKIP_VALUE n      start of a returned value that can be skipped, whose
+                      instructions are the next n; if the function was
+                      called by CALL_ITEM for a different value, push None
+                      instead of running them
+    RETURN n          pop n values and return them as a list
+    INDEX_RESULT k    replace the list on top of the stack with its item k
+    PRINT             pop a value and write it to the output
+    STORE i           pop a value and bind names[i] to it
+    STORE_RESULTS i   pop a list of values and bind them to the names in the
+                      tuple consts[i]
+    MAKE_FUNCTION i   bind the name of functions[i] to that function
+    MAKE_MEMO_FUNCTION i
+                      MAKE_FUNCTION, for a function whose calls are
+                      memoized (see memo.py) when memo.memo_size is set
+"""
+import ast
+import sys
+import array
+import marshal
+import argparse
+import operator
+import fileinput
+
+import memo
+import lazy
+import treeformat
+
+# The last byte is the version of the format; bump it whenever the opcodes
+# or the layout of a Code object change, so older files are refused.
+MAGIC = b"QRKC\x02"
+
+opnames = [
+    "LOAD_CONST", "LOAD_NAME", "NEGATE",
+    "BINARY_ADD", "BINARY_SUB", "BINARY_MUL", "BINARY_DIV", "BINARY_POW",
+    "CALL", "RETURN", "INDEX_RESULT", "PRINT", "STORE", "STORE_RESULTS",
+    "MAKE_FUNCTION", "MAKE_MEMO_FUNCTION", "CALL_ITEM", "SKIP_VALUE",
+]
+for opcode, opname in enumerate(opnames):
+    globals()[opname] = opcode
+
+binary_operators = {
+    BINARY_ADD: operator.add,
+    BINARY_SUB: operator.sub,
+    BINARY_MUL: operator.mul,
+    BINARY_DIV: operator.truediv,
+    BINARY_POW: operator.pow,
+}
+
+chain_opcodes = {
+    "Expression0": BINARY_ADD,
+    "Expression1": BINARY_SUB,
+    "Term0": BINARY_MUL,
+    "Term1": BINARY_DIV,
+}
+
+
+class Code(object):
+    """
+    A compiled Quirk program or function body.
+
+    name - the function name ("<program>" for the top level)
+    params - tuple of parameter names
+    code - array of opcode, argument pairs
+    consts - list of constants (floats, and name tuples for STORE_RESULTS)
+    names - list of identifiers used by LOAD_NAME and STORE
+    functions - list of Code objects for the functions declared in this body
+    memoized - while compiling, the id()s of the FunctionDeclaration0 nodes
+        to compile to MAKE_MEMO_FUNCTION
+    skippable - while compiling, the flags of the values each Return0 node
+        can skip, by id() (see lazy.py)
+    """
+
+    __slots__ = ("name", "params", "code", "consts", "names", "functions",
+                 "const_index", "name_index", "memoized", "skippable")
+
+    def __init__(self, name, params):
+        self.name = name
+        self.params = tuple(params)
+        self.code = array.array("i")
+        self.consts = []
+        self.names = []
+        self.functions = []
+        # dedupe tables, only used while compiling
+        self.const_index = {}
+        self.name_index = {}
+        self.memoized = frozenset()
+        self.skippable = {}
+
+    def emit(self, opcode, arg=0):
+        """Append one instruction."""
+        self.code.append(opcode)
+        self.code.append(arg)
+
+    def add_const(self, value):
+        """Return the index of value in consts, adding it if needed."""
+        # keyed by repr too so that 0.0 and -0.0 stay distinct
+        key = (value, repr(value))
+        if key not in self.const_index:
+            self.const_index[key] = len(self.consts)
+            self.consts.append(value)
+        return self.const_index[key]
+
+    def add_name(self, identifier):
+        """Return the index of identifier in names, adding it if needed."""
+        if identifier not in self.name_index:
+            self.name_index[identifier] = len(self.names)
+            self.names.append(identifier)
+        return self.name_index[identifier]
+
+
+def disassemble(code):
+    """Return a readable listing of a Code object and its functions."""
+    lines = ["%s(%s):" % (code.name, ", ".join(code.params))]
+    for pc in range(0, len(code.code), 2):
+        (opcode, arg) = (code.code[pc], code.code[pc + 1])
+        detail = ""
+        if opcode in (LOAD_CONST, STORE_RESULTS):
+            detail = " (%r)" % (code.consts[arg],)
+        elif opcode in (LOAD_NAME, STORE):
+            detail = " (%s)" % code.names[arg]
+        elif opcode in (MAKE_FUNCTION, MAKE_MEMO_FUNCTION):
+            detail = " (%s)" % code.functions[arg].name
+        lines.append("  %4d %-14s %d%s" % (pc // 2, opnames[opcode], arg,
+                                          detail))
+    for function in code.functions:
+        lines.append(disassemble(function))
+    return "\n".join(lines)
+
+
+# start serialization
+def dump_code(code):
+    """Return a Code object (and its nested functions) as bytes."""
+    return MAGIC + marshal.dumps(code_to_tuple(code))
+
+
+def load_code(data):
+    """Return the Code object serialized in data by dump_code()."""
+    if data[:len(MAGIC) - 1] != MAGIC[:-1]:
+        raise ValueError("not compiled Quirk code")
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("Quirk code compiled by another version of "
+                         "bytecode.py; compile it again")
+    return code_from_tuple(marshal.loads(data[len(MAGIC):]))
+
+
+def code_to_tuple(code):
+    return (code.name, code.params, code.code.tobytes(), tuple(code.consts),
+            tuple(code.names),
+            tuple(code_to_tuple(function) for function in code.functions))
+
+
+def code_from_tuple(fields):
+    (name, params, code_bytes, consts, names, functions) = fields
+    code = Code(name, params)
+    code.code.frombytes(code_bytes)
+    code.consts = list(consts)
+    code.names = list(names)
+    code.functions = [code_from_tuple(function) for function in functions]
+    return code
+# end serialization
+
+
+# start compiler
+def compile_program(tree):
+    """Return the Code object for a complete program parse tree."""
+    code = Code("<program>", [])
+    if memo.memo_size > 0:
+        code.memoized = frozenset(memo.pure_functions(tree))
+    code.skippable = lazy.skippable_values(tree)
+    compile_tree(tree, code)
+    code.emit(RETURN, 0)
+    return code
+
+
+def compile_tree(pt, code):
+    """Emit the instructions for the subtree pt into code."""
+    globals()["compile_" + pt[0]](pt, code)
+
+
+def token_lexeme(tok):
+    """
+    Return the lexeme of an IDENT or NUMBER token, e.g. 'x' for 'IDENT:x'.
+    """
+    return tok[tok.find(":") + 1:]
+
+
+def name_of(pt):
+    """Return the identifier of a Name subtree (the IDENT is always last)."""
+    return token_lexeme(pt[-1])
+
+
+def number_of(pt):
+    """Return the float value of a Number subtree."""
+    value = float(token_lexeme(pt[-1]))
+    if "Number1" == pt[0]:
+        return -value
+    return value
+
+
+def chain_items(pt, link):
+    """
+    Return the operand subtrees of a right-recursive chain and the labels of
+    the nodes that joined them. link is the index of the rest of the chain.
+    """
+    items = []
+    labels = []
+    while len(pt) > 2:
+        items.append(pt[1])
+        labels.append(pt[0])
+        pt = pt[link]
+    items.append(pt[1])
+    return (items, labels)
+
+
+# <Program> -> <Statement> <Program> | <Statement>
+def compile_Program0(pt, code):
+    for statement in chain_items(pt, 2)[0]:
+        compile_tree(statement, code)
+
+
+compile_Program1 = compile_Program0
+
+
+# <Statement> -> <FunctionDeclaration> | <Assignment> | <Print>
+def compile_Statement0(pt, code):
+    compile_tree(pt[1], code)
+
+
+compile_Statement1 = compile_Statement0
+compile_Statement2 = compile_Statement0
+
+
+# <FunctionDeclaration> -> FUNCTION <Name> PAREN <FunctionParams> LBRACE
+# 	<FunctionBody> RBRACE
+def compile_FunctionDeclaration0(pt, code):
+    params = []
+    if "FunctionParams0" == pt[4][0]:
+        params = [name_of(name) for name in chain_items(pt[4][1], 3)[0]]
+    function = Code(name_of(pt[2]), params)
+    function.memoized = code.memoized
+    function.skippable = code.skippable
+    compile_tree(pt[6], function)
+    if id(pt) in code.memoized:
+        code.emit(MAKE_MEMO_FUNCTION, len(code.functions))
+    else:
+        code.emit(MAKE_FUNCTION, len(code.functions))
+    code.functions.append(function)
+
+
+# <FunctionBody> -> <Program> <Return> | <Return>
+def compile_FunctionBody0(pt, code):
+    compile_tree(pt[1], code)
+    compile_tree(pt[2], code)
+
+
+def compile_FunctionBody1(pt, code):
+    compile_tree(pt[1], code)
+
+
+# <Return> -> RETURN <ParameterList>
+def compile_Return0(pt, code):
+    params = chain_items(pt[2], 3)[0]
+    flags = code.skippable.get(id(pt), [False] * len(params))
+    for (param, flag) in zip(params, flags):
+        if flag:
+            start = len(code.code)
+            code.emit(SKIP_VALUE)
+            compile_tree(param, code)
+            code.code[start + 1] = (len(code.code) - start) // 2 - 1
+        else:
+            compile_tree(param, code)
+    code.emit(RETURN, len(params))
+
+
+# <Assignment> -> <SingleAssignment> | <MultipleAssignment>
+def compile_Assignment0(pt, code):
+    compile_tree(pt[1], code)
+
+
+compile_Assignment1 = compile_Assignment0
+
+
+# <SingleAssignment> -> VAR <Name> ASSIGN <Expression>
+def compile_SingleAssignment0(pt, code):
+    compile_tree(pt[4], code)
+    code.emit(STORE, code.add_name(name_of(pt[2])))
+
+
+# <MultipleAssignment> -> VAR <NameList> ASSIGN <FunctionCall>
+def compile_MultipleAssignment0(pt, code):
+    names = tuple(name_of(name) for name in chain_items(pt[2], 3)[0])
+    compile_tree(pt[4], code)
+    code.emit(STORE_RESULTS, code.add_const(names))
+
+
+# <Print> -> PRINT <Expression>
+def compile_Print0(pt, code):
+    compile_tree(pt[2], code)
+    code.emit(PRINT)
+
+
+# <Parameter> -> <Expression> | <Name>
+def compile_Parameter0(pt, code):
+    compile_tree(pt[1], code)
+
+
+compile_Parameter1 = compile_Parameter0
+
+
+# <Expression> -> <Term> ADD <Expression> | <Term> SUB <Expression> | <Term>
+# <Term> -> <Factor> MULT <Term> | <Factor> DIV <Term> | <Factor>
+def compile_Expression0(pt, code):
+    """
+    Push every operand of the chain left to right, then apply the operators
+    right to left, which gives Quirk's a - (b - c) grouping.
+    """
+    (operands, labels) = chain_items(pt, 3)
+    for operand in operands:
+        compile_tree(operand, code)
+    for label in reversed(labels):
+        code.emit(chain_opcodes[label])
+
+
+compile_Expression1 = compile_Expression0
+compile_Expression2 = compile_Expression0
+compile_Term0 = compile_Expression0
+compile_Term1 = compile_Expression0
+compile_Term2 = compile_Expression0
+
+
+# <Factor> -> <SubExpression> EXP <Factor> | <SubExpression> | <FunctionCall> |
+#           <Value> EXP <Factor> | <Value>
+def compile_Factor0(pt, code):
+    compile_tree(pt[1], code)
+    compile_tree(pt[3], code)
+    code.emit(BINARY_POW)
+
+
+def compile_Factor1(pt, code):
+    compile_tree(pt[1], code)
+
+
+def compile_Factor2(pt, code):
+    # returns multiple values -- use the first by default.
+    if "FunctionCall1" == pt[1][0]:
+        compile_call(pt[1], code, CALL_ITEM)
+        code.emit(INDEX_RESULT, 0)
+    else:
+        compile_tree(pt[1], code)
+
+
+compile_Factor3 = compile_Factor0
+compile_Factor4 = compile_Factor1
+
+
+# <FunctionCall> ->  <Name> LPAREN <FunctionCallParams> COLON <Number> | <Name>
+#       LPAREN <FunctionCallParams>
+def compile_FunctionCall1(pt, code):
+    compile_call(pt, code, CALL)
+
+
+def compile_FunctionCall0(pt, code):
+    compile_call(pt, code, CALL_ITEM)
+    code.emit(INDEX_RESULT, int(number_of(pt[5])))
+
+
+def compile_call(pt, code, opcode):
+    """Emit a FunctionCall up to its CALL or CALL_ITEM opcode."""
+    code.emit(LOAD_NAME, code.add_name(name_of(pt[1])))
+    args = []
+    if "FunctionCallParams0" == pt[3][0]:
+        args = chain_items(pt[3][1], 3)[0]
+    for arg in args:
+        compile_tree(arg, code)
+    code.emit(opcode, len(args))
+
+
+# <SubExpression> -> LPAREN <Expression> RPAREN
+def compile_SubExpression0(pt, code):
+    compile_tree(pt[2], code)
+
+
+# <Value> -> <Name> | <Number>
+def compile_Value0(pt, code):
+    compile_tree(pt[1], code)
+
+
+compile_Value1 = compile_Value0
+
+
+# <Name> -> IDENT | SUB IDENT | ADD IDENT
+def compile_Name0(pt, code):
+    code.emit(LOAD_NAME, code.add_name(name_of(pt)))
+
+
+def compile_Name1(pt, code):
+    compile_Name0(pt, code)
+    code.emit(NEGATE)
+
+
+compile_Name2 = compile_Name0
+
+
+# <Number> -> NUMBER | SUB NUMBER | ADD NUMBER
+def compile_Number0(pt, code):
+    code.emit(LOAD_CONST, code.add_const(number_of(pt)))
+
+
+compile_Number1 = compile_Number0
+compile_Number2 = compile_Number0
+# end compiler
+
+
+def run_code(code, scope, out=None):
+    """
+    Run a Code object in scope on the stack VM, printing to the file-like
+    object out (sys.stdout if it's None).
+
+    Returns the list of values from the outermost RETURN.
+
+    A function made by MAKE_MEMO_FUNCTION while memo.memo_size is set holds
+    a memo.MemoTable as its third item. CALL pushes the values remembered for
+    the arguments if there are any, and otherwise saves the table and key
+    with the caller's frame so that RETURN can remember the values. For
+    CALL_ITEM the key includes the index, as the values skipped for it
+    aren't in the list.
+
+    item is the index of the value the running function was called for by
+    CALL_ITEM, and -1 if it has to return them all.
+    """
+    if out is None:
+        out = sys.stdout
+    max_frames = sys.getrecursionlimit()
+    frames = []
+    stack = []
+    item = -1
+    instructions = code.code
+    consts = code.consts
+    names = code.names
+    pc = 0
+    while True:
+        opcode = instructions[pc]
+        arg = instructions[pc + 1]
+        pc += 2
+
+        if LOAD_NAME == opcode:
+            name = names[arg]
+            if name in scope:
+                stack.append(scope[name])
+                continue
+            lookup_scope = scope
+            while name not in lookup_scope:
+                if "__parent__" not in lookup_scope:
+                    break
+                lookup_scope = lookup_scope["__parent__"]
+            stack.append(lookup_scope.get(name))
+        elif LOAD_CONST == opcode:
+            stack.append(consts[arg])
+        elif opcode in binary_operators:
+            right = stack.pop()
+            stack[-1] = binary_operators[opcode](stack[-1], right)
+        elif NEGATE == opcode:
+            stack[-1] = -stack[-1]
+        elif CALL == opcode or CALL_ITEM == opcode:
+            args = stack[len(stack) - arg:]
+            del stack[len(stack) - arg:]
+            callee = stack.pop()
+            memo_entry = None
+            call_item = -1
+            if CALL_ITEM == opcode:
+                # the index of the INDEX_RESULT that follows
+                call_item = instructions[pc + 1]
+            if len(callee) > 2:
+                table = callee[2]
+                key = table.key(args)
+                if key is not None:
+                    if call_item >= 0:
+                        # the values skipped for this item aren't computed,
+                        # so they're remembered apart from the whole list
+                        key = (key, call_item)
+                    values = table.get(key)
+                    if values is not None:
+                        stack.append(values)
+                        continue
+                    memo_entry = (table, key)
+            if len(frames) >= max_frames:
+                raise RecursionError("maximum recursion depth exceeded")
+            (param_names, function) = callee[:2]
+            function_scope = {"__parent__": scope}
+            for i in range(arg):
+                function_scope[param_names[i]] = args[i]
+            frames.append((code, pc, scope, stack, memo_entry, item))
+            item = call_item
+            code = function
+            instructions = code.code
+            consts = code.consts
+            names = code.names
+            pc = 0
+            scope = function_scope
+            stack = []
+        elif RETURN == opcode:
+            values = stack[len(stack) - arg:]
+            if not frames:
+                return values
+            (code, pc, scope, stack, memo_entry, item) = frames.pop()
+            if memo_entry is not None:
+                memo_entry[0].put(memo_entry[1], values)
+            instructions = code.code
+            consts = code.consts
+            names = code.names
+            stack.append(values)
+        elif INDEX_RESULT == opcode:
+            stack[-1] = stack[-1][arg]
+        elif SKIP_VALUE == opcode:
+            # the stack only holds the values returned before this one
+            if item >= 0 and len(stack) != item:
+                stack.append(None)
+                pc += 2 * arg
+        elif STORE == opcode:
+            scope[names[arg]] = stack.pop()
+        elif PRINT == opcode:
+            out.write(str(stack.pop()) + "\n")
+        elif STORE_RESULTS == opcode:
+            variable_names = consts[arg]
+            values = stack.pop()
+            for i in range(len(values)):
+                scope[variable_names[i]] = values[i]
+        elif MAKE_FUNCTION == opcode:
+            function = code.functions[arg]
+            scope[function.name] = [function.params, function]
+        elif MAKE_MEMO_FUNCTION == opcode:
+            function = code.functions[arg]
+            function_value = [function.params, function]
+            if memo.memo_size > 0:
+                function_value.append(
+                    memo.MemoTable(function.name, len(function.params)))
+            scope[function.name] = function_value
+        else:
+            raise Exception("Bad opcode %d" % opcode)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Quirk bytecode VM")
+    arg_parser.add_argument("files", nargs="*")
+    arg_parser.add_argument("-o", "--output",
+                            help="write the compiled code here instead of "
+                                 "running it")
+    arg_parser.add_argument("--dis", action="store_true",
+                            help="print a disassembly instead of running")
+    args = arg_parser.parse_args()
+
+    given = b"".join(fileinput.input(files=args.files, mode="rb"))
+    if given[:len(MAGIC) - 1] == MAGIC[:-1]:
+        program = load_code(given)
+    elif treeformat.is_binary_tree(given):
+        program = compile_program(treeformat.read_tree(given))
+    else:
+        program = compile_program(ast.literal_eval(given.decode("utf-8")))
+
+    if args.output:
+        with open(args.output, "wb") as output_file:
+            output_file.write(dump_code(program))
+    elif args.dis:
+        print(disassemble(program))
+    else:
+        run_code(program, {})
@@ -0,0 +1,692 @@
+"""
+Compile Quirk parse trees to Python closures.
+
+The tree is walked once. Every node becomes a closure that takes the current
+frame and returns the node's value, with its children's closures, variable
+slots and number constants already bound in, so running the program never
+dispatches on node names or re-reads the tree.
+
+Variables live in Frame objects: a fixed-size list of values with one slot
+per name the function (or the top level) binds. A resolver pass decides once,
+at compile time, where each <Name> reads from:
+
+    local   - a name bound in the function itself: its slot in the current
+              frame
+    global  - a name that no function binds: its slot in the top-level frame
+    dynamic - a name bound by some other function
+
+Quirk looks up names that aren't bound in the current scope in the scope of
+the caller (interpreter.py makes the caller's scope the __parent__), so only
+the last kind still has to search the frames of the callers by name. A local
+slot that hasn't been assigned yet falls back to that search too, so
+programs behave exactly as they do in interpreter.py.
+
+    program = compile_program(tree)
+    program({}, out)
+
+Everything a run needs is in its frames and in the closures, so a compiled
+program can be run on several threads at once.
+"""
+import sys
+import operator
+
+import memo
+import lazy
+
+
+class Frame(object):
+    """
+    The variables of one function call (or of the top level).
+
+    values - one value per slot, UNBOUND until assigned
+    slots - maps each name bound by the function to its slot
+    parent - the caller's frame, None for the top level
+    root - the top-level frame
+    out - only set in the top-level frame: the file-like object print
+        statements write to
+    """
+
+    __slots__ = ("values", "slots", "parent", "root", "out")
+
+    def __init__(self, slots, parent):
+        self.values = [UNBOUND] * len(slots)
+        self.slots = slots
+        self.parent = parent
+        if parent is None:
+            self.root = self
+        else:
+            self.root = parent.root
+
+
+class Resolver(object):
+    """
+    Compile-time view of one function body (or of the top level).
+
+    slots - maps each name the body binds to its slot in the body's frames
+    is_program - True for the top level
+    shadowed - the names bound by any function in the program
+    program_slots - the slots of the top-level frame, which grow as names
+        are met while compiling
+    memoized - the id()s of the FunctionDeclaration0 nodes to memoize
+    skippable - the flags of the values each Return0 node can skip, by id()
+        (see lazy.py)
+    """
+
+    __slots__ = ("slots", "is_program", "shadowed", "program_slots",
+                 "memoized", "skippable")
+
+    def __init__(self, names, parent):
+        self.slots = {}
+        for name in names:
+            if name not in self.slots:
+                self.slots[name] = len(self.slots)
+        self.is_program = parent is None
+        if parent is None:
+            self.shadowed = set()
+            self.program_slots = self.slots
+            self.memoized = frozenset()
+            self.skippable = {}
+        else:
+            self.shadowed = parent.shadowed
+            self.program_slots = parent.program_slots
+            self.memoized = parent.memoized
+            self.skippable = parent.skippable
+
+    def slot(self, name):
+        """Return the slot of a name the body binds."""
+        if self.is_program:
+            return self.program_slots.setdefault(name, len(self.program_slots))
+        return self.slots[name]
+
+
+# Marks a slot that hasn't been assigned yet.
+UNBOUND = object()
+
+
+def compile_program(tree):
+    """
+    Return a closure that runs the program tree.
+
+    The closure takes a scope dict: names in it are bound before the program
+    runs, and the top-level names the program binds are copied back into it
+    afterwards. Its second argument is the file-like object to print to;
+    None (the default) is sys.stdout.
+    """
+    resolver = Resolver([], None)
+    resolver.shadowed = function_bindings(tree)
+    if memo.memo_size > 0:
+        resolver.memoized = frozenset(memo.pure_functions(tree))
+    resolver.skippable = lazy.skippable_values(tree)
+    statements = compile_tree(tree, resolver)
+    slots = resolver.slots
+
+    def program(scope, out=None):
+        # names in scope that the top level never mentions still get a
+        # slot, after the compiled ones, for functions to look up
+        run_slots = slots
+        if not scope.keys() <= slots.keys():
+            run_slots = dict(slots)
+            for name in scope:
+                run_slots.setdefault(name, len(run_slots))
+        frame = Frame(run_slots, None)
+        frame.out = sys.stdout if out is None else out
+        for (name, value) in scope.items():
+            frame.values[run_slots[name]] = value
+        statements(frame)
+        for (name, slot) in run_slots.items():
+            if frame.values[slot] is not UNBOUND:
+                scope[name] = frame.values[slot]
+    return program
+
+
+def compile_tree(pt, resolver):
+    """Compile the subtree pt with the function named after its label."""
+    return globals()[pt[0]](pt, resolver)
+
+
+# start resolver
+def bound_names(program):
+    """
+    Return the names a Program subtree binds directly (not in nested
+    function bodies): variables it assigns and functions it declares.
+    """
+    names = []
+    for statement in chain_items(program, 2):
+        node = statement[1]
+        if "FunctionDeclaration0" == node[0]:
+            names.append(name_of(node[2]))
+        elif "Print0" == node[0]:
+            continue
+        elif "SingleAssignment0" == node[1][0]:
+            names.append(name_of(node[1][2]))
+        else:
+            names.extend(name_list(node[1][2]))
+    return names
+
+
+def function_locals(pt):
+    """Return the parameter and bound names of a FunctionDeclaration0."""
+    names = []
+    if "FunctionParams0" == pt[4][0]:
+        names = name_list(pt[4][1])
+    body = pt[6]
+    if "FunctionBody0" == body[0]:
+        names = names + bound_names(body[1])
+    return names
+
+
+def function_bindings(program):
+    """
+    Return the set of names bound by any function declared in a Program
+    subtree, however deeply nested.
+
+    Declarations are statements, so only the statement chains are walked,
+    with an explicit stack.
+    """
+    names = set()
+    stack = [program]
+    while stack:
+        for statement in chain_items(stack.pop(), 2):
+            node = statement[1]
+            if "FunctionDeclaration0" == node[0]:
+                names.update(function_locals(node))
+                if "FunctionBody0" == node[6][0]:
+                    stack.append(node[6][1])
+    return names
+
+
+def compile_load(name, resolver):
+    """Return a closure reading name, resolved as described at the top."""
+    if resolver.is_program:
+        slot = resolver.slot(name)
+        return lambda frame: none_if_unbound(frame.values[slot])
+
+    if name in resolver.slots:
+        slot = resolver.slots[name]
+
+        def load_local(frame):
+            value = frame.values[slot]
+            if value is UNBOUND:
+                return dynamic_lookup(name, frame.parent)
+            return value
+        return load_local
+
+    if name not in resolver.shadowed:
+        slot = resolver.program_slots.setdefault(
+            name, len(resolver.program_slots))
+        return lambda frame: none_if_unbound(frame.root.values[slot])
+
+    return lambda frame: dynamic_lookup(name, frame.parent)
+
+
+def none_if_unbound(value):
+    """Return value, or None (what an unbound name evaluates to) if UNBOUND."""
+    if value is UNBOUND:
+        return None
+    return value
+
+
+def dynamic_lookup(name, frame):
+    """Return the value of name in frame or its callers' frames, else None."""
+    while frame is not None:
+        slot = frame.slots.get(name)
+        if slot is not None and frame.values[slot] is not UNBOUND:
+            return frame.values[slot]
+        frame = frame.parent
+    return None
+# end resolver
+
+
+# start utilities
+def token_lexeme(tok):
+    """
+    Return the lexeme of an IDENT or NUMBER token, e.g. 'x' for 'IDENT:x'.
+    """
+    return tok[tok.find(":") + 1:]
+
+
+def name_of(pt):
+    """Return the identifier of a Name subtree (the IDENT is always last)."""
+    return token_lexeme(pt[-1])
+
+
+def chain_items(pt, link):
+    """
+    Return the operand subtrees of a right-recursive chain, in order. link is
+    the index of the rest of the chain.
+    """
+    items = []
+    while len(pt) > 2:
+        items.append(pt[1])
+        pt = pt[link]
+    items.append(pt[1])
+    return items
+
+
+def name_list(pt):
+    """Return the identifiers of a NameList chain, in order."""
+    return [name_of(name) for name in chain_items(pt, 3)]
+
+
+def constant(value):
+    """Return a closure that always returns value."""
+    return lambda frame: value
+
+
+def compile_chain(pt, operators, resolver):
+    """
+    Compile a right-recursive Expression or Term chain.
+
+    The operands are compiled in a loop and, like interpreter.fold_chain(),
+    evaluated left to right and combined from the right. A chain with a
+    single operand compiles to that operand's closure.
+    """
+    operands = []
+    ops = []
+    while len(pt) > 2:
+        operands.append(compile_tree(pt[1], resolver))
+        ops.append(operators[pt[0]])
+        pt = pt[3]
+    operands.append(compile_tree(pt[1], resolver))
+
+    if 1 == len(operands):
+        return operands[0]
+    if 2 == len(operands):
+        (left, right) = operands
+        op = ops[0]
+        return lambda frame: op(left(frame), right(frame))
+
+    last = len(ops) - 1
+
+    def chain(frame):
+        values = [operand(frame) for operand in operands]
+        result = values[-1]
+        for i in range(last, -1, -1):
+            result = ops[i](values[i], result)
+        return result
+    return chain
+
+
+def call_function(function, args, frame):
+    """
+    Call a compiled function value with the argument closures.
+
+    Arguments are evaluated in the caller's frame and bound to the
+    parameters' slots in a new fixed-size frame. Returns the list of values
+    from the function's <Return>. As in interpreter.py and the VM, the
+    arguments are evaluated before anything looks inside function, so a
+    call of something that isn't a function raises its TypeError after
+    them.
+    """
+    function_frame = bind_arguments(function, args, frame)
+    return function[1](function_frame)
+
+
+def call_item(function, args, frame, index):
+    """
+    Call a compiled function value like call_function(), but return only
+    the value with an index, skipping the values lazy.py allows.
+    """
+    function_frame = bind_arguments(function, args, frame)
+    select = function[3]
+    if select is None or index < 0:
+        return function[1](function_frame)[index]
+    return select(function_frame, index)
+
+
+def bind_arguments(function, args, frame):
+    """
+    Return a new frame for a call of a compiled function value, with the
+    values of the argument closures in the parameters' slots.
+    """
+    values = [arg(frame) for arg in args]
+    (param_slots, body, slots, select) = function
+    if len(values) > len(param_slots):
+        raise IndexError("list index out of range")
+    function_frame = Frame(slots, frame)
+    frame_values = function_frame.values
+    for (slot, value) in zip(param_slots, values):
+        frame_values[slot] = value
+    return function_frame
+# end utilities
+
+
+expression_operators = {
+    "Expression0": operator.add,
+    "Expression1": operator.sub,
+}
+
+term_operators = {
+    "Term0": operator.mul,
+    "Term1": operator.truediv,
+}
+
+
+# <Program> -> <Statement> <Program> | <Statement>
+def Program0(pt, resolver):
+    statements = [compile_tree(statement, resolver)
+                  for statement in chain_items(pt, 2)]
+
+    def program(frame):
+        for statement in statements:
+            statement(frame)
+    return program
+
+
+Program1 = Program0
+
+
+# <Statement> -> <FunctionDeclaration> | <Assignment> | <Print>
+def Statement0(pt, resolver):
+    return compile_tree(pt[1], resolver)
+
+
+Statement1 = Statement0
+Statement2 = Statement0
+
+
+# <FunctionDeclaration> -> FUNCTION <Name> PAREN <FunctionParams> LBRACE
+# 	<FunctionBody> RBRACE
+def FunctionDeclaration0(pt, resolver):
+    """
+    Bind the function's name to [param_slots, body, slots, select], where
+    body is the compiled <FunctionBody>, slots is the layout of its frames
+    and select, if the function has values that can be skipped, is the
+    compiled body for call_item() (see compile_select()).
+
+    A memoized function gets a new memo.MemoTable each time it's declared,
+    and a body (and select) that looks the parameters' values up in it
+    before running the compiled one.
+    """
+    slot = resolver.slot(name_of(pt[2]))
+    body_resolver = Resolver(function_locals(pt), resolver)
+    param_slots = compile_tree(pt[4], body_resolver)
+    flags = resolver.skippable.get(id(pt[6][-1]))
+    if flags is None:
+        (body, select) = (compile_tree(pt[6], body_resolver), None)
+    else:
+        (body, select) = compile_select(pt[6], flags, body_resolver)
+    function = [param_slots, body, body_resolver.slots, select]
+
+    if id(pt) in resolver.memoized:
+        name = name_of(pt[2])
+        (param_slots, body, slots, select) = function
+
+        def declare_memoized(frame):
+            table = memo.MemoTable(name, len(param_slots))
+
+            def memoized_body(function_frame):
+                values = function_frame.values
+                key = table.key([values[param_slot]
+                                 for param_slot in param_slots])
+                if key is None:
+                    return body(function_frame)
+                result = table.get(key)
+                if result is None:
+                    result = body(function_frame)
+                    table.put(key, result)
+                return result
+
+            def memoized_select(function_frame, index):
+                # remembered apart from the whole list, as in
+                # interpreter.call_memoized_item()
+                values = function_frame.values
+                key = table.key([values[param_slot]
+                                 for param_slot in param_slots])
+                if key is None:
+                    return select(function_frame, index)
+                key = (key, index)
+                result = table.get(key)
+                if result is None:
+                    result = [select(function_frame, index)]
+                    table.put(key, result)
+                return result[0]
+            frame.values[slot] = [param_slots, memoized_body, slots,
+                                  None if select is None else memoized_select]
+        return declare_memoized
+
+    def declare(frame):
+        frame.values[slot] = function
+    return declare
+
+
+def compile_select(pt, flags, resolver):
+    """
+    Compile a <FunctionBody> whose <Return> has values that can be skipped,
+    as flagged by lazy.skippable_values(), and return (body, select).
+
+    body(frame) runs like the compiled <FunctionBody>. select(frame, index)
+    runs the statements, then evaluates, in order, only the value with that
+    index and the values that can't be skipped, and returns the one with the
+    index.
+    """
+    program = None
+    if "FunctionBody0" == pt[0]:
+        program = compile_tree(pt[1], resolver)
+    values = [compile_tree(param, resolver)
+              for param in chain_items(pt[-1][2], 3)]
+    kept = [value for (value, flag) in zip(values, flags) if not flag]
+
+    # for each index, the values to evaluate and the position of its value
+    # among them
+    plans = []
+    for index in range(len(values)):
+        needed = [value for (position, value) in enumerate(values)
+                  if position == index or not flags[position]]
+        plans.append((needed, flags[:index].count(False)))
+
+    def body(frame):
+        if program is not None:
+            program(frame)
+        return [value(frame) for value in values]
+
+    def select(frame, index):
+        if program is not None:
+            program(frame)
+        if index >= len(plans):
+            for value in kept:
+                value(frame)
+            raise IndexError("list index out of range")
+        (needed, position) = plans[index]
+        return [value(frame) for value in needed][position]
+    return (body, select)
+
+
+# <FunctionParams> -> <NameList> RPAREN | RPAREN
+# compiled to the list of the parameters' slots
+def FunctionParams0(pt, resolver):
+    return [resolver.slots[name] for name in name_list(pt[1])]
+
+
+def FunctionParams1(pt, resolver):
+    return []
+
+
+# <FunctionBody> -> <Program> <Return> | <Return>
+def FunctionBody0(pt, resolver):
+    program = compile_tree(pt[1], resolver)
+    ret = compile_tree(pt[2], resolver)
+
+    def body(frame):
+        program(frame)
+        return ret(frame)
+    return body
+
+
+def FunctionBody1(pt, resolver):
+    return compile_tree(pt[1], resolver)
+
+
+# <Return> -> RETURN <ParameterList>
+def Return0(pt, resolver):
+    return compile_tree(pt[2], resolver)
+
+
+# <Assignment> -> <SingleAssignment> | <MultipleAssignment>
+def Assignment0(pt, resolver):
+    return compile_tree(pt[1], resolver)
+
+
+Assignment1 = Assignment0
+
+
+# <SingleAssignment> -> VAR <Name> ASSIGN <Expression>
+def SingleAssignment0(pt, resolver):
+    slot = resolver.slot(name_of(pt[2]))
+    expression = compile_tree(pt[4], resolver)
+
+    def assign(frame):
+        frame.values[slot] = expression(frame)
+    return assign
+
+
+# <MultipleAssignment> -> VAR <NameList> ASSIGN <FunctionCall>
+def MultipleAssignment0(pt, resolver):
+    slots = [resolver.slot(name) for name in name_list(pt[2])]
+    function_call = compile_tree(pt[4], resolver)
+
+    def assign(frame):
+        values = function_call(frame)
+        for i in range(len(values)):
+            frame.values[slots[i]] = values[i]
+    return assign
+
+
+# <Print> -> PRINT <Expression>
+def Print0(pt, resolver):
+    expression = compile_tree(pt[2], resolver)
+
+    def print_statement(frame):
+        frame.root.out.write(str(expression(frame)) + "\n")
+    return print_statement
+
+
+# <ParameterList> -> <Parameter> COMMA <ParameterList> | <Parameter>
+# compiled to a closure returning the list of values
+def ParameterList0(pt, resolver):
+    params = [compile_tree(param, resolver) for param in chain_items(pt, 3)]
+    return lambda frame: [param(frame) for param in params]
+
+
+ParameterList1 = ParameterList0
+
+
+# <Parameter> -> <Expression> | <Name>
+def Parameter0(pt, resolver):
+    return compile_tree(pt[1], resolver)
+
+
+Parameter1 = Parameter0
+
+
+# <Expression> -> <Term> ADD <Expression> | <Term> SUB <Expression> | <Term>
+def Expression0(pt, resolver):
+    return compile_chain(pt, expression_operators, resolver)
+
+
+Expression1 = Expression0
+Expression2 = Expression0
+
+
+# <Term> -> <Factor> MULT <Term> | <Factor> DIV <Term> | <Factor>
+def Term0(pt, resolver):
+    return compile_chain(pt, term_operators, resolver)
+
+
+Term1 = Term0
+Term2 = Term0
+
+
+# <Factor> -> <SubExpression> EXP <Factor> | <SubExpression> | <FunctionCall> |
+#           <Value> EXP <Factor> | <Value>
+def Factor0(pt, resolver):
+    base = compile_tree(pt[1], resolver)
+    exponent = compile_tree(pt[3], resolver)
+    return lambda frame: base(frame) ** exponent(frame)
+
+
+def Factor1(pt, resolver):
+    return compile_tree(pt[1], resolver)
+
+
+def Factor2(pt, resolver):
+    # returns multiple values -- use the first by default.
+    if "FunctionCall1" == pt[1][0]:
+        return compile_call_item(pt[1], 0, resolver)
+    return compile_tree(pt[1], resolver)
+
+
+Factor3 = Factor0
+Factor4 = Factor1
+
+
+# <FunctionCall> ->  <Name> LPAREN <FunctionCallParams> COLON <Number> | <Name>
+#       LPAREN <FunctionCallParams>
+def FunctionCall0(pt, resolver):
+    return compile_call_item(pt, int(number_of(pt[5])), resolver)
+
+
+def FunctionCall1(pt, resolver):
+    function = compile_load(name_of(pt[1]), resolver)
+    args = compile_tree(pt[3], resolver)
+    return lambda frame: call_function(function(frame), args, frame)
+
+
+def compile_call_item(pt, index, resolver):
+    """Compile a FunctionCall whose value is the returned value index."""
+    function = compile_load(name_of(pt[1]), resolver)
+    args = compile_tree(pt[3], resolver)
+    return lambda frame: call_item(function(frame), args, frame, index)
+
+
+# <FunctionCallParams> ->  <ParameterList> RPAREN | RPAREN
+# compiled to the list of argument closures
+def FunctionCallParams0(pt, resolver):
+    return [compile_tree(param, resolver) for param in chain_items(pt[1], 3)]
+
+
+def FunctionCallParams1(pt, resolver):
+    return []
+
+
+# <SubExpression> -> LPAREN <Expression> RPAREN
+def SubExpression0(pt, resolver):
+    return compile_tree(pt[2], resolver)
+
+
+# <Value> -> <Name> | <Number>
+def Value0(pt, resolver):
+    return compile_tree(pt[1], resolver)
+
+
+Value1 = Value0
+
+
+# <Name> -> IDENT | SUB IDENT | ADD IDENT
+def Name0(pt, resolver):
+    return compile_load(name_of(pt), resolver)
+
+
+def Name1(pt, resolver):
+    load = compile_load(name_of(pt), resolver)
+    return lambda frame: -load(frame)
+
+
+Name2 = Name0
+
+
+# <Number> -> NUMBER | SUB NUMBER | ADD NUMBER
+def number_of(pt):
+    """Return the float value of a Number subtree."""
+    value = float(token_lexeme(pt[-1]))
+    if "Number1" == pt[0]:
+        return -value
+    return value
+
+
+def Number0(pt, resolver):
+    return constant(number_of(pt))
+
+
+Number1 = Number0
+Number2 = Number0
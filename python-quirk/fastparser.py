@@ -0,0 +1,743 @@
+import gc
+import sys
+import array
+import threading
+import argparse
+import fileinput
+
+import lexer
+import treeformat
+from lexer import (ADD, ASSIGN, COLON, COMMA, DIV, EOF, EXP, FUNCTION, IDENT,
+                   LBRACE, LPAREN, MULT, NUMBER, PRINT, RBRACE, RETURN, RPAREN,
+                   SUB, VAR)
+from parser import is_ident, is_number, pp
+
+# Tokens that can begin a <Statement>, mapped to the grammar function that
+# parses it and the tree label of the matching <Statement> alternative.
+statement_starts = {
+    FUNCTION: ("FunctionDeclaration", "Statement0"),
+    VAR: ("Assignment", "Statement1"),
+    PRINT: ("Print", "Statement2"),
+}
+
+# Separator tokens of the right-recursive list and operator rules, mapped to
+# the tree label of the alternative they select. See finish_chain().
+name_list_labels = {COMMA: "NameList0"}
+parameter_list_labels = {COMMA: "ParameterList0"}
+expression_labels = {ADD: "Expression0", SUB: "Expression1"}
+term_labels = {MULT: "Term0", DIV: "Term1"}
+
+# The furthest failure of the last parse() on each thread: failure.index,
+# the index of the furthest token the parse couldn't get past, and
+# failure.expected, the set of the kinds of token that would have been
+# accepted there. Grammar functions report it with expect() on their failure
+# paths only, so tracking it costs nothing while the input parses. Since it's
+# kept per thread, and the grammar functions get the tokens as an argument,
+# threads can parse at the same time.
+failure = threading.local()
+
+
+def parse(tokens):
+    """
+    Parse a complete token list (ending in EOF) starting from <Program>.
+
+    Produces exactly the same trees as parser.parse(), but every grammar
+    function parses the prefix its alternatives share once and then picks the
+    alternative with one token of lookahead, so nothing is ever re-parsed.
+    Returns [result, ret_index, subtree] like the functions in parser.py.
+
+    The cyclic garbage collector is paused while parsing: the tree is made of
+    millions of small acyclic lists, and letting the collector rescan them as
+    they pile up makes parse time grow faster than the input.
+    """
+    failure.index = 0
+    failure.expected = set()
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return Program(tokens, 0)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+def parse_statements(tokens):
+    """
+    Parse a token list (ending in EOF) as a sequence of <Statement>s.
+
+    Returns (statements, ends): the Statement subtrees parsed from the start
+    of tokens, stopping at the first token that doesn't begin one, and the
+    index just past the last token of each. This is the loop of Program()
+    without the Program0 / Program1 chain, for incremental.py, which keeps
+    the top-level statements apart. Failures are recorded and the garbage
+    collector is paused as in parse().
+    """
+    failure.index = 0
+    failure.expected = set()
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        statements = []
+        ends = []
+        tok_index = 0
+        while True:
+            (result, tok_index, ret_subtree) = Statement(tokens, tok_index)
+            if not result:
+                return (statements, ends)
+            statements.append(ret_subtree)
+            ends.append(tok_index)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+def expect(tok_index, kinds):
+    """
+    Record that the parse needed a token of one of kinds at tok_index. Only
+    the furthest such position is kept.
+    """
+    if tok_index > failure.index:
+        failure.index = tok_index
+        failure.expected = set()
+    if tok_index == failure.index:
+        failure.expected.update(kinds)
+
+
+def failure_message(tokens):
+    """
+    Describe the furthest failure of the last parse() of tokens, e.g.
+    "expected ')' or ',' but found 'x'".
+    """
+    expected = []
+    for kind in sorted(failure.expected):
+        if IDENT == kind:
+            expected.append("a name")
+        elif NUMBER == kind:
+            expected.append("a number")
+        else:
+            expected.append(repr(lexer.fixedLexemes[kind.name]))
+    if len(expected) > 1:
+        expected[-2:] = [expected[-2] + " or " + expected[-1]]
+
+    tok = tokens[failure.index]
+    if EOF == tok.kind:
+        found = "the end of the program"
+    else:
+        found = repr(tok.lexeme)
+    return "expected %s but found %s" % (", ".join(expected), found)
+
+
+def node_spans(tree):
+    """
+    Return the token span of every node of a parse tree.
+
+    The result is three parallel sequences, in pre-order: the nodes (the
+    tree's lists), and array('l')s with the index of each node's first token
+    and the index just past its last token. Every token the parser consumed
+    is a leaf of the tree, in order, so the spans come from counting leaves
+    and the parser doesn't keep any positions itself. The token offsets that
+    lexer.lex_stream() records, passed to lexer.line_column(), give a span's
+    line and column.
+    """
+    nodes = []
+    starts = array.array('l')
+    ends = array.array('l')
+    leaves = 0
+    stack = [tree]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, list):
+            # the node's index is pushed to close its span after its children
+            stack.append(len(nodes))
+            nodes.append(item)
+            starts.append(leaves)
+            ends.append(leaves)
+            stack.extend(reversed(item[1:]))
+        elif isinstance(item, int):
+            ends[item] = leaves
+        else:
+            leaves += 1
+    return (nodes, starts, ends)
+
+
+def Program(tokens, tok_index):
+    """
+    Return (full program) tree if possible.
+
+    <Program> ->
+        <Statement> <Program>
+        | <Statement>
+
+    The statements are collected in a loop and the right-nested Program0 /
+    Program1 chain is built afterwards, so long programs don't recurse.
+    """
+    statements = []
+    ret_index = tok_index
+    while True:
+        (result, next_index, ret_subtree) = Statement(tokens, ret_index)
+        if not result:
+            break
+        statements.append(ret_subtree)
+        ret_index = next_index
+
+    if not statements:
+        return [False, tok_index, []]
+
+    subtree = ["Program1", statements.pop()]
+    while statements:
+        subtree = ["Program0", statements.pop(), subtree]
+    return [True, ret_index, subtree]
+
+
+def Statement(tokens, tok_index):
+    """
+    Return statement subtree, if possible.
+
+    <Statement> ->
+        <FunctionDeclaration>
+        | <Assignment>
+        | <Print>
+    """
+    if tokens[tok_index].kind in statement_starts:
+        (rule, label) = statement_starts[tokens[tok_index].kind]
+        (result, ret_index, ret_subtree) = globals()[rule](tokens, tok_index)
+        if result:
+            return [True, ret_index, [label, ret_subtree]]
+    else:
+        expect(tok_index, statement_starts)
+    return [False, tok_index, []]
+
+
+def FunctionDeclaration(tokens, tok_index):
+    """
+    Return FunctionDeclaration subtree, if possible.
+
+    <FunctionDeclaration> ->
+        FUNCTION <Name> LPAREN <FunctionParams> LBRACE <FunctionBody> RBRACE
+    """
+    if FUNCTION != tokens[tok_index].kind:
+        return [False, tok_index, []]
+    subtree = ["FunctionDeclaration0", tokens[tok_index].text]
+    (result, ret_index, ret_subtree) = expect_name(tokens, tok_index + 1)
+    if not result:
+        return [False, tok_index, []]
+    subtree.append(ret_subtree)
+
+    if LPAREN != tokens[ret_index].kind:
+        expect(ret_index, (LPAREN,))
+        return [False, tok_index, []]
+    subtree.append(tokens[ret_index].text)
+    (result, ret_index, ret_subtree) = FunctionParams(tokens, ret_index + 1)
+    if not result:
+        return [False, tok_index, []]
+    subtree.append(ret_subtree)
+
+    if LBRACE != tokens[ret_index].kind:
+        expect(ret_index, (LBRACE,))
+        return [False, tok_index, []]
+    subtree.append(tokens[ret_index].text)
+    (result, ret_index, ret_subtree) = FunctionBody(tokens, ret_index + 1)
+    if not result:
+        return [False, tok_index, []]
+    subtree.append(ret_subtree)
+
+    if RBRACE != tokens[ret_index].kind:
+        expect(ret_index, (RBRACE,))
+        return [False, tok_index, []]
+    subtree.append(tokens[ret_index].text)
+    return [True, ret_index + 1, subtree]
+
+
+def FunctionParams(tokens, tok_index):
+    """
+    Return FunctionParams subtree, if possible.
+
+    <FunctionParams> ->
+        <NameList> RPAREN
+        | RPAREN
+    """
+    # RPAREN can't start a <NameList>, so check for it first.
+    if RPAREN == tokens[tok_index].kind:
+        return [True, tok_index + 1,
+                ["FunctionParams1", tokens[tok_index].text]]
+
+    (result, ret_index, ret_subtree) = NameList(tokens, tok_index)
+    if not result:
+        expect(tok_index, (RPAREN,))
+    elif RPAREN == tokens[ret_index].kind:
+        subtree = ["FunctionParams0", ret_subtree, tokens[ret_index].text]
+        return [True, ret_index + 1, subtree]
+    else:
+        expect(ret_index, (COMMA, RPAREN))
+    return [False, tok_index, []]
+
+
+def FunctionBody(tokens, tok_index):
+    """
+    Return FunctionBody subtree, if possible.
+
+    <FunctionBody> ->
+        <Program> <Return>
+        | <Return>
+    """
+    # RETURN can't start a <Statement>, so it selects the second alternative.
+    if RETURN == tokens[tok_index].kind:
+        (result, ret_index, ret_subtree) = Return(tokens, tok_index)
+        if result:
+            return [True, ret_index, ["FunctionBody1", ret_subtree]]
+        return [False, tok_index, []]
+
+    (result, ret_index, ret_subtree) = Program(tokens, tok_index)
+    if result:
+        subtree = ["FunctionBody0", ret_subtree]
+        (result, ret_index, ret_subtree) = Return(tokens, ret_index)
+        if result:
+            subtree.append(ret_subtree)
+            return [True, ret_index, subtree]
+    return [False, tok_index, []]
+
+
+def Return(tokens, tok_index):
+    """
+    Return Return subtree, if possible.
+
+    <Return> ->
+        RETURN <ParameterList>
+    """
+    if RETURN == tokens[tok_index].kind:
+        (result, ret_index, ret_subtree) = ParameterList(tokens,
+                                                         tok_index + 1)
+        if result:
+            return [True, ret_index,
+                    ["Return0", tokens[tok_index].text, ret_subtree]]
+    else:
+        expect(tok_index, (RETURN,))
+    return [False, tok_index, []]
+
+
+def Assignment(tokens, tok_index):
+    """
+    Return Assignment subtree, if possible.
+
+    <Assignment> ->
+        <SingleAssignment>
+        | <MultipleAssignment>
+    <SingleAssignment> ->
+        VAR <Name> ASSIGN <Expression>
+    <MultipleAssignment> ->
+        VAR <NameList> ASSIGN <FunctionCall>
+
+    Both alternatives start with VAR <Name>. That prefix is parsed once and the
+    rest of the <NameList> is parsed from it; a single name selects
+    <SingleAssignment> (an <Expression> covers every <FunctionCall>, so
+    <MultipleAssignment> can never succeed where it fails).
+    """
+    if VAR != tokens[tok_index].kind:
+        return [False, tok_index, []]
+    (result, ret_index, name_subtree) = expect_name(tokens, tok_index + 1)
+    if not result:
+        return [False, tok_index, []]
+
+    (result, ret_index, names_subtree) = finish_name_list(tokens,
+                                                          name_subtree,
+                                                          ret_index)
+    if ASSIGN != tokens[ret_index].kind:
+        expect(ret_index, (COMMA, ASSIGN))
+        return [False, tok_index, []]
+
+    if "NameList1" == names_subtree[0]:
+        (result, ret_index, ret_subtree) = Expression(tokens, ret_index + 1)
+        if result:
+            subtree = ["SingleAssignment0", tokens[tok_index].text,
+                       name_subtree, "ASSIGN", ret_subtree]
+            return [True, ret_index, ["Assignment0", subtree]]
+        return [False, tok_index, []]
+
+    (result, ret_index, ret_subtree) = FunctionCall(tokens, ret_index + 1)
+    if result:
+        subtree = ["MultipleAssignment0", tokens[tok_index].text,
+                   names_subtree, "ASSIGN", ret_subtree]
+        return [True, ret_index, ["Assignment1", subtree]]
+    return [False, tok_index, []]
+
+
+def Print(tokens, tok_index):
+    """
+    Return Print subtree, if possible.
+
+    <Print> ->
+        PRINT <Expression>
+    """
+    if PRINT == tokens[tok_index].kind:
+        (result, ret_index, ret_subtree) = Expression(tokens, tok_index + 1)
+        if result:
+            return [True, ret_index,
+                    ["Print0", tokens[tok_index].text, ret_subtree]]
+    return [False, tok_index, []]
+
+
+def NameList(tokens, tok_index):
+    """
+    Return NameList subtree, if possible.
+
+    <NameList> ->
+        <Name> COMMA <NameList>
+        | <Name>
+    """
+    (result, ret_index, ret_subtree) = expect_name(tokens, tok_index)
+    if result:
+        return finish_name_list(tokens, ret_subtree, ret_index)
+    return [False, tok_index, []]
+
+
+def finish_name_list(tokens, name_subtree, tok_index):
+    """
+    Return NameList subtree whose leading <Name> has already been parsed.
+
+    name_subtree - the parsed leading <Name>
+    tok_index - the position just after that <Name>
+    """
+    return finish_chain(tokens, name_subtree, tok_index, expect_name,
+                        name_list_labels, "NameList1")
+
+
+def expect_name(tokens, tok_index):
+    """Parse a <Name> like Name(), recording a failure if there isn't one."""
+    (result, ret_index, ret_subtree) = Name(tokens, tok_index)
+    if not result:
+        expect(tok_index, (IDENT,))
+    return [result, ret_index, ret_subtree]
+
+
+def ParameterList(tokens, tok_index):
+    """
+    Return ParameterList subtree, if possible.
+
+    <ParameterList> ->
+        <Parameter> COMMA <ParameterList>
+        | <Parameter>
+    """
+    (result, ret_index, ret_subtree) = Parameter(tokens, tok_index)
+    if result:
+        return finish_chain(tokens, ret_subtree, ret_index, Parameter,
+                            parameter_list_labels, "ParameterList1")
+    return [False, tok_index, []]
+
+
+def Parameter(tokens, tok_index):
+    """
+    Return Parameter subtree, if possible.
+
+    <Parameter> ->
+        <Expression>
+        | <Name>
+
+    Every <Name> is also an <Expression>, so only the first alternative is
+    ever produced (the same is true of the backtracking parser).
+    """
+    (result, ret_index, ret_subtree) = Expression(tokens, tok_index)
+    if result:
+        return [True, ret_index, ["Parameter0", ret_subtree]]
+    return [False, tok_index, []]
+
+
+def Expression(tokens, tok_index):
+    """
+    Return Expression subtree, if possible.
+
+    <Expression> ->
+        <Term> ADD <Expression>
+        | <Term> SUB <Expression>
+        | <Term>
+    """
+    (result, ret_index, ret_subtree) = Term(tokens, tok_index)
+    if result:
+        return finish_chain(tokens, ret_subtree, ret_index, Term,
+                            expression_labels, "Expression2")
+    return [False, tok_index, []]
+
+
+def Term(tokens, tok_index):
+    """
+    Return Term subtree, if possible.
+
+    <Term> ->
+        <Factor> MULT <Term>
+        | <Factor> DIV <Term>
+        | <Factor>
+    """
+    (result, ret_index, ret_subtree) = Factor(tokens, tok_index)
+    if result:
+        return finish_chain(tokens, ret_subtree, ret_index, Factor,
+                            term_labels, "Term2")
+    return [False, tok_index, []]
+
+
+def finish_chain(tokens, first_subtree, tok_index, operand, labels,
+                 last_label):
+    """
+    Return the subtree for a right-recursive rule of the form
+        <Rule> -> <Operand> SEP <Rule> | ... | <Operand>
+    whose first operand has already been parsed.
+
+    The operands are collected in a loop for as long as a separator is
+    followed by another operand, then the right-nested tree is built from the
+    end, so a chain of any length is parsed without recursion.
+
+    first_subtree - the parsed first operand
+    tok_index - the position just after the first operand
+    operand - the grammar function for <Operand>
+    labels - maps each separator token to the label of its alternative
+    last_label - the label of the bare <Operand> alternative
+    """
+    operands = [first_subtree]
+    separators = []
+    ret_index = tok_index
+    while tokens[ret_index].kind in labels:
+        (result, next_index, next_subtree) = operand(tokens, ret_index + 1)
+        if not result:
+            break
+        separators.append(tokens[ret_index])
+        operands.append(next_subtree)
+        ret_index = next_index
+
+    subtree = [last_label, operands.pop()]
+    while separators:
+        separator = separators.pop()
+        subtree = [labels[separator.kind], operands.pop(), separator.text,
+                   subtree]
+    return [True, ret_index, subtree]
+
+
+def Factor(tokens, tok_index):
+    """
+    Return Factor subtree, if possible.
+
+    <Factor> ->
+        <SubExpression>
+        | <SubExpression> EXP <Factor>
+        | <FunctionCall>
+        | <Value> EXP <Factor>
+        | <Value>
+
+    LPAREN selects a <SubExpression>. Otherwise a leading <Name> is parsed
+    once and is either the start of a <FunctionCall> (when LPAREN follows and
+    the call parses) or the <Value>.
+    """
+    if LPAREN == tokens[tok_index].kind:
+        (result, ret_index, ret_subtree) = SubExpression(tokens, tok_index)
+        if not result:
+            return [False, tok_index, []]
+        return finish_exponent(tokens, ret_subtree, ret_index,
+                               "Factor0", "Factor1")
+
+    (result, ret_index, ret_subtree) = Name(tokens, tok_index)
+    if result:
+        if LPAREN == tokens[ret_index].kind:
+            (result, call_index, call_subtree) = finish_function_call(
+                tokens, ret_subtree, ret_index)
+            if result:
+                return [True, call_index, ["Factor2", call_subtree]]
+        value_subtree = ["Value0", ret_subtree]
+    else:
+        (result, ret_index, ret_subtree) = Number(tokens, tok_index)
+        if not result:
+            if SUB == tokens[tok_index].kind or ADD == tokens[tok_index].kind:
+                expect(tok_index + 1, (IDENT, NUMBER))
+            else:
+                expect(tok_index, (LPAREN, IDENT, NUMBER))
+            return [False, tok_index, []]
+        value_subtree = ["Value1", ret_subtree]
+    return finish_exponent(tokens, value_subtree, ret_index,
+                           "Factor3", "Factor4")
+
+
+def finish_exponent(tokens, base_subtree, tok_index, exp_label, plain_label):
+    """
+    Return Factor subtree for an already parsed base and an optional exponent.
+
+    base_subtree - the parsed <SubExpression> or <Value>
+    tok_index - the position just after the base
+    exp_label - the Factor label for <base> EXP <Factor>
+    plain_label - the Factor label for a bare <base>
+    """
+    if EXP == tokens[tok_index].kind:
+        (result, ret_index, ret_subtree) = Factor(tokens, tok_index + 1)
+        if result:
+            return [True, ret_index,
+                    [exp_label, base_subtree, tokens[tok_index].text,
+                     ret_subtree]]
+    return [True, tok_index, [plain_label, base_subtree]]
+
+
+def FunctionCall(tokens, tok_index):
+    """
+    Return FunctionCall subtree, if possible.
+
+    <FunctionCall> ->
+        <Name> LPAREN <FunctionCallParams> COLON <Number>
+        | <Name> LPAREN <FunctionCallParams>
+    """
+    (result, ret_index, ret_subtree) = expect_name(tokens, tok_index)
+    if result and LPAREN == tokens[ret_index].kind:
+        (result, ret_index, ret_subtree) = finish_function_call(tokens,
+                                                                ret_subtree,
+                                                                ret_index)
+        if result:
+            return [True, ret_index, ret_subtree]
+    elif result:
+        expect(ret_index, (LPAREN,))
+    return [False, tok_index, []]
+
+
+def finish_function_call(tokens, name_subtree, tok_index):
+    """
+    Return FunctionCall subtree whose <Name> has already been parsed.
+
+    name_subtree - the parsed function <Name>
+    tok_index - the position of the LPAREN following the <Name>
+    """
+    (result, ret_index, params_subtree) = FunctionCallParams(tokens,
+                                                             tok_index + 1)
+    if not result:
+        return [False, tok_index, []]
+
+    if COLON == tokens[ret_index].kind:
+        (result, num_index, num_subtree) = Number(tokens, ret_index + 1)
+        if result:
+            return [True, num_index,
+                    ["FunctionCall0", name_subtree, tokens[tok_index].text,
+                     params_subtree, tokens[ret_index].text, num_subtree]]
+        expect(ret_index + 1, (NUMBER,))
+    return [True, ret_index,
+            ["FunctionCall1", name_subtree, tokens[tok_index].text,
+             params_subtree]]
+
+
+def FunctionCallParams(tokens, tok_index):
+    """
+    Return FunctionCallParams subtree, if possible.
+
+    <FunctionCallParams> ->
+        <ParameterList> RPAREN
+        | RPAREN
+    """
+    # RPAREN can't start a <ParameterList>, so check for it first.
+    if RPAREN == tokens[tok_index].kind:
+        return [True, tok_index + 1,
+                ["FunctionCallParams1", tokens[tok_index].text]]
+
+    (result, ret_index, ret_subtree) = ParameterList(tokens, tok_index)
+    if not result:
+        expect(tok_index, (RPAREN,))
+    elif RPAREN == tokens[ret_index].kind:
+        return [True, ret_index + 1,
+                ["FunctionCallParams0", ret_subtree, tokens[ret_index].text]]
+    else:
+        expect(ret_index, (COMMA, RPAREN))
+    return [False, tok_index, []]
+
+
+def SubExpression(tokens, tok_index):
+    """
+    Return SubExpression subtree, if possible.
+
+    <SubExpression> ->
+        LPAREN <Expression> RPAREN
+    """
+    if LPAREN == tokens[tok_index].kind:
+        (result, ret_index, ret_subtree) = Expression(tokens, tok_index + 1)
+        if result and RPAREN == tokens[ret_index].kind:
+            return [True, ret_index + 1,
+                    ["SubExpression0", tokens[tok_index].text, ret_subtree,
+                     tokens[ret_index].text]]
+        elif result:
+            expect(ret_index, (RPAREN,))
+    return [False, tok_index, []]
+
+
+def Value(tokens, tok_index):
+    """
+    Return Value subtree, if possible.
+
+    <Value> ->
+        <Name>
+        | <Number>
+    """
+    (result, ret_index, ret_subtree) = Name(tokens, tok_index)
+    if result:
+        return [True, ret_index, ["Value0", ret_subtree]]
+
+    (result, ret_index, ret_subtree) = Number(tokens, tok_index)
+    if result:
+        return [True, ret_index, ["Value1", ret_subtree]]
+    return [False, tok_index, []]
+
+
+def Name(tokens, tok_index):
+    """
+    Return Name subtree, if possible.
+
+    <Name> ->
+        IDENT
+        | SUB IDENT
+        | ADD IDENT
+    """
+    tok = tokens[tok_index]
+    if is_ident(tok):
+        return [True, tok_index + 1, ["Name0", tok.text]]
+
+    if ((SUB == tok.kind or ADD == tok.kind) and
+            is_ident(tokens[tok_index + 1])):
+        label = "Name1" if SUB == tok.kind else "Name2"
+        return [True, tok_index + 2,
+                [label, tok.text, tokens[tok_index + 1].text]]
+    return [False, tok_index, []]
+
+
+def Number(tokens, tok_index):
+    """
+    Return Number subtree, if possible.
+
+    <Number> ->
+        NUMBER
+        | SUB NUMBER
+        | ADD NUMBER
+    """
+    tok = tokens[tok_index]
+    if is_number(tok):
+        return [True, tok_index + 1, ["Number0", tok.text]]
+
+    if ((SUB == tok.kind or ADD == tok.kind) and
+            is_number(tokens[tok_index + 1])):
+        label = "Number1" if SUB == tok.kind else "Number2"
+        return [True, tok_index + 2,
+                [label, tok.text, tokens[tok_index + 1].text]]
+    return [False, tok_index, []]
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Quirk parser")
+    arg_parser.add_argument("files", nargs="*")
+    arg_parser.add_argument("--text", action="store_true",
+                            help="pretty-print the tree instead of writing "
+                                 "the binary tree format")
+    args = arg_parser.parse_args()
+
+    token_text = ""
+    for line in fileinput.input(files=args.files):
+        token_text += line
+
+    positions = []
+    token_list = lexer.read_tokens(token_text, positions)
+    (result, ret_index, parseTree) = parse(token_list)
+    if EOF != token_list[ret_index].kind:
+        print("fastparser.py: Syntax error at %s: %s" %
+              (lexer.position_text(positions, failure.index),
+               failure_message(token_list)), file=sys.stderr)
+        sys.exit(1)
+
+    if args.text:
+        pp.pprint(parseTree)
+    else:
+        treeformat.write_tree(parseTree, sys.stdout.buffer)
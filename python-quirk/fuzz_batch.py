@@ -0,0 +1,92 @@
+"""
+Batch consistency check.
+
+Runs a list of known tricky programs and then random ones with
+batch.run_batch() on every engine, over random columns, and reports each
+program where a row's output or error differs from what the tree engine
+gives when that row is run on its own. Needs NumPy, like batch.py.
+
+    python fuzz_batch.py [--programs N] [--rows N] [--seed N]
+"""
+import io
+import sys
+import random
+import argparse
+
+import quirk
+import batch
+import fuzz_engines
+
+# Programs that batch evaluation has got wrong before. They read the
+# columns x and y.
+regression_programs = [
+    # x is bound but only read by g, through the scope f binds it in
+    "function f(x){ return x }\nfunction g(){ return x * 2 }\nprint g()\n",
+    # NumPy's power has -0.0 ^ 0.5 as -0.0, and rounds 7 ^ 1.5 differently
+    "print (-x) ^ 0.5\nprint (x + 7 - x) ^ 1.5\nprint 2 ^ -x\n",
+]
+
+column_names = ["x", "y"]
+column_values = [0.0, -8.0, 2.0, 3.5, -1.0, 0.5, 1e200]
+
+
+def row_outcome(tree, row):
+    """Return what tree prints on the tree engine for one row of values
+    and the name of the error it raises, if any."""
+    out = io.StringIO()
+    try:
+        quirk.engines["tree"](tree, dict(row), out)
+        error = None
+    except Exception as e:
+        error = type(e).__name__
+    return (out.getvalue(), error)
+
+
+def check(source, columns, engines):
+    """
+    Return a list of (engine, row, expected, result) for each row whose
+    outcome in run_batch() on engine differs from row_outcome().
+    """
+    tree = quirk.parse(source)
+    rows = [dict((name, values[row]) for (name, values) in columns.items())
+            for row in range(len(columns[column_names[0]]))]
+    expected = [row_outcome(tree, row) for row in rows]
+    differences = []
+    for engine in engines:
+        result = batch.run_batch(tree, columns, engine)
+        for row in range(len(rows)):
+            error = result.errors.get(row)
+            outcome = (result.output(row),
+                       None if error is None else type(error).__name__)
+            if outcome != expected[row]:
+                differences.append((engine, row, expected[row], outcome))
+    return differences
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--programs", type=int, default=200)
+    arg_parser.add_argument("--rows", type=int, default=20)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--engines", default="tree,closure,vm")
+    args = arg_parser.parse_args()
+
+    sys.setrecursionlimit(5000)
+    rand = random.Random(args.seed)
+    generator = fuzz_engines.ProgramGenerator(rand)
+    programs = regression_programs + [generator.program(column_names)
+                                      for _ in range(args.programs)]
+    failed = 0
+    for source in programs:
+        columns = dict((name, [rand.choice(column_values)
+                               for _ in range(args.rows)])
+                       for name in column_names)
+        differences = check(source, columns, args.engines.split(","))
+        if differences:
+            failed += 1
+            print(source)
+            for (engine, row, expected, outcome) in differences[:5]:
+                print("    %-8s row %d: %r, not %r" % (engine, row, outcome,
+                                                      expected))
+    print("%d of %d programs differ" % (failed, len(programs)))
+    sys.exit(1 if failed else 0)
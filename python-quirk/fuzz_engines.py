@@ -0,0 +1,173 @@
+"""
+Engine and optimizer consistency check.
+
+Runs a list of known tricky programs and then random ones on every engine,
+with and without --optimize, and reports each program whose output or error
+differs from what the tree engine gives without optimizing. What a program
+prints before an error counts too, and so does the type of the error.
+
+    python fuzz_engines.py [--programs N] [--seed N] [--engines tree,vm]
+"""
+import io
+import sys
+import random
+import argparse
+
+import quirk
+
+# Programs that engines or the optimizer have got wrong before
+regression_programs = [
+    # a negative index makes every engine evaluate all the returned values
+    "function h(a){ return a - 2, 3 }\nprint h():-1\n",
+    # the arguments are evaluated, and print, before the call raises
+    "function f(a){ print a  return a }\nprint nope(f(7))\n",
+    # inlining f0() into f1 would make f1 pure, and f1(c) skippable
+    "function f0(){ return 1, nope }\n"
+    "function f1(a){ var b = a ^ 2  return f0() }\n"
+    "function f3(a, c){ return a, f1(c) }\nprint f3(2)\n",
+]
+
+# Names the random programs read without ever binding them
+unbound_names = ["nope"]
+
+
+class ProgramGenerator:
+    """Builds random Quirk programs from a random.Random."""
+
+    def __init__(self, rand):
+        self.rand = rand
+
+    def number(self):
+        return self.rand.choice(["2", "3", "0.5", "1.5", "0", "- 2", "+ 3"])
+
+    def atom(self, names):
+        r = self.rand.random()
+        if r < 0.05:
+            return self.rand.choice(unbound_names)
+        if names and r < 0.5:
+            return self.rand.choice(["", "-", "+"]) + self.rand.choice(names)
+        return self.number()
+
+    def call(self, names, functions, depth):
+        (name, (param_count, value_count)) = self.rand.choice(
+            sorted(functions.items()))
+        if self.rand.random() < 0.05:
+            # calling something that isn't a function raises an error
+            name = self.rand.choice(unbound_names + names)
+        arg_count = max(0, param_count + self.rand.choice([0, 0, 0, -1]))
+        call = "%s(%s)" % (name, ", ".join(
+            self.expression(names, functions, depth + 1)
+            for _ in range(arg_count)))
+        r = self.rand.random()
+        if r < 0.4:
+            call += ":%d" % self.rand.randrange(value_count)
+        elif r < 0.5:
+            call += ":-%d" % self.rand.randint(1, value_count)
+        return call
+
+    def expression(self, names, functions, depth=0):
+        r = self.rand.random()
+        if depth > 3 or r < 0.3:
+            return self.atom(names)
+        if r < 0.55:
+            return "%s %s %s" % (self.expression(names, functions, depth + 1),
+                                 self.rand.choice(["+", "-", "*", "/"]),
+                                 self.expression(names, functions, depth + 1))
+        if r < 0.65:
+            return "(%s)" % self.expression(names, functions, depth + 1)
+        if r < 0.72:
+            return "%s ^ %s" % (self.atom(names),
+                                self.rand.choice(["2", "3", "0.5"]))
+        if functions and r < 0.95:
+            return self.call(names, functions, depth)
+        return "(%s) ^ 2" % self.expression(names, functions, depth + 1)
+
+    def function(self, name, functions):
+        """Return the source of a function and its parameter and value
+        counts."""
+        params = ["p%d" % i for i in range(self.rand.randint(0, 3))]
+        names = list(params)
+        body = []
+        for i in range(self.rand.randint(0, 2)):
+            body.append("var l%d = %s" % (
+                i, self.expression(names, functions)))
+            names.append("l%d" % i)
+            if self.rand.random() < 0.2:
+                body.append("print " + self.expression(names, functions))
+        value_count = self.rand.randint(1, 3)
+        body.append("return " + ", ".join(
+            self.expression(names, functions) for _ in range(value_count)))
+        source = "function %s(%s){\n  %s\n}" % (name, ", ".join(params),
+                                               "\n  ".join(body))
+        return (source, (len(params), value_count))
+
+    def program(self, names=()):
+        """Return the source of a program that may also read names."""
+        lines = []
+        names = list(names)
+        functions = {}
+        for i in range(self.rand.randint(2, 10)):
+            r = self.rand.random()
+            if r < 0.25:
+                name = "f%d" % i
+                (source, shape) = self.function(name, functions)
+                lines.append(source)
+                functions[name] = shape
+            elif r < 0.5:
+                lines.append("var v%d = %s" % (
+                    i, self.expression(names, functions)))
+                names.append("v%d" % i)
+            else:
+                lines.append("print " + self.expression(names, functions))
+        return "\n".join(lines) + "\n"
+
+
+def outcome(source, engine, optimize):
+    """Return what source prints on engine and the name of the error it
+    raises, if any."""
+    out = io.StringIO()
+    try:
+        quirk.run(source, out, engine=engine, optimize=optimize)
+        error = None
+    except Exception as e:
+        error = type(e).__name__
+    return (out.getvalue(), error)
+
+
+def check(source, engines):
+    """Return a list of the (engine, optimize, outcome) that differ from
+    the tree engine's outcome without optimizing, which comes first."""
+    expected = outcome(source, "tree", False)
+    differences = [("tree", False, expected)]
+    for engine in engines:
+        for optimize in (False, True):
+            if "tree" == engine and not optimize:
+                continue
+            result = outcome(source, engine, optimize)
+            if result != expected:
+                differences.append((engine, optimize, result))
+    return differences[1:] and differences
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--programs", type=int, default=500)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--engines", default="tree,closure,vm")
+    args = arg_parser.parse_args()
+
+    sys.setrecursionlimit(5000)
+    generator = ProgramGenerator(random.Random(args.seed))
+    programs = regression_programs + [generator.program()
+                                      for _ in range(args.programs)]
+    failed = 0
+    for source in programs:
+        differences = check(source, args.engines.split(","))
+        if differences:
+            failed += 1
+            print(source)
+            for (engine, optimize, result) in differences:
+                print("    %-8s optimize=%-5s %r" % (engine, optimize,
+                                                     result))
+    print("%d of %d programs differ" % (failed, len(programs)))
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,138 @@
+"""
+Incremental re-parse consistency check.
+
+Makes random edits to random programs with incremental.Document.edit() and
+checks each result against quirk.parse() of the edited source: the trees
+must be the same, and an edit whose source doesn't parse must raise the
+same syntax error and leave the document as it was. Chunks are kept small
+so that edits also cross and merge them.
+
+    python fuzz_incremental.py [--programs N] [--edits N] [--seed N]
+"""
+import io
+import sys
+import random
+import argparse
+
+import quirk
+import treeformat
+import incremental
+import fuzz_engines
+
+# Text that edits put in. Besides whole statements there are pieces that
+# break a statement or join it to the next one until a later edit fixes it.
+snippets = [
+    "", " ", "\n", "x", "1", "+ 2", "}", "{", "(", ")", ",", "var",
+    "print", "function", "return 1\n}", "print 1\n", "var a = 2\n",
+    "function g(a){\n  return a\n}\n",
+]
+
+
+def encode(tree):
+    """Return the binary encoding of tree, to compare trees by."""
+    out = io.BytesIO()
+    treeformat.write_tree(tree, out)
+    return out.getvalue()
+
+
+def parse_outcome(source):
+    """Return the encoded tree of source, or the syntax error message."""
+    try:
+        return (encode(quirk.parse(source)), None)
+    except Exception as e:
+        return (None, str(e))
+
+
+def statement_starts(source):
+    """
+    Return the offsets of the lines of a ProgramGenerator program that
+    start top-level statements: the ones not in a function's braces.
+    """
+    starts = []
+    offset = 0
+    for line in source.splitlines(True):
+        if line[:1] not in (" ", "}"):
+            starts.append(offset)
+        offset += len(line)
+    return starts
+
+
+def random_edit(rand, source, generator):
+    """Return a random (start, end, text) edit of source."""
+    r = rand.random()
+    if r < 0.5:
+        # replace whole statements with those of another program, which
+        # keeps most of the edited programs parsing
+        starts = statement_starts(source) + [len(source)]
+        first = rand.randrange(len(starts))
+        stop = min(len(starts) - 1, first + rand.choice([0, 1, 1, 2, 5]))
+        other = generator.program()
+        other_starts = statement_starts(other) + [len(other)]
+        piece = rand.randrange(len(other_starts))
+        piece_stop = min(len(other_starts) - 1,
+                         piece + rand.choice([0, 1, 2, 4]))
+        return (starts[first], starts[stop],
+                other[other_starts[piece]:other_starts[piece_stop]])
+    start = rand.randint(0, len(source))
+    end = min(len(source), start + rand.choice([0, 0, 1, 2, 5, 20, 100]))
+    if r < 0.8:
+        text = rand.choice(snippets)
+    else:
+        # a piece of the source, so edits move statements around
+        piece = rand.randint(0, len(source))
+        text = source[piece:piece + rand.randint(0, 60)]
+    return (start, end, text)
+
+
+def check(source, edits, rand, generator):
+    """
+    Make edits random edits to a Document of source, and return a list of
+    a message for each one that doesn't match quirk.parse().
+    """
+    document = incremental.Document(source)
+    problems = []
+    for _ in range(edits):
+        (start, end, text) = random_edit(rand, document.source, generator)
+        old_source = document.source
+        old_tree = encode(document.tree)
+        edited = old_source[:start] + text + old_source[end:]
+        (expected, message) = parse_outcome(edited)
+        try:
+            tree = encode(document.edit(start, end, text))
+            error = None
+        except Exception as e:
+            (tree, error) = (None, str(e))
+
+        edit = "edit %d:%d %r of\n%s" % (start, end, text, old_source)
+        if message is None and tree != expected:
+            problems.append("tree differs from quirk.parse(): " + edit)
+        elif message is not None and error != message:
+            problems.append("%r, not %r: %s" % (error, message, edit))
+        elif message is not None and (document.source != old_source or
+                                      encode(document.tree) != old_tree):
+            problems.append("a failed edit changed the document: " + edit)
+        elif document.source != edited and message is None:
+            problems.append("source isn't the edited one: " + edit)
+    return problems
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--programs", type=int, default=200)
+    arg_parser.add_argument("--edits", type=int, default=50)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--chunk-size", type=int, default=3)
+    args = arg_parser.parse_args()
+
+    incremental.chunk_size = args.chunk_size
+    rand = random.Random(args.seed)
+    generator = fuzz_engines.ProgramGenerator(rand)
+    failed = 0
+    for _ in range(args.programs):
+        problems = check(generator.program(), args.edits, rand, generator)
+        if problems:
+            failed += 1
+            print(problems[0])
+    print("%d of %d programs had edits that differ" % (failed,
+                                                       args.programs))
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,279 @@
+"""
+Incremental re-parsing of Quirk source that is being edited.
+
+    document = incremental.Document(source)
+    tree = document.edit(start, end, text)
+
+A Document holds the source text and parse tree of a program. edit()
+replaces source[start:end] with text and re-lexes and re-parses only the
+top-level statements the edit touches; every other Statement subtree, with
+any whole FunctionDeclaration in it, is reused from the previous tree.
+
+A top-level statement can be parsed on its own because it begins with
+FUNCTION, VAR or PRINT, and none of those tokens can continue the statement
+before it. The region that is re-parsed runs from the first token of the
+statement the edit starts in (or of the one before it, if the edit reaches
+into the statement's keyword) to the first token of the next statement the
+edit doesn't reach. If the new text of the region doesn't lex and parse as
+a sequence of whole statements - say a closing brace was deleted, so a
+function now runs on into the statements after it - the region is extended
+over the following statements until it does.
+
+The statements are kept in chunks of at most chunk_size, with their offsets
+counted from the start of their chunk, so only the chunks an edit touches
+are renumbered. Apart from copying the source string and the lists of
+chunks, which happens at C speed, an edit takes time in proportion to the
+region it re-parses rather than to the size of the program;
+bench_incremental.py measures this.
+"""
+import array
+import bisect
+import itertools
+
+import lexer
+import quirk
+import fastparser
+
+# The most statements kept in one chunk
+chunk_size = 256
+
+# Statement label -> length of the keyword that kind of statement starts with
+keyword_lengths = dict((label, len(lexer.fixedLexemes[kind.name]))
+                       for (kind, (rule, label))
+                       in fastparser.statement_starts.items())
+
+
+class Document(object):
+    """
+    The source text and parse tree of a Quirk program being edited.
+
+    source - the program's source text
+    tree - its parse tree; the same tree quirk.parse(source) returns. The
+        Program0 / Program1 nodes before an edit are updated in place, so
+        the tree stays the same list unless the first statement changes.
+
+    The top-level statements are kept in chunks. For each chunk there is the
+    list of its Statement subtrees, the list of the Program nodes of the tree
+    that hold them, the array of the offset of each statement's first token
+    from the start of the chunk, and the length of the chunk's text. A chunk
+    starts at the first token of its first statement, except the first chunk,
+    which starts at 0.
+    """
+
+    def __init__(self, source):
+        """Parse source, raising the same Exceptions as quirk.parse()."""
+        offsets = array.array('l')
+        tokens = quirk.tokenize(source, offsets)
+        (statements, ends) = fastparser.parse_statements(tokens)
+        if not statements or lexer.EOF != tokens[ends[-1]].kind:
+            raise quirk.syntax_error(source, tokens, offsets)
+
+        self.source = source
+        self.chunk_statements = []
+        self.chunk_nodes = []
+        self.chunk_starts = []
+        self.chunk_lengths = []
+        starts = [offsets[index] for index in [0] + ends[:-1]]
+        self.replace_chunks(0, 0, statements, program_nodes(statements, None),
+                            starts, len(source))
+        self.tree = self.chunk_nodes[0][0]
+
+    def edit(self, start, end, text):
+        """
+        Replace source[start:end] with text and return the new parse tree.
+
+        If the new source doesn't lex or parse, this raises the Exception
+        quirk.parse() would and the document is left as it was.
+        """
+        if not 0 <= start <= end <= len(self.source):
+            raise ValueError("edit %d:%d is outside the source" % (start, end))
+        source = self.source[:start] + text + self.source[end:]
+        delta = len(source) - len(self.source)
+
+        # the source offset and the index of the first statement of each
+        # chunk, each followed by the total
+        bases = list(itertools.accumulate(self.chunk_lengths, initial=0))
+        firsts = list(itertools.accumulate(map(len, self.chunk_statements),
+                                           initial=0))
+        count = firsts[-1]
+
+        first = self.statement_at(start, bases, firsts)
+        if first > 0 and start <= self.keyword_end(first, bases, firsts):
+            first -= 1
+        stop = first + 1
+        if end > 0:
+            stop = max(stop, self.statement_at(end - 1, bases, firsts) + 1)
+
+        region_start = 0
+        if first > 0:
+            region_start = self.statement_start(first, bases, firsts)
+        while True:
+            offsets = array.array('l')
+            if stop == count:
+                region_end = len(source)
+                tokens = lexer.lex(source, offsets, region_start, region_end)
+            else:
+                # lex the keyword of the statement after the region too, to
+                # check the region's last token didn't run into it
+                region_end = self.statement_start(stop, bases, firsts) + delta
+                tokens = lexer.lex(source, offsets, region_start,
+                                   self.keyword_end(stop, bases, firsts) +
+                                   delta)
+                if (not tokens or offsets[-1] != region_end or
+                        tokens[-1].kind not in fastparser.statement_starts):
+                    stop += 1
+                    continue
+                tokens.pop()
+                offsets.pop()
+            tokens.append(lexer.eofToken)
+            offsets.append(region_end)
+
+            (statements, ends) = fastparser.parse_statements(tokens)
+            parsed = ends[-1] if ends else 0
+            if parsed == len(tokens) - 1 and (statements or first > 0 or
+                                              stop < count):
+                break
+            if stop == count:
+                raise quirk.syntax_error(source, tokens, offsets)
+            stop = min(count, stop + (stop - first))
+
+        starts = [offsets[index] for index in ([0] + ends)[:len(ends)]]
+        self.replace_statements(first, stop, statements, starts, bases, firsts,
+                                delta)
+        self.source = source
+        self.tree = self.chunk_nodes[0][0]
+        return self.tree
+
+    def replace_statements(self, first, stop, statements, starts, bases,
+                           firsts, delta):
+        """
+        Replace statements first up to stop with the new statements, whose
+        first tokens are at starts, relinking the Program nodes around them.
+        delta is the change in the length of the source.
+        """
+        (first_chunk, first_index) = locate(first, firsts)
+        (last_chunk, last_index) = locate(stop - 1, firsts)
+        base = bases[first_chunk]
+        chunk_starts = self.chunk_starts[first_chunk]
+        before_starts = [base + chunk_starts[index]
+                         for index in range(first_index)]
+        before = self.chunk_statements[first_chunk][:first_index]
+        before_nodes = self.chunk_nodes[first_chunk][:first_index]
+
+        base = bases[last_chunk] + delta
+        chunk_starts = self.chunk_starts[last_chunk]
+        after_starts = [base + chunk_starts[index]
+                        for index in range(last_index + 1, len(chunk_starts))]
+        after = self.chunk_statements[last_chunk][last_index + 1:]
+        after_nodes = self.chunk_nodes[last_chunk][last_index + 1:]
+
+        if not (before or statements or after):
+            # the first chunk is left empty, so the next one takes its place
+            last_chunk += 1
+            base = bases[last_chunk] + delta
+            after_starts = [base + offset
+                            for offset in self.chunk_starts[last_chunk]]
+            after = self.chunk_statements[last_chunk]
+            after_nodes = self.chunk_nodes[last_chunk]
+
+        if after_nodes:
+            next_node = after_nodes[0]
+        elif last_chunk + 1 < len(self.chunk_nodes):
+            next_node = self.chunk_nodes[last_chunk + 1][0]
+        else:
+            next_node = None
+        nodes = program_nodes(statements, next_node)
+        if nodes:
+            next_node = nodes[0]
+
+        if before_nodes:
+            link(before_nodes[-1], next_node)
+        elif first_chunk > 0:
+            link(self.chunk_nodes[first_chunk - 1][-1], next_node)
+
+        self.replace_chunks(first_chunk, last_chunk + 1,
+                            before + statements + after,
+                            before_nodes + nodes + after_nodes,
+                            before_starts + starts + after_starts,
+                            bases[last_chunk + 1] + delta)
+
+    def replace_chunks(self, first_chunk, stop_chunk, statements, nodes,
+                       starts, end):
+        """
+        Replace chunks first_chunk up to stop_chunk with chunks holding
+        statements, their Program nodes and the source offsets of their first
+        tokens. end is the offset where the text of the last one ends.
+        """
+        chunk_statements = []
+        chunk_nodes = []
+        chunk_starts = []
+        chunk_lengths = []
+        for first in range(0, len(statements), chunk_size):
+            stop = first + chunk_size
+            base = starts[first]
+            if first_chunk == 0 and first == 0:
+                base = 0
+            chunk_statements.append(statements[first:stop])
+            chunk_nodes.append(nodes[first:stop])
+            chunk_starts.append(array.array('l', [start - base for start
+                                                  in starts[first:stop]]))
+            if stop < len(statements):
+                chunk_lengths.append(starts[stop] - base)
+            else:
+                chunk_lengths.append(end - base)
+        self.chunk_statements[first_chunk:stop_chunk] = chunk_statements
+        self.chunk_nodes[first_chunk:stop_chunk] = chunk_nodes
+        self.chunk_starts[first_chunk:stop_chunk] = chunk_starts
+        self.chunk_lengths[first_chunk:stop_chunk] = chunk_lengths
+
+    def statement_at(self, offset, bases, firsts):
+        """
+        Return the index of the statement whose text holds the source offset:
+        the last one that starts at or before it.
+        """
+        chunk = max(bisect.bisect_right(bases, offset, 0, len(bases) - 1) - 1,
+                    0)
+        index = bisect.bisect_right(self.chunk_starts[chunk],
+                                    offset - bases[chunk]) - 1
+        return max(firsts[chunk] + index, 0)
+
+    def statement_start(self, statement, bases, firsts):
+        """Return the source offset of the first token of a statement."""
+        (chunk, index) = locate(statement, firsts)
+        return bases[chunk] + self.chunk_starts[chunk][index]
+
+    def keyword_end(self, statement, bases, firsts):
+        """Return the source offset just past the keyword of a statement."""
+        (chunk, index) = locate(statement, firsts)
+        label = self.chunk_statements[chunk][index][0]
+        return (bases[chunk] + self.chunk_starts[chunk][index] +
+                keyword_lengths[label])
+
+
+def locate(statement, firsts):
+    """Return (chunk, index in the chunk) of the statement with an index."""
+    chunk = bisect.bisect_right(firsts, statement) - 1
+    return (chunk, statement - firsts[chunk])
+
+
+def program_nodes(statements, next_node):
+    """
+    Return the Program nodes that hold statements, in order. The last one
+    goes on to the Program node next_node, or is a Program1 if that's None.
+    """
+    nodes = [None] * len(statements)
+    for index in range(len(statements) - 1, -1, -1):
+        if next_node is None:
+            next_node = ["Program1", statements[index]]
+        else:
+            next_node = ["Program0", statements[index], next_node]
+        nodes[index] = next_node
+    return nodes
+
+
+def link(node, next_node):
+    """Make the Program node node go on to next_node (None for the end)."""
+    if next_node is None:
+        node[:] = ["Program1", node[1]]
+    else:
+        node[:] = ["Program0", node[1], next_node]
@@ -1,15 +1,45 @@
+import gc
+import os
+import ast
 import sys
+import time
+import atexit
 import pprint
+import argparse
+import operator
 import fileinput
 
+import memo
+import lazy
+import treeformat
+
 pp = pprint.PrettyPrinter(indent=1, depth=100)
 
+# Structured trace output, off unless enable_trace() is called (by setting
+# QUIRK_TRACE or running with --trace). Events are buffered as JSON lines and
+# written in batches of trace_flush_lines.
+trace_stream = None
+trace_buffer = []
+trace_depth = 0
+trace_start = 0.0
+trace_flush_lines = 4096
+
+# Profiling of Quirk functions and top-level statements, off unless
+# enable_profile() is called (by running with --profile or --profile-stats).
+# While it's on, profile_stack has a [label, path, start, child_seconds] list
+# for every function call and statement in progress, innermost last.
+profile_stack = None
+# id() of a function body -> the name it was declared with
+profile_names = {}
+# label -> {"name", "calls", "inclusive", "exclusive"}, and the recursive
+# calls of each label in progress
+profile_entries = {}
+profile_active = {}
+# "statement;function;function" path -> exclusive seconds spent there
+profile_paths = {}
 
-# start utilities
-def eprint(msg):
-    """Print to stderr."""
-    print(msg, file=sys.stderr)
 
+# start utilities
 
 def lookup_in_scope_stack(name, scope):
     """
@@ -24,24 +54,58 @@ def lookup_in_scope_stack(name, scope):
         return scope[name]
     else:
         if "__parent__" in scope:
-            eprint("not found in scope. Looking at __parent__")
             return lookup_in_scope_stack(name, scope["__parent__"])
 
 
 def get_name_from_ident(tok):
     """Return the string lexeme associated with an IDENT token, tok."""
-    eprint("get_name_from_ident() " + tok)
     colon_index = tok.find(":")
     return tok[colon_index+1:]
 
 
 def get_number_from_ident(tok):
     """Return the float lexeme associated with an NUMBER token, tok."""
-    eprint("get_number_from_ident() " + tok)
     colon_index = tok.find(":")
     return float(tok[colon_index+1:])
 
 
+def prepare_tree(tree):
+    """
+    Return a copy of a parse tree ready to be interpreted.
+
+    Token strings are converted once, up front, instead of every time a node
+    is evaluated: each 'NUMBER:2' becomes the float 2.0 and each 'IDENT:foo'
+    becomes the interned name 'foo'. Every other leaf is kept as it is. The
+    copy is made with an explicit stack, with the cyclic garbage collector
+    paused like in treeformat.read_tree().
+    """
+    numbers = {}
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        prepared = []
+        stack = [(tree, prepared)]
+        while stack:
+            (pt, copy) = stack.pop()
+            for child in pt:
+                if isinstance(child, list):
+                    item = []
+                    stack.append((child, item))
+                elif child.startswith("NUMBER:"):
+                    item = numbers.get(child)
+                    if item is None:
+                        item = numbers[child] = get_number_from_ident(child)
+                elif child.startswith("IDENT:"):
+                    item = sys.intern(get_name_from_ident(child))
+                else:
+                    item = child
+                copy.append(item)
+        return prepared
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
 def func_by_name(*args):
     """
     Call a function whos name is given as a parameter.
@@ -59,16 +123,286 @@ def func_by_name(*args):
     pt = args[1]
     scope = args[2]
 
-    returnval = globals()[name](pt, scope)
-    eprint("calfunc_by_name()) " + name + " " + str(returnval))
-    return returnval
+    return globals()[name](pt, scope)
+
+
+untraced_func_by_name = func_by_name
+
+
+def traced_func_by_name(*args):
+    """
+    func_by_name() that also records a trace event for the node.
+
+    Each event is one JSON object per line with the node name, its depth in
+    the evaluation, and its start time and elapsed time in seconds (relative
+    to enable_trace()). Events are written when the node finishes, so
+    children come before their parents.
+    """
+    global trace_depth
+    name = args[0]
+    trace_depth += 1
+    start = time.perf_counter()
+    try:
+        return globals()[name](args[1], args[2])
+    finally:
+        elapsed = time.perf_counter() - start
+        trace_depth -= 1
+        trace_buffer.append(
+            '{"node": "%s", "depth": %d, "start": %.9f, "elapsed": %.9f}\n'
+            % (name, trace_depth, start - trace_start, elapsed))
+        if len(trace_buffer) >= trace_flush_lines:
+            flush_trace()
+
+
+def enable_trace(stream):
+    """
+    Write a trace event for every evaluated node to the text stream.
+
+    Tracing works by rebinding func_by_name, so when it's off the
+    interpreter runs without any tracing checks at all.
+    """
+    global func_by_name, trace_stream, trace_start
+    flush_trace()
+    trace_stream = stream
+    trace_start = time.perf_counter()
+    func_by_name = traced_func_by_name
+
+
+def disable_trace():
+    """Flush any buffered trace events and stop tracing."""
+    global func_by_name, trace_stream
+    flush_trace()
+    trace_stream = None
+    func_by_name = untraced_func_by_name
+
+
+def flush_trace():
+    """Write out the buffered trace events."""
+    if trace_stream is not None and trace_buffer:
+        trace_stream.write("".join(trace_buffer))
+        trace_stream.flush()
+    del trace_buffer[:]
+
+
+def open_trace(path):
+    """Return the stream for a trace path; "-" means stderr."""
+    if "-" == path:
+        return sys.stderr
+    return open(path, "w")
+
+
+class Interpreter(object):
+    """
+    A Quirk program, ready to be run by walking its tree.
+
+        program = interpreter.Interpreter(tree, out)
+        scope = program.run()
+
+    What a run needs is kept here rather than in module globals, so any
+    number of programs can run at once on different threads. run() puts the
+    Interpreter in the top-level scope as "__interpreter__", and every
+    function's scope gets it from its caller's along with its "__parent__",
+    so the grammar functions below can always find it in their scope.
+
+    tree - a copy of the parse tree made by prepare_tree()
+    memoized - the id()s of the FunctionDeclaration0 nodes whose calls are
+        memoized, if memo.memo_size is set (see memo.py)
+    skippable - the flags of the values each Return0 node can skip, by id()
+        (see lazy.py)
+    out - the file-like object print statements write to; None for
+        sys.stdout as it is when they run
+    """
+
+    def __init__(self, tree, out=None):
+        self.tree = prepare_tree(tree)
+        self.memoized = frozenset()
+        if memo.memo_size > 0:
+            self.memoized = frozenset(memo.pure_functions(self.tree))
+        self.skippable = lazy.skippable_values(self.tree)
+        self.out = out
+        if profile_stack is not None:
+            for node in memo.declared_functions(self.tree)[0]:
+                profile_names[id(node[6])] = memo.name_of(node[2])
+
+    def run(self, scope=None):
+        """
+        Run the program and return its top-level scope: scope if it's given,
+        with the names the program binds added, or a new dict. With the
+        profiler on, each top-level statement is profiled on its own.
+        """
+        if scope is None:
+            scope = {}
+        scope["__interpreter__"] = self
+        try:
+            if profile_stack is None:
+                func_by_name(self.tree[0], self.tree, scope)
+                return scope
+            statements = memo.chain_items(self.tree, 2)
+            for (number, statement) in enumerate(statements, 1):
+                profile_enter("statement %d: %s" %
+                              (number, describe_statement(statement[1])))
+                try:
+                    func_by_name(statement[0], statement, scope)
+                finally:
+                    profile_leave()
+            return scope
+        finally:
+            del scope["__interpreter__"]
+
+
+def describe_statement(pt):
+    """Return e.g. "function foo", "var x, y" or "print" for a statement."""
+    if "FunctionDeclaration0" == pt[0]:
+        return "function " + memo.name_of(pt[2])
+    if "Print0" == pt[0]:
+        return "print"
+    return "var " + ", ".join(memo.assigned_names(pt[1]))
+
+
+def enable_profile():
+    """
+    Start profiling: every function call and top-level statement from then
+    on is counted and timed, adding to what was recorded before. Functions
+    get their names from the Interpreters made after this is called.
+
+    The profile is kept in module globals, for one program at a time.
+    """
+    global profile_stack, call_body, call_selected
+    profile_stack = []
+    call_body = profiled_call_body
+    call_selected = profiled_call_selected
+
+
+def disable_profile():
+    """Stop profiling; what was recorded is kept."""
+    global profile_stack, call_body, call_selected
+    profile_stack = None
+    call_body = unprofiled_call_body
+    call_selected = unprofiled_call_selected
+
+
+def reset_profile():
+    """Forget everything the profiler recorded."""
+    profile_entries.clear()
+    profile_paths.clear()
+
+
+def profile_enter(label):
+    """Start timing a function call or statement."""
+    entry = profile_entries.get(label)
+    if entry is None:
+        entry = profile_entries[label] = {
+            "name": label, "calls": 0, "inclusive": 0.0, "exclusive": 0.0}
+        profile_active[label] = 0
+    entry["calls"] += 1
+    profile_active[label] += 1
+    if profile_stack:
+        path = profile_stack[-1][1] + ";" + label
+    else:
+        path = label
+    profile_stack.append([label, path, time.perf_counter(), 0.0])
+
+
+def profile_leave():
+    """
+    Stop timing the innermost function call or statement. Time spent in a
+    call of a function that is already running further out only counts once
+    towards its inclusive time.
+    """
+    (label, path, start, child_seconds) = profile_stack.pop()
+    elapsed = time.perf_counter() - start
+    exclusive = elapsed - child_seconds
+    if profile_stack:
+        profile_stack[-1][3] += elapsed
+    entry = profile_entries[label]
+    entry["exclusive"] += exclusive
+    profile_active[label] -= 1
+    if not profile_active[label]:
+        entry["inclusive"] += elapsed
+    profile_paths[path] = profile_paths.get(path, 0.0) + exclusive
+
+
+def write_collapsed_stacks(stream):
+    """
+    Write the exclusive time of every path of calls in the collapsed stack
+    format flamegraph tools read, in microseconds:
+
+        statement 4: print;fib;fib 1520
+    """
+    for (path, seconds) in sorted(profile_paths.items()):
+        microseconds = int(round(seconds * 1e6))
+        if microseconds > 0:
+            stream.write("%s %d\n" % (path, microseconds))
+
+
+def profile_report():
+    """
+    Return a table of the calls, inclusive and exclusive seconds of every
+    function and top-level statement, the ones that took longest first.
+    """
+    lines = ["%-40s %9s %12s %12s" % ("function or statement", "calls",
+                                      "inclusive", "exclusive")]
+    for entry in sorted(profile_entries.values(),
+                        key=lambda e: -e["inclusive"]):
+        lines.append("%-40s %9d %12.6f %12.6f" % (
+            entry["name"], entry["calls"], entry["inclusive"],
+            entry["exclusive"]))
+    return "\n".join(lines) + "\n"
 # end utilities
 
 
+# The right-recursive rules below are walked with a loop along the chain of
+# nested nodes instead of recursing into the last child, so the stack depth
+# doesn't grow with the number of statements, names, parameters or operators.
+chain_operators = {
+    "Expression0": operator.add,
+    "Expression1": operator.sub,
+    "Term0": operator.mul,
+    "Term1": operator.truediv,
+}
+
+
+def chain_values(pt, scope):
+    """
+    Evaluate the operands of a right-recursive chain of nodes.
+
+    A chain such as Expression0 -> Expression1 -> Expression2 keeps its
+    operand in pt[1] and the rest of the chain in pt[3]; the last node only
+    has pt[1].
+
+    returns - the list of operand values and the list of node names that
+        joined them, both in source order.
+    """
+    values = []
+    links = []
+    while len(pt) > 2:
+        values.append(func_by_name(pt[1][0], pt[1], scope))
+        links.append(pt[0])
+        pt = pt[3]
+    values.append(func_by_name(pt[1][0], pt[1], scope))
+    return values, links
+
+
+def fold_chain(pt, scope):
+    """
+    Evaluate an Expression or Term chain.
+
+    Quirk's arithmetic rules are right-recursive, so the operators are applied
+    from the right: 1 + 4 - 3 is 1 + (4 - 3).
+    """
+    values, links = chain_values(pt, scope)
+    result = values.pop()
+    while links:
+        result = chain_operators[links.pop()](values.pop(), result)
+    return result
+
+
 # <Program> -> <Statement> <Program> | <Statement>
 def Program0(pt, scope):
+    while "Program0" == pt[0]:
+        func_by_name(pt[1][0], pt[1], scope)
+        pt = pt[2]
     func_by_name(pt[1][0], pt[1], scope)
-    func_by_name(pt[2][0], pt[2], scope)
 
 
 def Program1(pt, scope):
@@ -106,7 +440,11 @@ def FunctionDeclaration0(pt, scope):
     """
     function_name = func_by_name(pt[2][0], pt[2], scope)[1]
     param_names = func_by_name(pt[4][0], pt[4], scope)
-    scope[function_name] = [param_names, pt[6]]
+    function = [param_names, pt[6]]
+    if id(pt) in scope["__interpreter__"].memoized:
+        # a third item holds the results of a memoized function
+        function.append(memo.MemoTable(function_name, len(param_names)))
+    scope[function_name] = function
 
 
 # <FunctionParams> -> <NameList> RPAREN | RPAREN
@@ -121,9 +459,9 @@ def FunctionParams1(pt, scope):
 
 # <FunctionBody> -> <Program> <Return> | <Return>
 def FunctionBody0(pt, scope):
-    program = func_by_name(pt[1][0], pt[1], scope)
-    ret_value = func_by_name(pt[2][0], pt[2], scope)
-    return [program] + [ret_value]
+    # run the statements for their effect on scope, then return the values
+    func_by_name(pt[1][0], pt[1], scope)
+    return func_by_name(pt[2][0], pt[2], scope)
 
 
 def FunctionBody1(pt, scope):
@@ -154,7 +492,7 @@ def SingleAssignment0(pt, scope):
     """
     variable_name = func_by_name(pt[2][0], pt[2], scope)
     expression_value = func_by_name(pt[4][0], pt[4], scope)
-    scope[str(variable_name[1])] = str(expression_value)
+    scope[variable_name[1]] = expression_value
 
 
 # <MultipleAssignment> -> VAR <NameList> ASSIGN <FunctionCall>
@@ -167,7 +505,7 @@ def MultipleAssignment0(pt, scope):
         values
     """
     variable_names = func_by_name(pt[2][0], pt[2], scope)
-    values = func_by_name(pt[4][0], pt[4], scope)[1]
+    values = func_by_name(pt[4][0], pt[4], scope)
 
     for i in range(len(values)):
         scope[variable_names[i]] = values[i]
@@ -175,13 +513,17 @@ def MultipleAssignment0(pt, scope):
 
 # <Print> -> PRINT <Expression>
 def Print0(pt, scope):
-    print(str(func_by_name(pt[2][0], pt[2], scope)))
+    value = func_by_name(pt[2][0], pt[2], scope)
+    out = scope["__interpreter__"].out
+    if out is None:
+        out = sys.stdout
+    out.write(str(value) + "\n")
 
 
 # <NameList> -> <Name> COMMA <NameList> | <Name>
 def NameList0(pt, scope):
-    param_name = func_by_name(pt[1][0], pt[1], scope)[1]
-    return [param_name] + func_by_name(pt[3][0], pt[3], scope)
+    # each Name returns a [val, name] pair; keep only the names
+    return [name[1] for name in chain_values(pt, scope)[0]]
 
 
 def NameList1(pt, scope):
@@ -192,12 +534,11 @@ def NameList1(pt, scope):
 # <ParameterList> -> <Parameter> COMMA <ParameterList> | <Parameter>
 # should return a a list of values.
 def ParameterList0(pt, scope):
-    params = func_by_name(pt[1][0], pt[1], scope)
-    return [params] + [func_by_name(pt[3][0], pt[3], scope)]
+    return chain_values(pt, scope)[0]
 
 
 def ParameterList1(pt, scope):
-    return func_by_name(pt[1][0], pt[1], scope)
+    return [func_by_name(pt[1][0], pt[1], scope)]
 
 
 # <Parameter> -> <Expression> | <Name>
@@ -213,16 +554,12 @@ def Parameter1(pt, scope):
 # <Expression> -> <Term> ADD <Expression> | <Term> SUB <Expression> | <Term>
 def Expression0(pt, scope):
     # <Term> ADD <Expression>
-    L_value = func_by_name(pt[1][0], pt[1], scope)
-    R_value = func_by_name(pt[3][0], pt[3], scope)
-    return L_value + R_value
+    return fold_chain(pt, scope)
 
 
 def Expression1(pt, scope):
     # <Term> SUB <Expression>
-    L_value = func_by_name(pt[1][0], pt[1], scope)
-    R_value = func_by_name(pt[3][0], pt[3], scope)
-    return L_value - R_value
+    return fold_chain(pt, scope)
 
 
 def Expression2(pt, scope):
@@ -232,15 +569,11 @@ def Expression2(pt, scope):
 
 # <Term> -> <Factor> MULT <Term> | <Factor> DIV <Term> | <Factor>
 def Term0(pt, scope):
-    L_value = func_by_name(pt[1][0], pt[1], scope)
-    R_value = func_by_name(pt[3][0], pt[3], scope)
-    return L_value * R_value
+    return fold_chain(pt, scope)
 
 
 def Term1(pt, scope):
-    L_value = func_by_name(pt[1][0], pt[1], scope)
-    R_value = func_by_name(pt[3][0], pt[3], scope)
-    return L_value / R_value
+    return fold_chain(pt, scope)
 
 
 def Term2(pt, scope):
@@ -252,7 +585,7 @@ def Term2(pt, scope):
 def Factor0(pt, scope):
     L_value = func_by_name(pt[1][0], pt[1], scope)
     R_value = func_by_name(pt[3][0], pt[3], scope)
-    return L_value ^ R_value
+    return L_value ** R_value
 
 
 def Factor1(pt, scope):
@@ -261,6 +594,8 @@ def Factor1(pt, scope):
 
 def Factor2(pt, scope):
     # returns multiple values -- use the first by default.
+    if "FunctionCall1" == pt[1][0]:
+        return call_item(pt[1], scope, 0)
     return func_by_name(pt[1][0], pt[1], scope)
 
 
@@ -294,21 +629,8 @@ def FunctionCall0(pt, scope):
     Bonus: Flag an error if the index value is greater than the number of
         values returned by the function body.
     """
-    scope = {"__parent__": " "}
-    tree = func_by_name(pt[1][0], pt[1], scope)
-
-    param_names = tree[0][0]
-    param_values = func_by_name(pt[3][0], pt[3], scope)
-
-    param_list = []
-    param_list.append(param_values)
-
-    for i in range(len(param_list)):
-        scope[str(param_names[i])] = param_list[i]
-
     index = int(func_by_name(pt[5][0], pt[5], scope))
-
-    return func_by_name(tree[0][1][0], tree[0][1], scope)[index][0]
+    return call_item(pt, scope, index)
 
 
 def FunctionCall1(pt, scope):
@@ -325,16 +647,135 @@ def FunctionCall1(pt, scope):
         information.
     7. Return the list of values generated by the <FunctionBody>
     '''
-    scope = {"__parent__": " "}
-    tree = func_by_name(pt[1][0], pt[1], scope)
+    function = func_by_name(pt[1][0], pt[1], scope)[0]
+    param_values = func_by_name(pt[3][0], pt[3], scope)
+    return call_function(function, param_values, scope)
+
 
+def call_item(pt, scope, index):
+    """
+    Return the value with an index from the values a FunctionCall returns.
+
+    The body runs as usual, but the returned values that lazy.py says can
+    be skipped are only evaluated if the index is theirs.
+    """
+    function = func_by_name(pt[1][0], pt[1], scope)[0]
     param_values = func_by_name(pt[3][0], pt[3], scope)
-    param_names = tree[0][0]
+    flags = scope["__interpreter__"].skippable.get(id(function[1][-1]))
+    if flags is None or index < 0:
+        return call_function(function, param_values, scope)[index]
+    if len(function) > 2:
+        return call_memoized_item(function, param_values, scope, flags,
+                                  index)
+    return call_selected(function, param_values, scope, flags, index)
 
-    for i in range(len(param_values)):
-        scope[str(param_names[i])] = param_values[i]
 
-    return func_by_name(tree[0][1][0], tree[0][1], scope)
+def call_memoized_item(function, param_values, scope, flags, index):
+    """
+    call_selected() for a memoized function. The value is remembered on its
+    own, keyed by the arguments and the index: the values the call skips
+    might raise an error, so the whole list can't be computed for it.
+    """
+    table = function[2]
+    key = table.key(param_values)
+    if key is None:
+        return call_selected(function, param_values, scope, flags, index)
+    key = (key, index)
+    values = table.get(key)
+    if values is None:
+        values = [call_selected(function, param_values, scope, flags, index)]
+        table.put(key, values)
+    return values[0]
+
+
+def call_selected(function, param_values, scope, flags, index):
+    """
+    Run the body of a declared function with the parameter values and
+    return the returned value with an index, only evaluating the values
+    that the flags don't let it skip and that one.
+    """
+    body = function[1]
+    function_scope = bind_params(function, param_values, scope)
+    if "FunctionBody0" == body[0]:
+        func_by_name(body[1][0], body[1], function_scope)
+    value = None
+    position = 0
+    pt = body[-1][2]
+    while True:
+        if position == index or not flags[position]:
+            result = func_by_name(pt[1][0], pt[1], function_scope)
+            if position == index:
+                value = result
+        if len(pt) <= 2:
+            break
+        pt = pt[3]
+        position += 1
+    if index > position:
+        raise IndexError("list index out of range")
+    return value
+
+
+def call_function(function, param_values, scope):
+    """
+    Call a declared function with the parameter values and return the list
+    of values it returns.
+
+    A memoized function returns the values remembered for its arguments if
+    there are any, and otherwise remembers the ones its body returns.
+    """
+    if len(function) > 2:
+        table = function[2]
+        key = table.key(param_values)
+        if key is not None:
+            values = table.get(key)
+            if values is None:
+                values = call_body(function, param_values, scope)
+                table.put(key, values)
+            return values
+    return call_body(function, param_values, scope)
+
+
+def call_body(function, param_values, scope):
+    """Run the body of a declared function with the parameter values."""
+    body = function[1]
+    function_scope = bind_params(function, param_values, scope)
+    return func_by_name(body[0], body, function_scope)
+
+
+unprofiled_call_body = call_body
+unprofiled_call_selected = call_selected
+
+
+def profiled_call_body(function, param_values, scope):
+    """call_body() that also profiles the call; see enable_profile()."""
+    profile_enter(profile_names.get(id(function[1]), "<function>"))
+    try:
+        return unprofiled_call_body(function, param_values, scope)
+    finally:
+        profile_leave()
+
+
+def profiled_call_selected(function, param_values, scope, flags, index):
+    """call_selected() that also profiles the call."""
+    profile_enter(profile_names.get(id(function[1]), "<function>"))
+    try:
+        return unprofiled_call_selected(function, param_values, scope, flags,
+                                        index)
+    finally:
+        profile_leave()
+
+
+def bind_params(function, param_values, scope):
+    """
+    Return a new scope for a call of a declared function, with scope as its
+    __parent__ and the parameter values bound to the parameter names.
+    """
+    param_names = function[0]
+    function_scope = {"__parent__": scope,
+                      "__interpreter__": scope["__interpreter__"]}
+    for i in range(len(param_values)):
+        function_scope[param_names[i]] = param_values[i]
+    return function_scope
 
 
 # <FunctionCallParams> ->  <ParameterList> RPAREN | RPAREN
@@ -361,39 +802,73 @@ def Value1(pt, scope):
 
 
 # <Name> -> IDENT | SUB IDENT | ADD IDENT
+# the IDENT leaf is already the name (see prepare_tree)
 def Name0(pt, scope):
-    name = get_name_from_ident(pt[1])
+    name = pt[1]
     return [lookup_in_scope_stack(name, scope), name]
 
 
 def Name1(pt, scope):
-    name = get_name_from_ident(pt[2])
+    name = pt[2]
     return [-lookup_in_scope_stack(name, scope), name]
 
 
 def Name2(pt, scope):
-    name = get_name_from_ident(pt[2])
+    name = pt[2]
     return [lookup_in_scope_stack(name, scope), name]
 
 
 # <Number> -> NUMBER | SUB NUMBER | ADD NUMBER
+# the NUMBER leaf is already a float (see prepare_tree)
 def Number0(pt, scope):
-    return get_number_from_ident(pt[1])
+    return pt[1]
 
 
 def Number1(pt, scope):
-    return -get_number_from_ident(pt[2])
+    return -pt[2]
 
 
 def Number2(pt, scope):
-    return get_number_from_ident(pt[2])
+    return pt[2]
+
+
+atexit.register(flush_trace)
+if os.environ.get("QUIRK_TRACE"):
+    enable_trace(open_trace(os.environ["QUIRK_TRACE"]))
 
 
 if __name__ == '__main__':
-    # choose a parse tree and initial scope
-    given_tree = ""
-    for line in fileinput.input():
-        given_tree += line
-    tree = eval(given_tree)
+    arg_parser = argparse.ArgumentParser(description="Quirk interpreter")
+    arg_parser.add_argument("files", nargs="*")
+    arg_parser.add_argument("--trace", metavar="FILE",
+                            help="write a JSON lines trace of every evaluated "
+                                 "node to FILE ('-' for stderr)")
+    arg_parser.add_argument("--profile", metavar="FILE",
+                            help="write the time spent in each Quirk "
+                                 "function and top-level statement to FILE "
+                                 "as collapsed stacks ('-' for stderr)")
+    arg_parser.add_argument("--profile-stats", action="store_true",
+                            help="write a table of the time spent in each "
+                                 "Quirk function and statement to stderr")
+    args = arg_parser.parse_args()
+    if args.trace:
+        enable_trace(open_trace(args.trace))
+    if args.profile or args.profile_stats:
+        enable_profile()
 
-    func_by_name(tree[0], tree, {})
+    # choose a parse tree and initial scope
+    given_tree = b"".join(fileinput.input(files=args.files, mode="rb"))
+    if treeformat.is_binary_tree(given_tree):
+        tree = treeformat.read_tree(given_tree)
+    else:
+        # the pretty-printed text format from parser.py --text
+        tree = ast.literal_eval(given_tree.decode("utf-8"))
+
+    Interpreter(tree).run()
+    if args.profile:
+        profile_stream = open_trace(args.profile)
+        write_collapsed_stacks(profile_stream)
+        if profile_stream is not sys.stderr:
+            profile_stream.close()
+    if args.profile_stats:
+        sys.stderr.write(profile_report())
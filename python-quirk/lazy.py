@@ -0,0 +1,64 @@
+"""
+Lazy evaluation of the values a Quirk function returns.
+
+A call that only uses one of the values a function returns - f(x):k, or a
+plain f(x) in an expression, which uses the first - doesn't need the others.
+Every engine runs the whole body of the function for such a call, but only
+evaluates the returned values that are needed: value k, and any value whose
+expression could print something. A value can be skipped if every function
+its expression calls is pure (see memo.pure_functions()), since those never
+print; names and arithmetic have no effect besides their value.
+
+    function stats(a){
+      var s = a * a
+      return s + 1, slow(s), s ^ 0.5
+    }
+    print stats(4):2
+
+only evaluates s ^ 0.5 if slow() is pure. A skipped value that would have
+raised an error (or never finished) no longer does. Calls with a negative
+index and <MultipleAssignment>s evaluate every value, as before. A memoized
+function (see memo.py) remembers the value such a call selects apart from
+the whole list of values, keyed by the arguments and the index, so turning
+memoization on doesn't change what a program does.
+
+skippable_values() finds the values that can be skipped once per program,
+before it runs.
+"""
+import memo
+
+
+def skippable_values(tree):
+    """
+    Return a dict with a tuple of flags for every Return0 node of a program
+    tree that returns more than one value and has values that can be
+    skipped, keyed by the id() of the node. A flag is True for a value that
+    can be skipped.
+
+    Works on parse trees as they come from the parser and on the copies
+    interpreter.prepare_tree() makes.
+    """
+    (declarations, stable) = memo.declared_functions(tree)
+    pure = memo.pure_functions(tree)
+    pure_names = set(name for (name, node) in stable.items()
+                     if id(node) in pure)
+
+    skippable = {}
+    for node in declarations:
+        ret = node[6][-1]
+        values = memo.chain_items(ret[2], 3)
+        flags = tuple(calls_only(value, pure_names) for value in values)
+        if len(flags) > 1 and any(flags):
+            skippable[id(ret)] = flags
+    return skippable
+
+
+def calls_only(pt, names):
+    """Return True if every function the subtree pt calls is in names."""
+    stack = [pt]
+    while stack:
+        node = stack.pop()
+        if node[0] in memo.call_labels and memo.name_of(node[1]) not in names:
+            return False
+        stack.extend(child for child in node[1:] if isinstance(child, list))
+    return True
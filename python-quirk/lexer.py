@@ -1,5 +1,7 @@
-import sys
 import re
+import sys
+import enum
+import mmap
 
 # Quirk keywords
 keywords = [
@@ -28,78 +30,264 @@ tokenLexeme = [
     ('IDENT', r'[a-zA-Z]+[a-zA-Z0-9_]*')
 ]
 
+# So we don't confuse a skip sequence as a true tokenLexeme pair we keep it
+# out of tokenLexeme; it isn't part of Quirk grammar, it's used to ignore
+# spaces and newlines while lexing.
+skipToken = ('SKIP', r'\s+')
+
+
+# The lexemes of the tokens that always have the same text (the keywords and
+# the one character patterns of tokenLexeme, without their escaping).
+fixedLexemes = dict(keywords +
+                    [(kind, re.sub(r'[\\\[\]]', '', pattern))
+                     for (kind, pattern) in tokenLexeme
+                     if kind not in ('NUMBER', 'IDENT')])
+
+# regex joins all pairs in tokenLexeme list to be used to see if any token is
+# within the string passed in. It is compiled once, when the module is
+# imported, in a str version and a bytes version (for mmapped files).
+masterRegex = '|'.join('(?P<%s>%s)' % pair
+                       for pair in tokenLexeme + [skipToken])
+masterPattern = re.compile(masterRegex)
+masterBytesPattern = re.compile(masterRegex.encode('ascii'))
+
+# Token kinds as small ints, in the order of keywords and tokenLexeme, plus
+# the EOF marker the parser requires.
+TokenKind = enum.IntEnum('TokenKind',
+                         [pair[0] for pair in keywords + tokenLexeme] +
+                         ['EOF'], start=0)
+
+# The kinds are also module globals (lexer.ADD, lexer.IDENT, ...), which are
+# much quicker to look up in the parser's inner loops than TokenKind.ADD.
+globals().update(TokenKind.__members__)
 
-def lex(stringToLex):
+# keyword lexeme -> keyword kind
+keywordKinds = dict((lexeme, TokenKind[token])
+                    for (token, lexeme) in keywords)
+
+
+class Token(object):
     """
-    Lex uses regex functionality to create token and token lexeme pairs.
+    A lexed token.
 
-    Returns list of token and token lexeme pairs that will be passed to the
-    parser.
+    kind - its TokenKind
+    lexeme - the (interned) source text it was lexed from
+    text - the KIND:lexeme text form, e.g. 'IDENT:x', or just the kind name,
+        e.g. 'ADD', for tokens other than IDENT and NUMBER. This is what
+        lexer.py writes out and what parse trees hold.
+
+    Tokens don't change, so the lexer makes one Token per distinct lexeme and
+    hands out the same object every time it is matched. Where each one was
+    matched is recorded separately, in the offsets array that lex_stream()
+    can fill in.
     """
-    # will hold lexed items
-    lexedList = []
-    currentIndex = 0
-
-    # regex joins all pairs in tokenLexeme list to be used to see if
-    # any token is within the string passed in
-    myRegex = '|'.join('(?P<%s>%s)' % pair for pair in tokenLexeme)
-    matchedToken = re.compile(myRegex).match
-
-    current = matchedToken(stringToLex)
-    # while there's still more of the string to search through...
-    while current is not None:
-        # get the current group to check
+
+    __slots__ = ("kind", "lexeme", "text")
+
+    def __init__(self, kind, lexeme):
+        self.kind = kind
+        self.lexeme = sys.intern(lexeme)
+        if kind in (TokenKind.IDENT, TokenKind.NUMBER):
+            self.text = sys.intern(kind.name + ':' + lexeme)
+        else:
+            self.text = kind.name
+
+    def __repr__(self):
+        return 'Token(%s, %r)' % (self.kind.name, self.lexeme)
+
+
+# The EOF marker the parser requires after the last token
+eofToken = Token(TokenKind.EOF, '')
+
+
+def lex_stream(stringToLex, offsets=None, start=0, end=None,
+               positions=None):
+    """
+    Generate the Tokens of stringToLex, one at a time.
+
+    stringToLex can be a str or a bytes-like object such as an mmap of a
+    source file. The whole input is scanned in one pass with the precompiled
+    master pattern, and each token is yielded as soon as it is matched, so
+    the caller can start consuming tokens before the input has been scanned.
+    Raises an Exception at the first character that isn't part of a token.
+
+    offsets - if given, a list or array that the position of the first
+        character of each token in the source is appended to, just before
+        the token is yielded.
+    start, end - lex only stringToLex[start:end]. Offsets, and the line and
+        column of an unexpected char, still count from the start of
+        stringToLex.
+    positions - if given, a list that the (line, column) of each token is
+        appended to like offsets, and once the input has been scanned, that
+        of its end. Lines are counted from the newlines in the whitespace
+        the scan skips, so the source isn't scanned again for them.
+    """
+    if end is None:
+        end = len(stringToLex)
+    # matched text -> Token, so each distinct lexeme is classified and
+    # interned only once. Keywords match the IDENT pattern too, so they're
+    # entered up front.
+    known = {}
+    if isinstance(stringToLex, str):
+        scanner = masterPattern.scanner(stringToLex, start, end)
+        decode = str
+        for (lexeme, kind) in keywordKinds.items():
+            known[lexeme] = Token(kind, lexeme)
+    else:
+        scanner = masterBytesPattern.scanner(stringToLex, start, end)
+        decode = lambda val: val.decode('ascii')
+        for (lexeme, kind) in keywordKinds.items():
+            known[lexeme.encode('ascii')] = Token(kind, lexeme)
+
+    if positions is not None:
+        newline = '\n' if isinstance(stringToLex, str) else b'\n'
+        (line, lineStart) = (1, 0)
+        if start > 0:
+            (line, column) = line_column(stringToLex, start)
+            lineStart = start - column + 1
+
+    currentIndex = start
+    current = None
+    for current in iter(scanner.match, None):
         typ = current.lastgroup
-        # if the current group isn't 'SKIP' token (it's a something we care
-        # about) ...
-        if typ != 'SKIP':
-            val = current.group(typ)
-            if typ == 'IDENT':
-                found = False
-                for pair in keywords:
-                    if pair[1] == val:
-                        # If this condition is met, it's not actually an ident!
-                        # It's a keyword. Therefore we should add the keywords
-                        # to our lexedList directly.
-                        lexedList.append((pair[0]))
-                        found = True
-                        break
-                if found is False:
-                    # If this condition is met, we know for sure it's an IDENT.
-                    # We append the ident token lexeme pair to our lexedList.
-                    lexedList.append(("IDENT" + ":" + val))
-            elif typ == 'NUMBER':
-                # If this condition is met, we know that it's a NUMBER and
-                # can directionly append it to our lexedList.
-                lexedList.append(("NUMBER" + ":" + str(val)))
-            else:
-                # Since it's a mached token and isn't a keyword, ident, or
-                # or number, we know it must be another token. We can add this
-                # directly to our lexedList.
-                lexedList.append((typ))
-
-        # updates our currentIndex
         currentIndex = current.end()
-        # updates our current matchedToken based off our new index
-        current = matchedToken(stringToLex, currentIndex)
+        if typ == 'SKIP':
+            if positions is not None:
+                val = current.group()
+                newlines = val.count(newline)
+                if newlines:
+                    line += newlines
+                    lineStart = current.start() + val.rfind(newline) + 1
+            continue
+        val = current.group()
+        token = known.get(val)
+        if token is None:
+            token = known[val] = Token(TokenKind[typ], decode(val))
+        if offsets is not None:
+            offsets.append(current.start())
+        if positions is not None:
+            positions.append((line, current.start() - lineStart + 1))
+        yield token
 
-    if currentIndex != len(stringToLex):
-        raise Exception('Unexpected char %s' % (stringToLex[currentIndex]))
+    # drop the references into the input (an mmap can't be closed while a
+    # match or the scanner still points into it)
+    scanner = current = None
+    if currentIndex != end:
+        char = stringToLex[currentIndex:currentIndex + 1]
+        if not isinstance(char, str):
+            char = char.decode('ascii', 'replace')
+        raise Exception('Unexpected char %s at line %d, column %d' %
+                        ((char,) + line_column(stringToLex, currentIndex)))
+    if positions is not None:
+        positions.append((line, end - lineStart + 1))
 
-    return lexedList
 
+def line_column(stringToLex, offset):
+    """
+    Return the (line, column) of offset in stringToLex, both counting from 1.
+
+    Only the text before offset is scanned, and only when asked, so token
+    positions can be kept as plain offsets and turned into lines and columns
+    when an error is reported.
+    """
+    if isinstance(stringToLex, mmap.mmap):
+        # an mmap has no count()
+        stringToLex = stringToLex[:offset]
+    newline = '\n' if isinstance(stringToLex, str) else b'\n'
+    line = stringToLex.count(newline, 0, offset) + 1
+    column = offset - (stringToLex.rfind(newline, 0, offset) + 1) + 1
+    return (line, column)
+
+
+def read_tokens(tokenText, positions=None):
+    """
+    Return the list of Tokens written out in the text form by lexer.py, e.g.
+    'VAR IDENT:x ASSIGN NUMBER:2 EOF'. Each token may be followed by its line
+    and column, as in 'VAR@1:1', which is how lexer.py writes them.
+
+    positions - if given, a list that gets the position of each token as
+        written, e.g. '3:12' for line 3, column 12, or None for a token
+        written without one. position_text() reads them.
+    """
+    tokens = []
+    known = {}
+    for text in tokenText.split():
+        (text, at, position) = text.partition('@')
+        if positions is not None:
+            positions.append(position if at else None)
+        token = known.get(text)
+        if token is None:
+            (kind, colon, lexeme) = text.partition(':')
+            if kind not in TokenKind.__members__:
+                raise Exception('Unknown token %s' % (text))
+            if not colon:
+                lexeme = fixedLexemes.get(kind, '')
+            token = known[text] = Token(TokenKind[kind], lexeme)
+        tokens.append(token)
+    return tokens
+
+
+def position_text(positions, index):
+    """
+    Return where the token at index of a read_tokens() list is, e.g.
+    'line 3, column 12' from positions, or 'token 7' if it was written
+    without its position.
+    """
+    if index < len(positions) and positions[index] is not None:
+        (line, colon, column) = positions[index].partition(':')
+        return 'line %d, column %d' % (int(line), int(column))
+    return 'token %d' % index
 
-if __name__ == '__main__':
-    lexerOutput = ""
-    # So we don't confuse a skip sequence as a true tokenLexeme pair...
-    # we're going to add it here for clarity.
-    tokenLexeme.append(('SKIP', r'[\s+]|\n'))
 
-    # Reads all input from cmd line, lexes it, and adds it to lexerOutput string
-    for part in sys.stdin.readlines():
-        lexerOutput += ' '.join(lex(part))
+def lex_file(path, positions=None):
+    """
+    Generate the tokens of the source file at path, scanning an mmap of the
+    file instead of reading it into memory first. positions is passed on to
+    lex_stream().
+    """
+    with open(path, 'rb') as sourceFile:
+        if 0 == len(sourceFile.read(1)):
+            # an empty file can't be mmapped
+            return
+        with mmap.mmap(sourceFile.fileno(), 0,
+                       access=mmap.ACCESS_READ) as sourceMap:
+            for token in lex_stream(sourceMap, positions=positions):
+                yield token
+
+
+def lex(stringToLex, offsets=None, start=0, end=None):
+    """
+    Lex uses regex functionality to create token and token lexeme pairs.
+
+    Returns the list of Tokens (see lex_stream) that will be passed to the
+    parser.
+    """
+    return list(lex_stream(stringToLex, offsets, start, end))
+
+
+if __name__ == '__main__':
+    # Lexes the named files (or all of stdin) in one pass and writes the
+    # tokens out in the text form as they are produced, in chunks, each with
+    # its line and column so the parsers can say where a syntax error is.
+    positions = []
+    if len(sys.argv) > 1:
+        tokenStreams = [lex_file(path, positions) for path in sys.argv[1:]]
+    else:
+        tokenStreams = [lex_stream(sys.stdin.read(), positions=positions)]
 
-    # Parser requries EOF marker
-    lexerOutput += " EOF"
+    chunk = []
+    end = (1, 1)
+    for tokens in tokenStreams:
+        for token in tokens:
+            (line, column) = positions.pop()
+            chunk.append('%s@%d:%d' % (token.text, line, column))
+            if len(chunk) >= 4096:
+                chunk.append('')
+                sys.stdout.write(' '.join(chunk))
+                chunk = []
+        if positions:
+            end = positions.pop()
 
-    print(lexerOutput)
+    # Parser requries EOF marker, which is at the end of the input
+    chunk.append('EOF@%d:%d' % end)
+    print(' '.join(chunk))
@@ -0,0 +1,297 @@
+"""
+Memoization of pure Quirk functions.
+
+Off by default. With memo_size set above 0, every engine remembers the
+results of the pure functions of the programs it runs: each function gets a
+MemoTable, made when its declaration runs, that maps argument values to the
+list of values the function returned, keeping the memo_size most recently
+used. A call whose arguments are in the table returns the remembered list
+without running the body.
+
+Quirk functions can only affect anything outside their own scope by
+printing, but names are scoped dynamically, so a function's result can still
+depend on more than its arguments. pure_functions() only picks a function
+whose body
+
+    - has no <Print> and declares no functions,
+    - reads no names besides its parameters and the variables it has
+      already assigned,
+    - only calls stable functions - ones declared once at the top level
+      whose name nothing else in the program binds - that are pure
+      themselves (recursion is fine), passing them all their parameters.
+
+Calls that leave parameters out (they would be looked up in the caller) or
+pass arguments that aren't numbers are run without the table.
+
+stats() reports the hits, misses and evictions of every function since the
+last reset_stats(). Only the counts are kept for that: a MemoTable belongs to
+the run that declared its function and goes away with it, so a process that
+runs many programs doesn't hold on to their results.
+"""
+import struct
+import collections
+
+# Results remembered per function; 0 turns memoization off
+memo_size = 0
+
+# The MemoCounts of every function name with a MemoTable made since
+# reset_stats()
+function_counts = {}
+
+name_labels = {"Name0", "Name1", "Name2"}
+call_labels = {"FunctionCall0", "FunctionCall1"}
+
+
+class MemoCounts(object):
+    """
+    The counts of the MemoTables of one function name.
+
+    hits, misses, evictions, uncached - summed over the tables; see MemoTable
+    entries - the results the tables remembered, less the ones they dropped
+    """
+
+    __slots__ = ("hits", "misses", "evictions", "uncached", "entries")
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.uncached = 0
+        self.entries = 0
+
+
+class MemoTable(object):
+    """
+    The remembered results of one declared function.
+
+    name - the function's name
+    results - argument key -> list of returned values, least recently used
+        first
+    counts - the MemoCounts of the name, where the table counts its lookups
+        that found a result (hits) and ones that didn't (misses), the
+        results it dropped to stay within memo_size (evictions) and the
+        calls run without it (uncached, see key())
+    """
+
+    __slots__ = ("name", "pack", "results", "max_size", "counts")
+
+    def __init__(self, name, arity):
+        self.name = name
+        self.pack = struct.Struct("%dd" % arity).pack
+        self.results = collections.OrderedDict()
+        self.max_size = memo_size
+        self.counts = function_counts.setdefault(name, MemoCounts())
+
+    def key(self, values):
+        """
+        Return the key for the argument values of a call, or None if the
+        call can't use the table.
+
+        The values are packed as doubles, which keeps 0.0 and -0.0 apart and
+        fails unless there is one number for every parameter.
+        """
+        try:
+            return self.pack(*values)
+        except (struct.error, TypeError):
+            self.counts.uncached += 1
+            return None
+
+    def get(self, key):
+        """Return the remembered result for key, or None."""
+        result = self.results.get(key)
+        if result is None:
+            self.counts.misses += 1
+            return None
+        self.results.move_to_end(key)
+        self.counts.hits += 1
+        return result
+
+    def put(self, key, result):
+        """Remember result for key, dropping the least recently used."""
+        self.results[key] = result
+        self.counts.entries += 1
+        if len(self.results) > self.max_size:
+            self.results.popitem(last=False)
+            self.counts.evictions += 1
+            self.counts.entries -= 1
+
+
+def stats():
+    """
+    Return a dict for each memoized function name with its hits, misses,
+    evictions and uncached calls and how many results are remembered, summed
+    over the tables made since reset_stats().
+    """
+    return [{"function": name, "hits": counts.hits,
+             "misses": counts.misses, "evictions": counts.evictions,
+             "uncached": counts.uncached, "entries": counts.entries}
+            for (name, counts) in sorted(function_counts.items())]
+
+
+def reset_stats():
+    """Zero the counts."""
+    function_counts.clear()
+
+
+# start purity analysis
+def pure_functions(tree):
+    """
+    Return the set of id()s of the FunctionDeclaration0 nodes of a program
+    tree whose calls can be memoized, as described at the top.
+
+    Works on parse trees as they come from the parser and on the copies
+    interpreter.prepare_tree() makes.
+    """
+    (declarations, stable) = declared_functions(tree)
+
+    # id of each candidate -> ids of the functions it calls
+    calls = {}
+    for node in declarations:
+        callees = pure_body_callees(node, stable)
+        if callees is not None:
+            calls[id(node)] = callees
+
+    # drop the candidates that call a function that was dropped
+    changed = True
+    while changed:
+        changed = False
+        for (key, callees) in list(calls.items()):
+            if not callees.issubset(calls):
+                del calls[key]
+                changed = True
+    return set(calls)
+
+
+def declared_functions(tree):
+    """
+    Return the list of every FunctionDeclaration0 node of a program tree,
+    however deeply nested, and a dict of its stable functions: name ->
+    declaration.
+    """
+    bindings = collections.Counter()
+    top_level = {}
+    declarations = []
+    stack = [(tree, True)]
+    while stack:
+        (program, is_top_level) = stack.pop()
+        for statement in chain_items(program, 2):
+            node = statement[1]
+            if "FunctionDeclaration0" == node[0]:
+                name = name_of(node[2])
+                bindings[name] += 1
+                bindings.update(function_params(node))
+                declarations.append(node)
+                if is_top_level:
+                    top_level[name] = node
+                if "FunctionBody0" == node[6][0]:
+                    stack.append((node[6][1], False))
+            elif "Print0" != node[0]:
+                bindings.update(assigned_names(node[1]))
+    stable = dict((name, node) for (name, node) in top_level.items()
+                  if 1 == bindings[name])
+    return (declarations, stable)
+
+
+def pure_body_callees(declaration, stable):
+    """
+    Return the set of ids of the stable functions a FunctionDeclaration0
+    calls, or None if its body does anything else that makes it impure.
+    """
+    bound = set(function_params(declaration))
+    callees = set()
+    body = declaration[6]
+    statements = []
+    if "FunctionBody0" == body[0]:
+        statements = chain_items(body[1], 2)
+    for statement in statements:
+        node = statement[1]
+        if node[0] in ("FunctionDeclaration0", "Print0"):
+            return None
+        assignment = node[1]
+        if not reads_only(assignment[4], bound, stable, callees):
+            return None
+        if "SingleAssignment0" == assignment[0]:
+            bound.add(name_of(assignment[2]))
+        elif "FunctionCall1" == assignment[4][0]:
+            # names past the values the function returns stay unbound
+            callee = stable[name_of(assignment[4][1])]
+            count = len(chain_items(callee[6][-1][2], 3))
+            bound.update(name_list(assignment[2])[:count])
+    if not reads_only(body[-1], bound, stable, callees):
+        return None
+    return callees
+
+
+def reads_only(pt, bound, stable, callees):
+    """
+    Return True if every name the subtree pt reads is bound, and every
+    function it calls is a stable one given all of its parameters. The ids of
+    the functions called are added to callees.
+    """
+    stack = [pt]
+    while stack:
+        node = stack.pop()
+        if node[0] in name_labels:
+            if name_of(node) not in bound:
+                return False
+        elif node[0] in call_labels:
+            callee = stable.get(name_of(node[1]))
+            if callee is None:
+                return False
+            arguments = call_arguments(node)
+            if len(arguments) != len(function_params(callee)):
+                return False
+            callees.add(id(callee))
+            stack.extend(arguments)
+        else:
+            stack.extend(child for child in node[1:]
+                         if isinstance(child, list))
+    return True
+# end purity analysis
+
+
+# start utilities
+def name_of(pt):
+    """Return the identifier of a Name subtree (the IDENT is always last)."""
+    tok = pt[-1]
+    return tok[tok.find(":") + 1:]
+
+
+def chain_items(pt, link):
+    """
+    Return the operand subtrees of a right-recursive chain, in order. link is
+    the index of the rest of the chain.
+    """
+    items = []
+    while len(pt) > 2:
+        items.append(pt[1])
+        pt = pt[link]
+    items.append(pt[1])
+    return items
+
+
+def name_list(pt):
+    """Return the identifiers of a NameList chain, in order."""
+    return [name_of(name) for name in chain_items(pt, 3)]
+
+
+def function_params(pt):
+    """Return the parameter names of a FunctionDeclaration0."""
+    if "FunctionParams0" == pt[4][0]:
+        return name_list(pt[4][1])
+    return []
+
+
+def call_arguments(pt):
+    """Return the argument subtrees of a FunctionCall0 or FunctionCall1."""
+    if "FunctionCallParams0" == pt[3][0]:
+        return chain_items(pt[3][1], 3)
+    return []
+
+
+def assigned_names(pt):
+    """Return the names a SingleAssignment0 or MultipleAssignment0 binds."""
+    if "SingleAssignment0" == pt[0]:
+        return [name_of(pt[2])]
+    return name_list(pt[2])
+# end utilities
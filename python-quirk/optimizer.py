@@ -0,0 +1,578 @@
+"""
+Optimization pass over Quirk parse trees.
+
+optimize() returns a smaller copy of a parse tree that every engine runs
+the same way as the original:
+
+    - Constant subtrees are folded into a single <Number>: 2 ^ 8 becomes
+      256, (3 * 4) / 2 becomes 6, and the constant end of an operator chain
+      such as x * 2 * 3 becomes x * 6. Quirk's operators group from the
+      right, so a constant prefix like the 2 * 3 of 2 * 3 * x is left alone.
+      Operations that would raise an error, such as 1 / 0, aren't folded.
+    - Multiplying or dividing by 1, subtracting 0 and raising to the power
+      of 1 are dropped when the other operand can only be a float - a
+      number, or numbers joined by +, -, * and / - as they give back a float
+      exactly. A name or a call may give anything (an unbound name gives
+      None, which raises an error), so (2 + 3 * y) * 1 is left alone.
+    - Pass-through nodes are collapsed: wherever an engine evaluates an
+      expression, the <Expression> -> <Term> -> <Factor> -> <Value> chain
+      (and <Parameter> and parentheses) down to a number, a name or an
+      operator is replaced by that node, so 'print 1' runs Number0 straight
+      from Print0.
+    - Calls of small functions are inlined; see inline_call().
+
+The collapsed trees aren't ones the parser would produce, but all of
+interpreter.py, compiler.py and bytecode.py only look at the label of the
+node an expression starts with. Works on parse trees as they come from the
+parser (not on interpreter.prepare_tree() copies).
+
+In the pipeline it goes between the parser and an engine and reads and
+writes the binary tree format:
+
+    python lexer.py < x.q | python parser.py | python optimizer.py |
+        python interpreter.py
+
+stats() reports how many nodes the calls to optimize() since reset_stats()
+eliminated, and how many calls they inlined.
+"""
+import ast
+import sys
+import math
+import pprint
+import threading
+import argparse
+import operator
+import fileinput
+
+import memo
+import lazy
+import treeformat
+
+pp = pprint.PrettyPrinter(indent=1, depth=100)
+
+# Counts summed over the calls to optimize() since reset_stats(): nodes in
+# the trees given and returned, operations folded and dropped, and calls
+# inlined
+counts = {"nodes_before": 0, "nodes_after": 0, "folded": 0,
+          "simplified": 0, "inlined": 0}
+
+# The most nodes the value a call is replaced with may have; 0 turns
+# inlining off
+inline_size = 40
+
+# While optimize() runs: the functions whose calls can be inlined, as name ->
+# [parameter names, Return0 values, the values optimized or None], the names
+# of the pure functions, the functions being inlined or optimized, whose
+# calls aren't inlined again, the ones whose declaration has been optimized,
+# which calls from then on always find bound, and the function bodies (and
+# inlined values) being optimized, innermost last
+inline_functions = {}
+pure_names = set()
+inlining = set()
+declared = set()
+enclosing = []
+
+# Held by optimize(), since the sets above are shared by every thread
+optimize_lock = threading.Lock()
+
+chain_operators = {
+    "Expression0": operator.add,
+    "Expression1": operator.sub,
+    "Term0": operator.mul,
+    "Term1": operator.truediv,
+}
+
+chain_tokens = {
+    "Expression0": "ADD",
+    "Expression1": "SUB",
+    "Term0": "MULT",
+    "Term1": "DIV",
+}
+
+number_labels = {"Number0", "Number1", "Number2"}
+
+
+def optimize(tree):
+    """Return the optimized copy of a program parse tree."""
+    with optimize_lock:
+        find_inline_functions(tree)
+        try:
+            optimized = optimize_tree(tree)
+        finally:
+            inline_functions.clear()
+            pure_names.clear()
+            inlining.clear()
+            declared.clear()
+            del enclosing[:]
+        counts["nodes_before"] += count_nodes(tree)
+        counts["nodes_after"] += count_nodes(optimized)
+    return optimized
+
+
+def stats():
+    """Return the counts since reset_stats(), with the nodes eliminated."""
+    result = dict(counts)
+    result["eliminated"] = counts["nodes_before"] - counts["nodes_after"]
+    return result
+
+
+def reset_stats():
+    """Zero the counts."""
+    for key in counts:
+        counts[key] = 0
+
+
+def optimize_tree(pt):
+    """
+    Return the optimized copy of the subtree pt. Nodes without a function
+    of their own are copied with their children optimized; Name, Number
+    and NameList subtrees are shared with the original tree.
+    """
+    optimizer = globals().get("optimize_" + pt[0])
+    if optimizer is not None:
+        return optimizer(pt)
+    return [optimize_tree(child) if isinstance(child, list) else child
+            for child in pt]
+
+
+# start utilities
+def count_nodes(tree):
+    """Return the number of nodes (lists) in a tree."""
+    count = 0
+    stack = [tree]
+    while stack:
+        pt = stack.pop()
+        count += 1
+        stack.extend(child for child in pt if isinstance(child, list))
+    return count
+
+
+def chain_items(pt, link):
+    """
+    Return the operand subtrees of a right-recursive chain, in order. link is
+    the index of the rest of the chain.
+    """
+    items = []
+    while len(pt) > 2:
+        items.append(pt[1])
+        pt = pt[link]
+    items.append(pt[1])
+    return items
+
+
+def constant_of(pt):
+    """Return the value of a Number subtree, or None for any other node."""
+    if pt[0] not in number_labels:
+        return None
+    tok = pt[-1]
+    value = float(tok[tok.find(":") + 1:])
+    if "Number1" == pt[0]:
+        return -value
+    return value
+
+
+def make_number(value):
+    """Return a Number subtree for a float value."""
+    return ["Number0", "NUMBER:" + repr(value)]
+
+
+def fold(op, left, right):
+    """
+    Return the Number subtree for op applied to two constants, or None if
+    that raises an error or doesn't give a float (a negative number to a
+    fractional power gives a complex number).
+    """
+    try:
+        value = op(left, right)
+    except ArithmeticError:
+        return None
+    if not isinstance(value, float):
+        return None
+    counts["folded"] += 1
+    return make_number(value)
+
+
+def is_float(pt):
+    """
+    Return True if an optimized subtree can only evaluate to a float (or
+    raise an error): a number, or numbers joined by +, -, * and /. Names
+    and calls can give anything, and ^ a complex number.
+    """
+    stack = [pt]
+    while stack:
+        node = stack.pop()
+        if node[0] in chain_operators:
+            stack.extend([node[1], node[3]])
+        elif node[0] in ("Expression2", "Term2"):
+            stack.append(node[1])
+        elif node[0] not in number_labels:
+            return False
+    return True
+
+
+def simplify(left, label, right):
+    """
+    Return the single node that left <op> right, joined in a chain by the
+    node label, can be replaced with, or None if it can't be.
+    """
+    a = constant_of(left)
+    b = constant_of(right)
+    if a is not None and b is not None:
+        return fold(chain_operators[label], a, b)
+
+    # only x - 0.0 gives back x exactly; x - -0.0 turns -0.0 into 0.0
+    if (("Term0" == label and 1.0 == b) or ("Term1" == label and 1.0 == b) or
+            ("Expression1" == label and 0.0 == b and
+             math.copysign(1.0, b) > 0)) and is_float(left):
+        counts["simplified"] += 1
+        return left
+    if "Term0" == label and 1.0 == a and is_float(right):
+        counts["simplified"] += 1
+        return right
+    return None
+# end utilities
+
+
+# start inlining
+def find_inline_functions(tree):
+    """
+    Find the functions of a program tree whose calls can be inlined: the
+    stable ones (see memo.py), so a call by their name always calls them,
+    whose body is just a <Return>.
+    """
+    if inline_size <= 0:
+        return
+    (declarations, stable) = memo.declared_functions(tree)
+    pure = memo.pure_functions(tree)
+    for (name, node) in stable.items():
+        if id(node) in pure:
+            pure_names.add(name)
+        if "FunctionBody1" == node[6][0]:
+            inline_functions[name] = [memo.function_params(node),
+                                      memo.chain_items(node[6][1][2], 3),
+                                      None]
+
+
+def inline_call(call, index):
+    """
+    Return the expression that replaces the FunctionCall call, whose value
+    is its returned value with an index, or None if it can't be inlined.
+
+    The expression is the function's returned value with every use of a
+    parameter replaced by the argument's expression. Quirk scopes names
+    dynamically, so any other name the value reads is looked up from the
+    caller's scope after the call as well as before. A call is only inlined
+    if that gives the same result:
+
+        - the function isn't being inlined already (no recursion), and its
+          declaration comes before the call, or before the declaration of
+          the function the call is in, so the call can't run before the
+          function is bound
+        - there are no more arguments than parameters; a parameter left out
+          stays a name, which is looked up in the caller's scope as before
+        - the index is in range and the value is at most inline_size nodes;
+          a negative index like f(x):-1 makes every engine evaluate all the
+          returned values, so those calls are never inlined
+        - the values that aren't returned only call pure functions, so
+          leaving them out is what the engines' lazy calls do (see lazy.py)
+        - every argument is a number or a plain name, whose value can't
+          raise an error, so it can be read any number of times, in any
+          order, or not at all; arithmetic like nope + 1 or 1 / 0 can
+          raise one, and the call would raise it before the body ran
+        - no parameter is called as a function
+        - inside a function body, the function is pure (see memo.py) and
+          the call gives it every argument. lazy.py skips a returned value
+          if the functions it calls are pure, so inlining mustn't make the
+          function the call is in purer (by removing a call of an impure
+          function) or less pure (by leaving it a parameter to read)
+        - the value calls no function if the function has parameters: a
+          function called from the body looks up the names it doesn't bind
+          in the inlined function's scope first, where the parameters are
+    """
+    name = memo.name_of(call[1])
+    function = inline_functions.get(name)
+    if function is None or name in inlining or name not in declared:
+        return None
+    (params, values, optimized) = function
+    args = []
+    if "FunctionCallParams0" == call[3][0]:
+        args = chain_items(call[3][1], 3)
+    if len(args) > len(params):
+        return None
+    if enclosing and (name not in pure_names or len(args) < len(params)):
+        return None
+    if not 0 <= index < len(values):
+        return None
+
+    if optimized is None:
+        inlining.add(name)
+        enclosing.append(name)
+        try:
+            optimized = function[2] = [optimize_tree(value)
+                                       for value in values]
+        finally:
+            inlining.discard(name)
+            enclosing.pop()
+    value = optimized[index]
+    if count_nodes(value) > inline_size:
+        return None
+    unused = optimized[:index] + optimized[index + 1:]
+    if not all(lazy.calls_only(pt, pure_names) for pt in unused):
+        return None
+    for arg in args:
+        if constant_of(arg) is None and not (
+                "Value0" == arg[0] and "Name0" == arg[1][0]):
+            return None
+    if params and not lazy.calls_only(value, ()):
+        return None
+    bound = dict(zip(params, args))
+    if param_uses(value, bound) is None:
+        return None
+
+    inlining.add(name)
+    try:
+        expression = optimize_tree(substitute(value, bound))
+    finally:
+        inlining.discard(name)
+    counts["inlined"] += 1
+    return expression
+
+
+def param_uses(pt, bound):
+    """
+    Return a dict with the number of times the subtree pt reads each name in
+    bound, or None if it calls one of them.
+    """
+    uses = dict.fromkeys(bound, 0)
+    stack = [pt]
+    while stack:
+        node = stack.pop()
+        if "Value0" == node[0]:
+            name = memo.name_of(node[1])
+            if name in uses:
+                uses[name] += 1
+        elif node[0] in memo.call_labels and memo.name_of(node[1]) in uses:
+            return None
+        else:
+            stack.extend(child for child in node[1:]
+                         if isinstance(child, list))
+    return uses
+
+
+def substitute(pt, bound):
+    """
+    Return a copy of the subtree pt with each Value0 that reads a name in
+    bound replaced by the name's value, a Number or a Value0 of a plain
+    name. -name and +name keep their sign: -p given 3 becomes -3, and given
+    x becomes -x, which raises an error if x isn't a number, as -p did.
+    """
+    if "Value0" == pt[0]:
+        name = memo.name_of(pt[1])
+        if name not in bound:
+            return pt
+        arg = bound[name]
+        value = constant_of(arg)
+        if value is None:
+            return ["Value0", pt[1][:-1] + arg[1][-1:]]
+        if "Name1" == pt[1][0]:
+            return make_number(-value)
+        return make_number(value)
+    return [substitute(child, bound) if isinstance(child, list) else child
+            for child in pt]
+# end inlining
+
+
+# <Program> -> <Statement> <Program> | <Statement>
+def optimize_Program0(pt):
+    statements = [optimize_tree(statement)
+                  for statement in chain_items(pt, 2)]
+    tree = ["Program1", statements.pop()]
+    while statements:
+        tree = ["Program0", statements.pop(), tree]
+    return tree
+
+
+optimize_Program1 = optimize_Program0
+
+
+# <FunctionDeclaration> -> FUNCTION <Name> PAREN <FunctionParams> LBRACE
+# 	<FunctionBody> RBRACE
+def optimize_FunctionDeclaration0(pt):
+    # a function's calls aren't inlined into its own body
+    name = memo.name_of(pt[2])
+    was_inlining = name in inlining
+    inlining.add(name)
+    enclosing.append(name)
+    try:
+        return [optimize_tree(child) if isinstance(child, list) else child
+                for child in pt]
+    finally:
+        if not was_inlining:
+            inlining.discard(name)
+        enclosing.pop()
+        declared.add(name)
+
+
+# <ParameterList> -> <Parameter> COMMA <ParameterList> | <Parameter>
+# the Parameters are replaced by their expressions
+def optimize_ParameterList0(pt):
+    params = [optimize_tree(param) for param in chain_items(pt, 3)]
+    tree = ["ParameterList1", params.pop()]
+    while params:
+        tree = ["ParameterList0", params.pop(), "COMMA", tree]
+    return tree
+
+
+optimize_ParameterList1 = optimize_ParameterList0
+
+
+# <Parameter> -> <Expression> | <Name>
+def optimize_Parameter0(pt):
+    return optimize_tree(pt[1])
+
+
+def optimize_Parameter1(pt):
+    # a Value0 evaluates a Name to its value like Parameter1 does
+    return ["Value0", pt[1]]
+
+
+# <Expression> -> <Term> ADD <Expression> | <Term> SUB <Expression> | <Term>
+# <Term> -> <Factor> MULT <Term> | <Factor> DIV <Term> | <Factor>
+def optimize_Expression0(pt):
+    """
+    Optimize the operands of a chain, then fold it from the right for as
+    long as the operations can be folded or dropped (see simplify()). A
+    chain left with one operand is replaced by it.
+    """
+    operands = []
+    labels = []
+    while len(pt) > 2:
+        operands.append(optimize_tree(pt[1]))
+        labels.append(pt[0])
+        pt = pt[3]
+    operands.append(optimize_tree(pt[1]))
+    end_label = pt[0]
+
+    rest = operands.pop()
+    while labels:
+        simplified = simplify(operands[-1], labels[-1], rest)
+        if simplified is None:
+            break
+        operands.pop()
+        labels.pop()
+        rest = simplified
+    if not labels:
+        return rest
+
+    tree = [end_label, rest]
+    while labels:
+        label = labels.pop()
+        tree = [label, operands.pop(), chain_tokens[label], tree]
+    return tree
+
+
+optimize_Expression1 = optimize_Expression0
+optimize_Expression2 = optimize_Expression0
+optimize_Term0 = optimize_Expression0
+optimize_Term1 = optimize_Expression0
+optimize_Term2 = optimize_Expression0
+
+
+# <Factor> -> <SubExpression> EXP <Factor> | <SubExpression> | <FunctionCall> |
+#           <Value> EXP <Factor> | <Value>
+def optimize_Factor0(pt):
+    base = optimize_tree(pt[1])
+    exponent = optimize_tree(pt[3])
+    a = constant_of(base)
+    b = constant_of(exponent)
+    if a is not None and b is not None:
+        folded = fold(operator.pow, a, b)
+        if folded is not None:
+            return folded
+    elif 1.0 == b and is_float(base):
+        counts["simplified"] += 1
+        return base
+    return [pt[0], base, "EXP", exponent]
+
+
+def optimize_Factor1(pt):
+    return optimize_tree(pt[1])
+
+
+def optimize_Factor2(pt):
+    # a FunctionCall1 here only gives its first value
+    call = optimize_tree(pt[1])
+    index = 0
+    if "FunctionCall0" == call[0]:
+        index = int(constant_of(call[5]))
+    inlined = inline_call(call, index)
+    if inlined is not None:
+        return inlined
+    return ["Factor2", call]
+
+
+optimize_Factor3 = optimize_Factor0
+optimize_Factor4 = optimize_Factor1
+
+
+# <SubExpression> -> LPAREN <Expression> RPAREN
+def optimize_SubExpression0(pt):
+    return optimize_tree(pt[2])
+
+
+# <Value> -> <Name> | <Number>
+def optimize_Value0(pt):
+    return pt
+
+
+def optimize_Value1(pt):
+    return pt[1]
+
+
+# <Name> and <Number> have nothing to optimize
+def optimize_Name0(pt):
+    return pt
+
+
+optimize_Name1 = optimize_Name0
+optimize_Name2 = optimize_Name0
+optimize_Number0 = optimize_Name0
+optimize_Number1 = optimize_Name0
+optimize_Number2 = optimize_Name0
+optimize_NameList0 = optimize_Name0
+optimize_NameList1 = optimize_Name0
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Quirk optimizer")
+    arg_parser.add_argument("files", nargs="*")
+    arg_parser.add_argument("--text", action="store_true",
+                            help="pretty-print the tree instead of writing "
+                                 "the binary tree format")
+    arg_parser.add_argument("--stats", action="store_true",
+                            help="report the nodes eliminated on stderr")
+    arg_parser.add_argument("--inline-size", type=int, default=inline_size,
+                            metavar="N",
+                            help="inline calls whose value has at most N "
+                                 "nodes (0 to turn inlining off)")
+    args = arg_parser.parse_args()
+    inline_size = args.inline_size
+
+    given_tree = b"".join(fileinput.input(files=args.files, mode="rb"))
+    if treeformat.is_binary_tree(given_tree):
+        tree = treeformat.read_tree(given_tree)
+    else:
+        # the pretty-printed text format from parser.py --text
+        tree = ast.literal_eval(given_tree.decode("utf-8"))
+
+    tree = optimize(tree)
+    if args.stats:
+        print("optimizer: %(nodes_before)d nodes, %(nodes_after)d after "
+              "optimizing, %(eliminated)d eliminated (%(folded)d operations "
+              "folded, %(simplified)d dropped, %(inlined)d calls inlined)"
+              % stats(), file=sys.stderr)
+
+    if args.text:
+        pp.pprint(tree)
+    else:
+        treeformat.write_tree(tree, sys.stdout.buffer)
@@ -1,624 +1,972 @@
+import sys
+import time
 import pprint
+import argparse
 import fileinput
+import functools
+
+import lexer
+import treeformat
+from lexer import (ADD, ASSIGN, COLON, COMMA, DIV, EOF, EXP, FUNCTION, IDENT,
+                   LBRACE, LPAREN, MULT, NUMBER, PRINT, RBRACE, RETURN, RPAREN,
+                   SUB, VAR)
 
 pp = pprint.PrettyPrinter(indent=1, depth=100)
 
+# Separator tokens of the right-recursive list and operator rules, mapped to
+# the tree label of the alternative they select. See Parser.chain().
+name_list_labels = {COMMA: "NameList0"}
+parameter_list_labels = {COMMA: "ParameterList0"}
+expression_labels = {ADD: "Expression0", SUB: "Expression1"}
+term_labels = {MULT: "Term0", DIV: "Term1"}
+
+# Packrat mode of the Parsers made without saying otherwise. When enabled,
+# every grammar function remembers the result it produced for a given token
+# index so alternatives that share a prefix (e.g. the three <Term> attempts in
+# <Expression>) only parse that prefix once.
+packrat = True
+
+# What the last parse() left behind: its token list, its packrat cache hits,
+# and its furthest failure: the furthest token index at which a grammar
+# function failed, and the outermost grammar function that failed there (the
+# one that was expected at that point). Each Parser keeps its own.
+tokens = []
+memo_hits = 0
+failure_index = 0
+failure_rule = None
+
+# Grammar function name -> the method as @memoize made it, for
+# disable_rule_stats() to put back.
+grammar_rules = {}
+
+# Per-rule statistics, off unless enable_rule_stats() is called (by running
+# with --rule-stats). Enabling them rebinds every grammar method of Parser to
+# a counting wrapper, so parsing without them costs nothing extra. The
+# counts are shared by every Parser.
+rule_stats = {}
+
 
 # begin utilities
 def is_ident(tok):
     """
     Determine if the token is of type IDENT.
 
-    tok - a token
-    returns True if IDENT is in the token or False if not.
+    tok - a lexer.Token
+    returns True if the token is an IDENT or False if not.
     """
-    return -1 < tok.find("IDENT")
+    return IDENT == tok.kind
 
 
 def is_number(tok):
     """
     Determine if the token is of type NUMBER.
 
-    tok - a token
-    returns True if NUMBER is in the token or False if not.
-    """
-    return -1 < tok.find("NUMBER")
+    tok - a lexer.Token
+    returns True if the token is a NUMBER or False if not.
+    """
+    return NUMBER == tok.kind
+
+
+def memoize(rule):
+    """
+    Wrap a grammar method so its results are cached in the Parser's memo.
+
+    The cache is keyed by (rule name, tok_index) and holds the
+    [result, ret_index, subtree] list the rule returned. It is only valid for
+    the token list it was built from, so Parser.parse() clears it.
+
+    The wrapper also keeps the Parser's failure_index and failure_rule up to
+    date. Rules return after the rules they call, so of the rules failing at
+    the same index the outermost one is recorded last.
+    """
+    name = rule.__name__
+
+    @functools.wraps(rule)
+    def memoized(self, tok_index):
+        if self.packrat:
+            key = (name, tok_index)
+            if key in self.memo:
+                self.memo_hits += 1
+                return self.memo[key]
+        result = rule(self, tok_index)
+        if not result[0] and tok_index >= self.failure_index:
+            self.failure_index = tok_index
+            self.failure_rule = name
+        if self.packrat:
+            self.memo[key] = result
+        return result
+    grammar_rules[name] = memoized
+    return memoized
+
+
+class RuleStats(object):
+    """
+    What the calls of one grammar function did, while rule stats are on.
+
+    calls - every call, including ones answered from the packrat cache
+    cache_hits - calls answered from the packrat cache
+    successes, failures - calls that did and didn't match
+    backtracked_tokens - tokens matched by the alternatives the rule gave
+        up on, which the next alternative scans again (from the packrat
+        cache, if it's on)
+    rescanned_tokens - tokens matched by calls at a token index the rule had
+        already been called at in the same parse, and not from the cache:
+        what packrat mode would have saved
+    seconds - time spent in the rule, including the rules it called but
+        counting recursive calls once
+    self_seconds - time spent in the rule itself
+    """
+
+    __slots__ = ("name", "calls", "cache_hits", "successes", "failures",
+                 "backtracked_tokens", "rescanned_tokens", "seconds",
+                 "self_seconds", "active")
+
+    def __init__(self, name):
+        self.name = name
+        self.reset()
+
+    def reset(self):
+        """Set every count back to zero."""
+        self.calls = 0
+        self.cache_hits = 0
+        self.successes = 0
+        self.failures = 0
+        self.backtracked_tokens = 0
+        self.rescanned_tokens = 0
+        self.seconds = 0.0
+        self.self_seconds = 0.0
+        self.active = 0
+
+    def as_dict(self):
+        """Return the statistics as a dict, for reports."""
+        return dict((field, getattr(self, field))
+                    for field in self.__slots__ if field != "active")
+
+
+def counted(rule, stats):
+    """
+    Wrap a grammar method made by memoize() so its calls are recorded in
+    stats, a RuleStats.
+
+    Every alternative of a grammar function starts with a rule called at the
+    function's own token index, so a call at that index after others means
+    the alternatives before it were given up; the tokens the rules called
+    since the last such restart matched are added to the backtracked tokens.
+    A failed call counts as having matched the tokens up to the furthest
+    index the rules it called reached.
+    """
+    name = stats.name
+
+    @functools.wraps(rule)
+    def counting(self, tok_index):
+        parent = self.rule_frames[-1]
+        if parent[2] and tok_index == parent[1]:
+            parent[0].backtracked_tokens += parent[3]
+            parent[3] = 0
+        parent[2] = True
+        stats.calls += 1
+        if self.packrat and (name, tok_index) in self.memo:
+            stats.cache_hits += 1
+            result = rule(self, tok_index)
+            if result[0]:
+                stats.successes += 1
+                parent[3] += result[1] - tok_index
+                parent[4] = max(parent[4], result[1])
+            else:
+                stats.failures += 1
+            return result
+
+        frame = [stats, tok_index, False, 0, tok_index, 0.0]
+        self.rule_frames.append(frame)
+        stats.active += 1
+        start = time.perf_counter()
+        try:
+            result = rule(self, tok_index)
+        finally:
+            elapsed = time.perf_counter() - start
+            stats.active -= 1
+            self.rule_frames.pop()
+
+        if result[0]:
+            stats.successes += 1
+            end = result[1]
+        else:
+            stats.failures += 1
+            end = frame[4]
+        parent[3] += end - tok_index
+        parent[4] = max(parent[4], end)
+        parent[5] += elapsed
+        stats.self_seconds += elapsed - frame[5]
+        if not stats.active:
+            stats.seconds += elapsed
+        key = (name, tok_index)
+        if key in self.rule_calls_seen:
+            stats.rescanned_tokens += end - tok_index
+        else:
+            self.rule_calls_seen.add(key)
+        return result
+    return counting
+
+
+def enable_rule_stats():
+    """
+    Start recording a RuleStats for every grammar function in rule_stats,
+    adding to the ones recorded before.
+    """
+    for (name, rule) in grammar_rules.items():
+        if name not in rule_stats:
+            rule_stats[name] = RuleStats(name)
+        setattr(Parser, name, counted(rule, rule_stats[name]))
+
+
+def disable_rule_stats():
+    """Stop recording rule stats; the ones recorded are kept."""
+    for (name, rule) in grammar_rules.items():
+        setattr(Parser, name, rule)
+
+
+def reset_rule_stats():
+    """Set the rule stats recorded so far back to zero."""
+    for stats in rule_stats.values():
+        stats.reset()
+
+
+def rule_stats_report():
+    """
+    Return a table of the rule stats, one line per grammar function that
+    was called, the ones that took longest first.
+    """
+    lines = ["%-20s %9s %9s %9s %9s %11s %10s %9s %9s" % (
+        "rule", "calls", "hits", "matched", "failed", "backtracked",
+        "rescanned", "seconds", "self")]
+    for stats in sorted(rule_stats.values(), key=lambda s: -s.seconds):
+        if stats.calls:
+            lines.append("%-20s %9d %9d %9d %9d %11d %10d %9.4f %9.4f" % (
+                stats.name, stats.calls, stats.cache_hits, stats.successes,
+                stats.failures, stats.backtracked_tokens,
+                stats.rescanned_tokens, stats.seconds, stats.self_seconds))
+    return "\n".join(lines) + "\n"
+
+
+def parse(token_list):
+    """
+    Parse a complete token list (ending in EOF) starting from <Program>,
+    with a new Parser.
+
+    Returns the same [result, ret_index, subtree] list as Parser.Program().
+    If the program doesn't parse up to EOF, failure_message() says why.
+    What the parse left behind is kept in module globals for that, so
+    threads that parse at the same time should use a Parser each instead.
+    """
+    global tokens, memo_hits, failure_index, failure_rule
+    parser = Parser(token_list)
+    try:
+        return parser.parse()
+    finally:
+        tokens = token_list
+        memo_hits = parser.memo_hits
+        failure_index = parser.failure_index
+        failure_rule = parser.failure_rule
+
+
+def failure_message():
+    """
+    Describe the furthest failure of the last parse(), e.g.
+    "expected <Expression> at token 7 (RPAREN)".
+    """
+    return "expected <%s> at token %d (%s)" % (
+        failure_rule, failure_index, tokens[failure_index].text)
 # end utilities
 
 
-def Program(tok_index):
-    """
-    Return (full program) tree if possible.
-
-    <Program> ->
-        <Statement> <Program>
-        | <Statement>
-    """
-    # <Statement> <Program>
-    (result, ret_index, ret_subtree) = Statement(tok_index)
-    if result:
-        subtree = ["Program0", ret_subtree]
-        (result, ret_index, ret_subtree) = Program(ret_index)
-        if result:
-            subtree.append(ret_subtree)
-            return [True, ret_index, subtree]
-
-    # <Statement>
-    (result, ret_index, ret_subtree) = Statement(tok_index)
-    if result:
-        return [True, ret_index, ["Program1", ret_subtree]]
-    return [False, tok_index, []]
-
-
-def Statement(tok_index):
-    """
-    Return statement subtree, if possible.
-
-    <Statement> ->
-        <FunctionDeclaration>
-        | <Assignment>
-        | <Print>
-    """
-    # <FunctionDeclaration>
-    (result, ret_index, ret_subtree) = FunctionDeclaration(tok_index)
-    if result:
-        return [True, ret_index, ["Statement0", ret_subtree]]
-
-    # <Assignment>
-    (result, ret_index, ret_subtree) = Assignment(tok_index)
-    if result:
-        return [True, ret_index, ["Statement1", ret_subtree]]
-
-    # <Print>
-    (result, ret_index, ret_subtree) = Print(tok_index)
-    if result:
-        return [True, ret_index, ["Statement2", ret_subtree]]
-
-    return [False, tok_index, []]
-
-
-def FunctionDeclaration(tok_index):
-    """
-    Return FunctionDeclaration subtree, if possible.
-
-    <FunctionDeclaration> ->
-        FUNCTION <Name> LPAREN <FunctionParams> LBRACE <FunctionBody> RBRACE
-    """
-    # FUNCTION <Name> LPAREN <FunctionParams> LBRACE <FunctionBody> RBRACE
-    if "FUNCTION" == tokens[tok_index]:
-        subtree = ["FunctionDeclaration0", tokens[tok_index]]
-        (result, ret_index, ret_subtree) = Name(tok_index + 1)
-        if result:
-            subtree.append(ret_subtree)
-            if "LPAREN" == tokens[ret_index]:
-                subtree.append(tokens[ret_index])
-                (result, ret_index, ret_subtree) = FunctionParams(ret_index +
-                                                                  1)
-                if result:
-                    subtree.append(ret_subtree)
-                    if "LBRACE" == tokens[ret_index]:
-                        subtree.append(tokens[ret_index])
-                        (result, ret_index,
-                            ret_subtree) = FunctionBody(ret_index + 1)
-                        if result:
-                            subtree.append(ret_subtree)
-                            if "RBRACE" == tokens[ret_index]:
-                                subtree.append(tokens[ret_index])
-                                return [True, ret_index + 1, subtree]
-    return [False, tok_index, []]
-
-
-def FunctionParams(tok_index):
-    """
-    Return FunctionParams subtree, if possible.
-
-    <FunctionParams> ->
-        <NameList> RPAREN
-        | RPAREN
-    """
-    # <NameList> RPAREN
-    (result, ret_index, ret_subtree) = NameList(tok_index)
-    if result:
-        subtree = ["FunctionParams0", ret_subtree]
-        if "RPAREN" == tokens[ret_index]:
-            subtree.append(tokens[ret_index])
-            return [True, ret_index + 1, subtree]
-
-    # RPAREN
-    if "RPAREN" == tokens[tok_index]:
-        subtree = ["FunctionParams1", tokens[tok_index]]
-        return [True, tok_index + 1, []]
-    return [False, tok_index, []]
-
-
-def FunctionBody(tok_index):
-    """
-    Return FunctionBody subtree, if possible.
-
-    <FunctionBody> ->
-        <Program> <Return>
-        | <Return>
-    """
-    # <Program> <Return>
-    (result, ret_index, ret_subtree) = Program(tok_index)
-    if result:
-        subtree = ["FunctionBody0", ret_subtree]
-        (result, ret_index, ret_subtree) = Return(ret_index)
-        if result:
-            subtree.append(ret_subtree)
-            return [True, ret_index, subtree]
-
-    # <Return>
-    (result, ret_index, ret_subtree) = Return(tok_index)
-    if result:
-        return [True, ret_index, ["FunctionBody1", ret_subtree]]
-    return [False, tok_index, []]
-
-
-def Return(tok_index):
-    """
-    Return Return subtree, if possible.
-
-    <Return> ->
-        RETURN <ParameterList>
-    """
-    # RETURN <ParameterList>
-    if "RETURN" == tokens[tok_index]:
-        subtree = ["Return0", tokens[tok_index]]
-        (result, ret_index, ret_subtree) = ParameterList(tok_index + 1)
-        if result:
-            subtree.append(ret_subtree)
-            return [True, ret_index, subtree]
-    return [False, tok_index, []]
-
-
-def Assignment(tok_index):
-    """
-    Return Assignment subtree, if possible.
-
-    <Assignment> ->
-        <SingleAssignment>
-        | <MultipleAssignment>
-    """
-    # <SingleAssignment>
-    (result, ret_index, ret_subtree) = SingleAssignment(tok_index)
-    if result:
-        return [True, ret_index, ["Assignment0", ret_subtree]]
-
-    # <MultipleAssignment>
-    (result, ret_index, ret_subtree) = MultipleAssignment(tok_index)
-    if result:
-        return [True, ret_index, ["Assignment1", ret_subtree]]
-    return [False, tok_index, []]
-
+class Parser(object):
+    """
+    A parse of one token list.
+
+        parser = parser.Parser(tokens)
+        (result, ret_index, tree) = parser.parse()
+
+    The grammar functions are methods, so everything a parse needs is kept
+    in the Parser rather than in module globals, and any number of Parsers
+    can parse at the same time on different threads.
+
+    tokens - the token list, ending in EOF
+    packrat - whether the grammar methods cache their results in memo
+    memo - the packrat cache; see memoize()
+    memo_hits - how many calls the packrat cache answered
+    failure_index, failure_rule - the furthest failure: the furthest token
+        index at which a grammar method failed, and the outermost one that
+        failed there
+    rule_frames, rule_calls_seen - what counted() keeps track of while rule
+        stats are on
+    """
+
+    def __init__(self, token_list, use_packrat=None):
+        self.tokens = token_list
+        self.packrat = packrat if use_packrat is None else use_packrat
+        self.memo = {}
+        self.memo_hits = 0
+        self.failure_index = 0
+        self.failure_rule = None
+        # A [stats, tok_index, called, pending, reach, child_seconds] list
+        # for each grammar method call in progress, innermost last, below
+        # one for the caller of parse(): the call's RuleStats and token
+        # index, whether it has called a rule yet, the tokens the rules it
+        # called matched since it last started an alternative, the furthest
+        # token index they reached and the time spent in them.
+        self.rule_frames = [[None, -1, False, 0, 0, 0.0]]
+        # (rule name, token index) of every call of the parse that wasn't
+        # answered from the packrat cache
+        self.rule_calls_seen = set()
+
+    def parse(self):
+        """
+        Parse the token list starting from <Program>.
+
+        Returns the same [result, ret_index, subtree] list as Program(). The
+        packrat cache only lives as long as the call. If the program doesn't
+        parse up to EOF, failure_message() says why.
+        """
+        self.memo.clear()
+        self.memo_hits = 0
+        self.failure_index = 0
+        self.failure_rule = None
+        self.rule_calls_seen.clear()
+        self.rule_frames[0][2:] = [False, 0, 0, 0.0]
+        try:
+            return self.Program(0)
+        finally:
+            self.memo.clear()
+
+    def failure_message(self):
+        """
+        Describe the furthest failure of the last parse(), e.g.
+        "expected <Expression> at token 7 (RPAREN)".
+        """
+        return "expected <%s> at token %d (%s)" % (
+            self.failure_rule, self.failure_index,
+            self.tokens[self.failure_index].text)
+
+    def chain(self, tok_index, name, operand, labels, last_label):
+        """
+        Return the subtree for the right-recursive rule name, of the form
+            <Rule> -> <Operand> SEP <Rule> | ... | <Operand>
+
+        The operands are collected in a loop for as long as a separator is
+        followed by another operand, then the right-nested tree is built
+        from the end, so a chain of any length is parsed without recursion.
+        Tried in order, the alternatives give the same tree: <Rule> after a
+        separator fails only if its first <Operand> does, and then the
+        <Rule> before it matches its bare <Operand> instead. That failure
+        of <Rule> is recorded as the recursive call would have recorded it.
+
+        operand - the grammar method for <Operand>
+        labels - maps each separator token kind to the label of its
+            alternative
+        last_label - the label of the bare <Operand> alternative
+        """
+        (result, ret_index, first_subtree) = operand(tok_index)
+        if not result:
+            return [False, tok_index, []]
+        operands = [first_subtree]
+        separators = []
+        while self.tokens[ret_index].kind in labels:
+            (result, next_index, next_subtree) = operand(ret_index + 1)
+            if not result:
+                if ret_index + 1 >= self.failure_index:
+                    self.failure_index = ret_index + 1
+                    self.failure_rule = name
+                break
+            separators.append(self.tokens[ret_index])
+            operands.append(next_subtree)
+            ret_index = next_index
+
+        subtree = [last_label, operands.pop()]
+        while separators:
+            separator = separators.pop()
+            subtree = [labels[separator.kind], operands.pop(),
+                       separator.text, subtree]
+        return [True, ret_index, subtree]
 
-def SingleAssignment(tok_index):
-    """
-    Return SingleAssignment subtree, if possible.
+    @memoize
+    def Program(self, tok_index):
+        """
+        Return (full program) tree if possible.
+
+        <Program> ->
+            <Statement> <Program>
+            | <Statement>
+
+        Statements are parsed in a loop and the right-nested Program0 /
+        Program1 chain is built afterwards, so the stack depth doesn't grow
+        with the number of statements.
+        """
+        statements = []
+        ret_index = tok_index
+        # <Statement> <Program>, repeated for as long as there is a <Statement>
+        (result, next_index, ret_subtree) = self.Statement(ret_index)
+        while result:
+            statements.append(ret_subtree)
+            ret_index = next_index
+            (result, next_index, ret_subtree) = self.Statement(ret_index)
+
+        if not statements:
+            return [False, tok_index, []]
+
+        # <Statement>
+        subtree = ["Program1", statements.pop()]
+        while statements:
+            subtree = ["Program0", statements.pop(), subtree]
+        return [True, ret_index, subtree]
 
-    <SingleAssignment> ->
-        VAR <Name> ASSIGN <Expression>
-    """
-    # VAR <Name> ASSIGN <Expression>
-    if "VAR" == tokens[tok_index]:
-        subtree = ["SingleAssignment0", tokens[tok_index]]
-        (result, ret_index, ret_subtree) = Name(tok_index + 1)
+    @memoize
+    def Statement(self, tok_index):
+        """
+        Return statement subtree, if possible.
+
+        <Statement> ->
+            <FunctionDeclaration>
+            | <Assignment>
+            | <Print>
+        """
+        # <FunctionDeclaration>
+        (result, ret_index, ret_subtree) = self.FunctionDeclaration(tok_index)
         if result:
-            subtree.append(ret_subtree)
-            if "ASSIGN" == tokens[ret_index]:
-                subtree.append(tokens[ret_index])
-                (result, ret_index, ret_subtree) = Expression(ret_index + 1)
-                if result:
-                    subtree.append(ret_subtree)
-                    return [True, ret_index, subtree]
-    return [False, tok_index, []]
-
-
-def MultipleAssignment(tok_index):
-    """
-    Return MultipleAssignment subtree, if possible.
+            return [True, ret_index, ["Statement0", ret_subtree]]
 
-    <MultipleAssignment> ->
-        VAR <NameList> ASSIGN <FunctionCall>
-    """
-    # VAR <NameList> ASSIGN <FunctionCall>
-    if "VAR" == tokens[tok_index]:
-        subtree = ["MultipleAssignment0", tokens[tok_index]]
-        (result, ret_index, ret_subtree) = NameList(tok_index + 1)
+        # <Assignment>
+        (result, ret_index, ret_subtree) = self.Assignment(tok_index)
         if result:
-            subtree.append(ret_subtree)
-            if "ASSIGN" == tokens[ret_index]:
-                subtree.append(tokens[ret_index])
-                (result, ret_index, ret_subtree) = FunctionCall(ret_index + 1)
-                if result:
-                    subtree.append(ret_subtree)
-                    return [True, ret_index, subtree]
-    return [False, tok_index, []]
-
-
-def Print(tok_index):
-    """
-    Return Print subtree, if possible.
+            return [True, ret_index, ["Statement1", ret_subtree]]
 
-    <Print> ->
-        PRINT <Expression>
-    """
-    # PRINT <Expression>
-    if "PRINT" == tokens[tok_index]:
-        subtree = ["Print0", tokens[tok_index]]
-        (result, ret_index, ret_subtree) = Expression(tok_index + 1)
+        # <Print>
+        (result, ret_index, ret_subtree) = self.Print(tok_index)
         if result:
-            subtree.append(ret_subtree)
-            return [True, ret_index, subtree]
-    return [False, tok_index, []]
-
-
-def NameList(tok_index):
-    """
-    Return NameList subtree, if possible.
-
-    <NameList> ->
-        <Name> COMMA <NameList>
-        | <Name>
-    """
-    # <Name> COMMA <NameList>
-    (result, ret_index, ret_subtree) = Name(tok_index)
-    if result:
-        subtree = ["NameList0", ret_subtree]
-        if "COMMA" == tokens[ret_index]:
-            subtree.append(tokens[ret_index])
-            (result, ret_index, ret_subtree) = NameList(ret_index + 1)
-            if result:
-                subtree.append(ret_subtree)
-                return [True, ret_index, subtree]
-
-    # <Name>
-    (result, ret_index, ret_subtree) = Name(tok_index)
-    if result:
-        return [True, ret_index, ["NameList1", ret_subtree]]
-    return [False, tok_index, []]
-
-
-def ParameterList(tok_index):
-    """
-    Return ParameterList subtree, if possible.
-
-    <ParameterList> ->
-        <Parameter> COMMA <ParameterList>
-        | <Parameter>
-    """
-    # <Parameter> COMMA <ParameterList>
-    (result, ret_index, ret_subtree) = Parameter(tok_index)
-    if result:
-        subtree = ["ParameterList0", ret_subtree]
-        if "COMMA" == tokens[ret_index]:
-            subtree.append(tokens[ret_index])
-            (result, ret_index, ret_subtree) = ParameterList(ret_index + 1)
+            return [True, ret_index, ["Statement2", ret_subtree]]
+
+        return [False, tok_index, []]
+
+    @memoize
+    def FunctionDeclaration(self, tok_index):
+        """
+        Return FunctionDeclaration subtree, if possible.
+
+        <FunctionDeclaration> ->
+            FUNCTION <Name> LPAREN <FunctionParams> LBRACE <FunctionBody>
+            RBRACE
+        """
+        # FUNCTION <Name> LPAREN <FunctionParams> LBRACE <FunctionBody> RBRACE
+        if FUNCTION == self.tokens[tok_index].kind:
+            subtree = ["FunctionDeclaration0", self.tokens[tok_index].text]
+            (result, ret_index, ret_subtree) = self.Name(tok_index + 1)
             if result:
                 subtree.append(ret_subtree)
-                return [True, ret_index, subtree]
-
-    # <Parameter>
-    (result, ret_index, ret_subtree) = Parameter(tok_index)
-    if result:
-        return [True, ret_index, ["ParameterList1", ret_subtree]]
-    return [False, tok_index, []]
-
-
-def Parameter(tok_index):
-    """
-    Return Parameter subtree, if possible.
-
-    <Parameter> ->
-        <Expression>
-        | <Name>
-    """
-    # <Expression>
-    (result, ret_index, ret_subtree) = Expression(tok_index)
-    if result:
-        return [True, ret_index, ["Parameter0", ret_subtree]]
-
-    # <Name>
-    (result, ret_index, ret_subtree) = Name(tok_index)
-    if result:
-        return [True, ret_index, ["Parameter1", ret_subtree]]
-    return [False, tok_index, []]
-
-
-def Expression(tok_index):
-    """
-    Return Expression subtree, if possible.
+                if LPAREN == self.tokens[ret_index].kind:
+                    subtree.append(self.tokens[ret_index].text)
+                    (result, ret_index,
+                        ret_subtree) = self.FunctionParams(ret_index + 1)
+                    if result:
+                        subtree.append(ret_subtree)
+                        if LBRACE == self.tokens[ret_index].kind:
+                            subtree.append(self.tokens[ret_index].text)
+                            (result, ret_index,
+                                ret_subtree) = self.FunctionBody(ret_index + 1)
+                            if result:
+                                subtree.append(ret_subtree)
+                                if RBRACE == self.tokens[ret_index].kind:
+                                    subtree.append(self.tokens[ret_index].text)
+                                    return [True, ret_index + 1, subtree]
+        return [False, tok_index, []]
+
+    @memoize
+    def FunctionParams(self, tok_index):
+        """
+        Return FunctionParams subtree, if possible.
+
+        <FunctionParams> ->
+            <NameList> RPAREN
+            | RPAREN
+        """
+        # <NameList> RPAREN
+        (result, ret_index, ret_subtree) = self.NameList(tok_index)
+        if result:
+            subtree = ["FunctionParams0", ret_subtree]
+            if RPAREN == self.tokens[ret_index].kind:
+                subtree.append(self.tokens[ret_index].text)
+                return [True, ret_index + 1, subtree]
 
-    <Expression> ->
-        <Term> ADD <Expression>
-        | <Term> SUB <Expression>
-        | <Term>
-    """
-    # <Term> ADD <Expression>
-    (result, ret_index, ret_subtree) = Term(tok_index)
-    if result:
-        subtree = ["Expression0", ret_subtree]
-        if "ADD" == tokens[ret_index]:
-            subtree.append(tokens[ret_index])
-            (result, ret_index, ret_subtree) = Expression(
-                ret_index + 1)
+        # RPAREN
+        if RPAREN == self.tokens[tok_index].kind:
+            subtree = ["FunctionParams1", self.tokens[tok_index].text]
+            return [True, tok_index + 1, subtree]
+        return [False, tok_index, []]
+
+    @memoize
+    def FunctionBody(self, tok_index):
+        """
+        Return FunctionBody subtree, if possible.
+
+        <FunctionBody> ->
+            <Program> <Return>
+            | <Return>
+        """
+        # <Program> <Return>
+        (result, ret_index, ret_subtree) = self.Program(tok_index)
+        if result:
+            subtree = ["FunctionBody0", ret_subtree]
+            (result, ret_index, ret_subtree) = self.Return(ret_index)
             if result:
                 subtree.append(ret_subtree)
                 return [True, ret_index, subtree]
 
-    # <Term> SUB <Expression>
-    (result, ret_index, ret_subtree) = Term(tok_index)
-    if result:
-        subtree = ["Expression1", ret_subtree]
-        if "SUB" == tokens[ret_index]:
-            subtree.append(tokens[ret_index])
-            (result, ret_index, ret_subtree) = Expression(
-                ret_index + 1)
+        # <Return>
+        (result, ret_index, ret_subtree) = self.Return(tok_index)
+        if result:
+            return [True, ret_index, ["FunctionBody1", ret_subtree]]
+        return [False, tok_index, []]
+
+    @memoize
+    def Return(self, tok_index):
+        """
+        Return Return subtree, if possible.
+
+        <Return> ->
+            RETURN <ParameterList>
+        """
+        # RETURN <ParameterList>
+        if RETURN == self.tokens[tok_index].kind:
+            subtree = ["Return0", self.tokens[tok_index].text]
+            (result, ret_index,
+                ret_subtree) = self.ParameterList(tok_index + 1)
             if result:
                 subtree.append(ret_subtree)
                 return [True, ret_index, subtree]
-    # <Term>
-    (result, ret_index, ret_subtree) = Term(tok_index)
-    if result:
-        return [True, ret_index, ["Expression2", ret_subtree]]
-    return [False, tok_index, []]
-
-
-def Term(tok_index):
-    """
-    Return Term subtree, if possible.
+        return [False, tok_index, []]
+
+    @memoize
+    def Assignment(self, tok_index):
+        """
+        Return Assignment subtree, if possible.
+
+        <Assignment> ->
+            <SingleAssignment>
+            | <MultipleAssignment>
+        """
+        # <SingleAssignment>
+        (result, ret_index, ret_subtree) = self.SingleAssignment(tok_index)
+        if result:
+            return [True, ret_index, ["Assignment0", ret_subtree]]
 
-    <Term> ->
-        <Factor> MULT <Term>
-        | <Factor> DIV <Term>
-        | <Factor>
-    """
-    # <Factor> MULT <Term>
-    (result, ret_index, ret_subtree) = Factor(tok_index)
-    if result:
-        subtree = ["Term0", ret_subtree]
-        if "MULT" == tokens[ret_index]:
-            subtree.append(tokens[ret_index])
-            (result, ret_index, ret_subtree) = Term(ret_index + 1)
+        # <MultipleAssignment>
+        (result, ret_index, ret_subtree) = self.MultipleAssignment(tok_index)
+        if result:
+            return [True, ret_index, ["Assignment1", ret_subtree]]
+        return [False, tok_index, []]
+
+    @memoize
+    def SingleAssignment(self, tok_index):
+        """
+        Return SingleAssignment subtree, if possible.
+
+        <SingleAssignment> ->
+            VAR <Name> ASSIGN <Expression>
+        """
+        # VAR <Name> ASSIGN <Expression>
+        if VAR == self.tokens[tok_index].kind:
+            subtree = ["SingleAssignment0", self.tokens[tok_index].text]
+            (result, ret_index, ret_subtree) = self.Name(tok_index + 1)
             if result:
                 subtree.append(ret_subtree)
-                return [True, ret_index, subtree]
-
-    # <Factor> DIV <Term>
-    (result, ret_index, ret_subtree) = Factor(tok_index)
-    if result:
-        subtree = ["Term1", ret_subtree]
-        if "DIV" == tokens[ret_index]:
-            subtree.append(tokens[ret_index])
-            (result, ret_index, ret_subtree) = Term(ret_index + 1)
+                if ASSIGN == self.tokens[ret_index].kind:
+                    subtree.append(self.tokens[ret_index].text)
+                    (result, ret_index,
+                        ret_subtree) = self.Expression(ret_index + 1)
+                    if result:
+                        subtree.append(ret_subtree)
+                        return [True, ret_index, subtree]
+        return [False, tok_index, []]
+
+    @memoize
+    def MultipleAssignment(self, tok_index):
+        """
+        Return MultipleAssignment subtree, if possible.
+
+        <MultipleAssignment> ->
+            VAR <NameList> ASSIGN <FunctionCall>
+        """
+        # VAR <NameList> ASSIGN <FunctionCall>
+        if VAR == self.tokens[tok_index].kind:
+            subtree = ["MultipleAssignment0", self.tokens[tok_index].text]
+            (result, ret_index, ret_subtree) = self.NameList(tok_index + 1)
             if result:
                 subtree.append(ret_subtree)
-                return [True, ret_index, subtree]
-
-    # <Factor>
-    (result, ret_index, ret_subtree) = Factor(tok_index)
-    if result:
-        return [True, ret_index, ["Term2", ret_subtree]]
-    return [False, tok_index, []]
-
-
-def Factor(tok_index):
-    """
-    Return Factor subtree, if possible.
-
-    <Factor> ->
-        <SubExpression>
-        | <SubExpression> EXP <Factor>
-        | <FunctionCall>
-        | <Value> EXP <Factor>
-        | <Value>
-    """
-    # <SubExpression> EXP <Factor>
-    (result, ret_index, ret_subtree) = SubExpression(tok_index)
-    if result:
-        subtree = ["Factor0", ret_subtree]
-        if "EXP" == tokens[ret_index]:
-            subtree.append(tokens[ret_index])
-            (result, ret_index, ret_subtree) = Factor(ret_index + 1)
+                if ASSIGN == self.tokens[ret_index].kind:
+                    subtree.append(self.tokens[ret_index].text)
+                    (result, ret_index,
+                        ret_subtree) = self.FunctionCall(ret_index + 1)
+                    if result:
+                        subtree.append(ret_subtree)
+                        return [True, ret_index, subtree]
+        return [False, tok_index, []]
+
+    @memoize
+    def Print(self, tok_index):
+        """
+        Return Print subtree, if possible.
+
+        <Print> ->
+            PRINT <Expression>
+        """
+        # PRINT <Expression>
+        if PRINT == self.tokens[tok_index].kind:
+            subtree = ["Print0", self.tokens[tok_index].text]
+            (result, ret_index, ret_subtree) = self.Expression(tok_index + 1)
             if result:
                 subtree.append(ret_subtree)
                 return [True, ret_index, subtree]
+        return [False, tok_index, []]
+
+    @memoize
+    def NameList(self, tok_index):
+        """
+        Return NameList subtree, if possible.
+
+        <NameList> ->
+            <Name> COMMA <NameList>
+            | <Name>
+
+        Parsed in a loop by chain(), which gives the same tree as trying
+        the alternatives in order.
+        """
+        return self.chain(tok_index, "NameList", self.Name,
+                          name_list_labels, "NameList1")
+
+    @memoize
+    def ParameterList(self, tok_index):
+        """
+        Return ParameterList subtree, if possible.
+
+        <ParameterList> ->
+            <Parameter> COMMA <ParameterList>
+            | <Parameter>
+
+        Parsed in a loop by chain(), which gives the same tree as trying
+        the alternatives in order.
+        """
+        return self.chain(tok_index, "ParameterList", self.Parameter,
+                          parameter_list_labels, "ParameterList1")
+
+    @memoize
+    def Parameter(self, tok_index):
+        """
+        Return Parameter subtree, if possible.
+
+        <Parameter> ->
+            <Expression>
+            | <Name>
+        """
+        # <Expression>
+        (result, ret_index, ret_subtree) = self.Expression(tok_index)
+        if result:
+            return [True, ret_index, ["Parameter0", ret_subtree]]
 
-    # <SubExpression>
-    (result, ret_index, ret_subtree) = SubExpression(tok_index)
-    if result:
-        subtree = ["Factor1", ret_subtree]
-        return [True, ret_index, subtree]
+        # <Name>
+        (result, ret_index, ret_subtree) = self.Name(tok_index)
+        if result:
+            return [True, ret_index, ["Parameter1", ret_subtree]]
+        return [False, tok_index, []]
+
+    @memoize
+    def Expression(self, tok_index):
+        """
+        Return Expression subtree, if possible.
+
+        <Expression> ->
+            <Term> ADD <Expression>
+            | <Term> SUB <Expression>
+            | <Term>
+
+        Parsed in a loop by chain(), which gives the same tree as trying
+        the alternatives in order.
+        """
+        return self.chain(tok_index, "Expression", self.Term,
+                          expression_labels, "Expression2")
+
+    @memoize
+    def Term(self, tok_index):
+        """
+        Return Term subtree, if possible.
+
+        <Term> ->
+            <Factor> MULT <Term>
+            | <Factor> DIV <Term>
+            | <Factor>
+
+        Parsed in a loop by chain(), which gives the same tree as trying
+        the alternatives in order.
+        """
+        return self.chain(tok_index, "Term", self.Factor, term_labels, "Term2")
+
+    @memoize
+    def Factor(self, tok_index):
+        """
+        Return Factor subtree, if possible.
+
+        <Factor> ->
+            <SubExpression>
+            | <SubExpression> EXP <Factor>
+            | <FunctionCall>
+            | <Value> EXP <Factor>
+            | <Value>
+        """
+        # <SubExpression> EXP <Factor>
+        (result, ret_index, ret_subtree) = self.SubExpression(tok_index)
+        if result:
+            subtree = ["Factor0", ret_subtree]
+            if EXP == self.tokens[ret_index].kind:
+                subtree.append(self.tokens[ret_index].text)
+                (result, ret_index, ret_subtree) = self.Factor(ret_index + 1)
+                if result:
+                    subtree.append(ret_subtree)
+                    return [True, ret_index, subtree]
 
-    # <FunctionCall>
-    (result, ret_index, ret_subtree) = FunctionCall(tok_index)
-    if result:
-        return [True, ret_index, ["Factor2", ret_subtree]]
-
-    # <Value> EXP <Factor>
-    (result, ret_index, ret_subtree) = Value(tok_index)
-    if result:
-        subtree = ["Factor3", ret_subtree]
-        if "EXP" == tokens[ret_index]:
-            subtree.append(tokens[ret_index])
-            (result, ret_index, ret_subtree) = Factor(ret_index + 1)
-            if result:
-                subtree.append(ret_subtree)
-                return [True, ret_index, subtree]
+        # <SubExpression>
+        (result, ret_index, ret_subtree) = self.SubExpression(tok_index)
+        if result:
+            subtree = ["Factor1", ret_subtree]
+            return [True, ret_index, subtree]
 
-    # <Value>
-    (result, ret_index, ret_subtree) = Value(tok_index)
-    if result:
-        return [True, ret_index, ["Factor4", ret_subtree]]
-    return [False, tok_index, []]
+        # <FunctionCall>
+        (result, ret_index, ret_subtree) = self.FunctionCall(tok_index)
+        if result:
+            return [True, ret_index, ["Factor2", ret_subtree]]
 
+        # <Value> EXP <Factor>
+        (result, ret_index, ret_subtree) = self.Value(tok_index)
+        if result:
+            subtree = ["Factor3", ret_subtree]
+            if EXP == self.tokens[ret_index].kind:
+                subtree.append(self.tokens[ret_index].text)
+                (result, ret_index, ret_subtree) = self.Factor(ret_index + 1)
+                if result:
+                    subtree.append(ret_subtree)
+                    return [True, ret_index, subtree]
 
-def FunctionCall(tok_index):
-    """
-    Return FunctionCall subtree, if possible.
+        # <Value>
+        (result, ret_index, ret_subtree) = self.Value(tok_index)
+        if result:
+            return [True, ret_index, ["Factor4", ret_subtree]]
+        return [False, tok_index, []]
+
+    @memoize
+    def FunctionCall(self, tok_index):
+        """
+        Return FunctionCall subtree, if possible.
+
+        <FunctionCall> ->
+            <Name> LPAREN <FunctionCallParams> COLON <Number>
+            | <Name> LPAREN <FunctionCallParams>
+        """
+        # <Name> LPAREN <FunctionCallParams> COLON <Number>
+        (result, ret_index, ret_subtree) = self.Name(tok_index)
+        if result:
+            subtree = ["FunctionCall0", ret_subtree]
+            if LPAREN == self.tokens[ret_index].kind:
+                subtree.append(self.tokens[ret_index].text)
+                (result, ret_index, ret_subtree) = self.FunctionCallParams(
+                    ret_index + 1)
+                if result:
+                    subtree.append(ret_subtree)
+                    if COLON == self.tokens[ret_index].kind:
+                        subtree.append(self.tokens[ret_index].text)
+                        (result, ret_index, ret_subtree) = self.Number(
+                            ret_index + 1)
+                        if result:
+                            subtree.append(ret_subtree)
+                            return [True, ret_index, subtree]
 
-    <FunctionCall> ->
-        <Name> LPAREN <FunctionCallParams> COLON <Number>
-        | <Name> LPAREN <FunctionCallParams>
-    """
-    # <Name> LPAREN <FunctionCallParams> COLON <Number>
-    (result, ret_index, ret_subtree) = Name(tok_index)
-    if result:
-        subtree = ["FunctionCall0", ret_subtree]
-        if "LPAREN" == tokens[ret_index]:
-            subtree.append(tokens[ret_index])
-            (result, ret_index, ret_subtree) = FunctionCallParams(
-                ret_index + 1)
+        # <Name> LPAREN <FunctionCallParams>
+            (result, ret_index, ret_subtree) = self.Name(tok_index)
             if result:
-                subtree.append(ret_subtree)
-                if "COLON" == tokens[ret_index]:
-                    subtree.append(tokens[ret_index])
-                    (result, ret_index, ret_subtree) = Number(
+                subtree = ["FunctionCall1", ret_subtree]
+                if LPAREN == self.tokens[ret_index].kind:
+                    subtree.append(self.tokens[ret_index].text)
+                    (result, ret_index, ret_subtree) = self.FunctionCallParams(
                         ret_index + 1)
                     if result:
                         subtree.append(ret_subtree)
                         return [True, ret_index, subtree]
-
-    # <Name> LPAREN <FunctionCallParams>
-        (result, ret_index, ret_subtree) = Name(tok_index)
+        return [False, tok_index, []]
+
+    @memoize
+    def FunctionCallParams(self, tok_index):
+        """
+        Return FunctionCallParams subtree, if possible.
+
+        <FunctionCallParams> ->
+            <ParameterList> RPAREN
+            | RPAREN
+        """
+        # <ParameterList> RPAREN
+        (result, ret_index, ret_subtree) = self.ParameterList(tok_index)
         if result:
-            subtree = ["FunctionCall1", ret_subtree]
-            if "LPAREN" == tokens[ret_index]:
-                subtree.append(tokens[ret_index])
-                (result, ret_index, ret_subtree) = FunctionCallParams(
-                    ret_index + 1)
-                if result:
-                    subtree.append(ret_subtree)
-                    return [True, ret_index, subtree]
-    return [False, tok_index, []]
-
-
-def FunctionCallParams(tok_index):
-    """
-    Return FunctionCallParams subtree, if possible.
-
-    <FunctionCallParams> ->
-        <ParameterList> RPAREN
-        | RPAREN
-    """
-    # <ParameterList> RPAREN
-    (result, ret_index, ret_subtree) = ParameterList(tok_index)
-    if result:
-        subtree = ["FunctionCallParams0", ret_subtree]
-        if "RPAREN" == tokens[ret_index]:
-            subtree.append(tokens[ret_index])
-            return [True, ret_index + 1, subtree]
-
-    # RPAREN
-    if "RPAREN" == tokens[tok_index]:
-        subtree = ["FunctionCallParams1", tokens[tok_index]]
-        return [True, tok_index + 1, subtree]
-    return [False, tok_index, []]
-
-
-def SubExpression(tok_index):
-    """
-    Return SubExpression subtree, if possible.
-
-    <SubExpression> ->
-        LPAREN <Expression> RPAREN
-    """
-    # LPAREN <Expression> RPAREN
-    if "LPAREN" == tokens[tok_index]:
-        subtree = ["SubExpression0", tokens[tok_index]]
-        (result, ret_index, ret_subtree) = Expression(tok_index + 1)
-        if result:
-            subtree.append(ret_subtree)
-            if "RPAREN" == tokens[ret_index]:
-                subtree.append(tokens[ret_index])
+            subtree = ["FunctionCallParams0", ret_subtree]
+            if RPAREN == self.tokens[ret_index].kind:
+                subtree.append(self.tokens[ret_index].text)
                 return [True, ret_index + 1, subtree]
-    return [False, tok_index, []]
-
-
-def Value(tok_index):
-    """
-    Return Value subtree, if possible.
-
-    <Value> ->
-        <Name>
-        | <Number>
-    """
-    # <name>
-    (result, ret_index, ret_subtree) = Name(tok_index)
-    if result:
-        return [True, ret_index, ["Value0", ret_subtree]]
-
-    # <number>
-    (result, ret_index, ret_subtree) = Number(tok_index)
-    if result:
-        return [True, ret_index, ["Value1", ret_subtree]]
-    return [False, tok_index, []]
-
 
-def Name(tok_index):
-    """
-    Return Name subtree, if possible.
-
-    <Name> ->
-        IDENT
-        | SUB IDENT
-        | ADD IDENT
-    """
-    subtree = []
-    # IDENT
-    if is_ident(tokens[tok_index]):
-        subtree = ["Name0", tokens[tok_index]]
-        return [True, tok_index + 1, subtree]
-
-    # SUB IDENT
-    if "SUB" == tokens[tok_index]:
-        if is_ident(tokens[tok_index + 1]):
-            subtree = ["Name1", tokens[tok_index], tokens[tok_index + 1]]
-            return [True, tok_index + 2, subtree]
-
-    # ADD IDENT
-    if "ADD" == tokens[tok_index]:
-        if is_ident(tokens[tok_index + 1]):
-            subtree = ["Name2", tokens[tok_index], tokens[tok_index + 1]]
-            return [True, tok_index + 2, subtree]
-    return [False, tok_index, subtree]
-
-
-def Number(tok_index):
-    """
-    Return Number subtree, if possible.
+        # RPAREN
+        if RPAREN == self.tokens[tok_index].kind:
+            subtree = ["FunctionCallParams1", self.tokens[tok_index].text]
+            return [True, tok_index + 1, subtree]
+        return [False, tok_index, []]
+
+    @memoize
+    def SubExpression(self, tok_index):
+        """
+        Return SubExpression subtree, if possible.
+
+        <SubExpression> ->
+            LPAREN <Expression> RPAREN
+        """
+        # LPAREN <Expression> RPAREN
+        if LPAREN == self.tokens[tok_index].kind:
+            subtree = ["SubExpression0", self.tokens[tok_index].text]
+            (result, ret_index, ret_subtree) = self.Expression(tok_index + 1)
+            if result:
+                subtree.append(ret_subtree)
+                if RPAREN == self.tokens[ret_index].kind:
+                    subtree.append(self.tokens[ret_index].text)
+                    return [True, ret_index + 1, subtree]
+        return [False, tok_index, []]
+
+    @memoize
+    def Value(self, tok_index):
+        """
+        Return Value subtree, if possible.
+
+        <Value> ->
+            <Name>
+            | <Number>
+        """
+        # <name>
+        (result, ret_index, ret_subtree) = self.Name(tok_index)
+        if result:
+            return [True, ret_index, ["Value0", ret_subtree]]
 
-    <Number> ->
-        NUMBER
-        | SUB NUMBER
-        | ADD NUMBER
-    """
-    subtree = []
-    # NUMBER
-    if is_number(tokens[tok_index]):
-        subtree = ["Number0", tokens[tok_index]]
-        return [True, tok_index + 1, subtree]
-
-    # SUB NUMBER
-    if "SUB" == tokens[tok_index]:
-        if is_number(tokens[tok_index + 1]):
-            subtree = ["Number1", tokens[tok_index], tokens[tok_index + 1]]
-            return [True, tok_index + 2, subtree]
-
-    # ADD NUMBER
-    if "ADD" == tokens[tok_index]:
-        if is_number(tokens[tok_index + 1]):
-            subtree = ["Number2", tokens[tok_index], tokens[tok_index + 1]]
-            return [True, tok_index + 2, subtree]
-    return [False, tok_index, subtree]
+        # <number>
+        (result, ret_index, ret_subtree) = self.Number(tok_index)
+        if result:
+            return [True, ret_index, ["Value1", ret_subtree]]
+        return [False, tok_index, []]
+
+    @memoize
+    def Name(self, tok_index):
+        """
+        Return Name subtree, if possible.
+
+        <Name> ->
+            IDENT
+            | SUB IDENT
+            | ADD IDENT
+        """
+        subtree = []
+        # IDENT
+        if is_ident(self.tokens[tok_index]):
+            subtree = ["Name0", self.tokens[tok_index].text]
+            return [True, tok_index + 1, subtree]
+
+        # SUB IDENT
+        if SUB == self.tokens[tok_index].kind:
+            if is_ident(self.tokens[tok_index + 1]):
+                subtree = ["Name1", self.tokens[tok_index].text,
+                           self.tokens[tok_index + 1].text]
+                return [True, tok_index + 2, subtree]
+
+        # ADD IDENT
+        if ADD == self.tokens[tok_index].kind:
+            if is_ident(self.tokens[tok_index + 1]):
+                subtree = ["Name2", self.tokens[tok_index].text,
+                           self.tokens[tok_index + 1].text]
+                return [True, tok_index + 2, subtree]
+        return [False, tok_index, subtree]
+
+    @memoize
+    def Number(self, tok_index):
+        """
+        Return Number subtree, if possible.
+
+        <Number> ->
+            NUMBER
+            | SUB NUMBER
+            | ADD NUMBER
+        """
+        subtree = []
+        # NUMBER
+        if is_number(self.tokens[tok_index]):
+            subtree = ["Number0", self.tokens[tok_index].text]
+            return [True, tok_index + 1, subtree]
+
+        # SUB NUMBER
+        if SUB == self.tokens[tok_index].kind:
+            if is_number(self.tokens[tok_index + 1]):
+                subtree = ["Number1", self.tokens[tok_index].text,
+                           self.tokens[tok_index + 1].text]
+                return [True, tok_index + 2, subtree]
+
+        # ADD NUMBER
+        if ADD == self.tokens[tok_index].kind:
+            if is_number(self.tokens[tok_index + 1]):
+                subtree = ["Number2", self.tokens[tok_index].text,
+                           self.tokens[tok_index + 1].text]
+                return [True, tok_index + 2, subtree]
+        return [False, tok_index, subtree]
 
 
 if __name__ == '__main__':
-    tokens = ""
-    for line in fileinput.input():
-        tokens += line
-    tokens = tokens.split()
-
-    parseTree = Program(0)[2]
-
-    pp.pprint(parseTree)
+    arg_parser = argparse.ArgumentParser(description="Quirk parser")
+    arg_parser.add_argument("files", nargs="*")
+    arg_parser.add_argument("--no-packrat", action="store_true",
+                            help="disable memoization of grammar functions")
+    arg_parser.add_argument("--memo-stats", action="store_true",
+                            help="report packrat cache hits on stderr")
+    arg_parser.add_argument("--rule-stats", action="store_true",
+                            help="report what each grammar function did on "
+                                 "stderr")
+    arg_parser.add_argument("--text", action="store_true",
+                            help="pretty-print the tree instead of writing "
+                                 "the binary tree format")
+    args = arg_parser.parse_args()
+    packrat = not args.no_packrat
+    if args.rule_stats:
+        enable_rule_stats()
+
+    token_text = ""
+    for line in fileinput.input(files=args.files):
+        token_text += line
+
+    positions = []
+    token_list = lexer.read_tokens(token_text, positions)
+    (result, ret_index, parseTree) = parse(token_list)
+    failed = EOF != token_list[ret_index].kind
+    if failed:
+        # described by fastparser.py, which knows which tokens were expected,
+        # so the message is the one quirk.py gives. fastparser imports this
+        # module, so it can't be imported at the top.
+        import fastparser
+        fastparser.parse(token_list)
+        print("parser.py: Syntax error at %s: %s" %
+              (lexer.position_text(positions, fastparser.failure.index),
+               fastparser.failure_message(token_list)), file=sys.stderr)
+    if args.memo_stats:
+        print("packrat cache hits: %d" % memo_hits, file=sys.stderr)
+    if args.rule_stats:
+        sys.stderr.write(rule_stats_report())
+    if failed:
+        # a partial tree would run as if it were the whole program
+        sys.exit(1)
+
+    if args.text:
+        pp.pprint(parseTree)
+    else:
+        treeformat.write_tree(parseTree, sys.stdout.buffer)
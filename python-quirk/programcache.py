@@ -0,0 +1,216 @@
+"""
+On-disk cache of parsed Quirk programs.
+
+    cache = programcache.ProgramCache(directory)
+    tree = quirk.parse(source, cache)
+
+The parse tree of each program is kept in a file of its own in directory,
+named after a hash of the source text and grammar_tag. A program that has
+been parsed before is read back from its file without running the lexer or
+the parser. grammar_tag is a hash of the source of the modules a tree
+depends on - the lexer, fastparser.py, the tree format and this module - and
+of the Python version, so after any change to them old entries are simply
+never hit again.
+
+An entry holds the list of the program's top-level Statement subtrees,
+written with marshal, which reads them back around ten times quicker than
+parsing. marshal has a nesting limit that the Program0 / Program1 chain of
+any sizeable program would hit, so the chain is rebuilt around the
+statements when they are read; a program with a statement nested too deeply
+for marshal is stored in the binary format of treeformat.py instead.
+
+Several processes can share a directory. Entries are written to a temporary
+file in the directory and renamed into place, so a reader only ever sees a
+whole entry; one that can't be decoded all the same is treated as a miss and
+removed. Each hit sets its entry's modification time, and whenever a new
+entry takes the directory over max_bytes, the entries used least recently
+are deleted until it's back under. Failing to read or write the cache never
+stops a program from running; it's counted in the statistics instead.
+"""
+import gc
+import os
+import sys
+import marshal
+import hashlib
+import tempfile
+import contextlib
+
+import lexer
+import fastparser
+import treeformat
+
+# Everything a cached tree depends on besides the source text
+grammar_tag = hashlib.sha256(sys.version.encode("utf-8"))
+for module in (lexer, fastparser, treeformat, sys.modules[__name__]):
+    with open(module.__file__, "rb") as module_file:
+        grammar_tag.update(module_file.read())
+grammar_tag = grammar_tag.hexdigest()[:16]
+
+# Header of the entries that hold marshalled statements
+MAGIC = b"QRKS\x01"
+
+# File name suffix of cache entries
+entry_suffix = ".qtree"
+
+
+class ProgramCache(object):
+    """
+    A directory of parse trees, keyed by source text.
+
+    directory - where the entries are kept; created if it doesn't exist
+    max_bytes - the most the entries may take up in total before the least
+        recently used ones are evicted
+
+    hits, misses, writes, evictions and errors count what this instance has
+    done; stats() adds the current size of the whole directory.
+    """
+
+    def __init__(self, directory, max_bytes=64 << 20):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.errors = 0
+
+    def entry_path(self, source):
+        """Return the path of the entry for source text."""
+        key = hashlib.sha256((grammar_tag + source).encode("utf-8"))
+        return os.path.join(self.directory, key.hexdigest() + entry_suffix)
+
+    def get(self, source):
+        """Return the cached parse tree of source text, or None on a miss."""
+        path = self.entry_path(source)
+        try:
+            with open(path, "rb") as entry_file:
+                data = entry_file.read()
+            tree = decode_entry(data)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, ValueError, EOFError, TypeError):
+            self.errors += 1
+            self.misses += 1
+            with contextlib.suppress(OSError):
+                os.unlink(path)
+            return None
+
+        # the modification time is the entry's last use for eviction
+        with contextlib.suppress(OSError):
+            os.utime(path)
+        self.hits += 1
+        return tree
+
+    def put(self, source, tree):
+        """Store the parse tree of source text, then evict if over size."""
+        path = self.entry_path(source)
+        try:
+            (fd, temp_path) = tempfile.mkstemp(dir=self.directory,
+                                               prefix=".", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as temp_file:
+                    write_entry(tree, temp_file)
+                os.replace(temp_path, path)
+            except BaseException:
+                with contextlib.suppress(OSError):
+                    os.unlink(temp_path)
+                raise
+        except OSError:
+            self.errors += 1
+            return
+        self.writes += 1
+        self.evict()
+
+    def entries(self):
+        """
+        Return (modification time, size, path) of every entry in the
+        directory, least recently used first.
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(entry_suffix):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                # evicted by another process
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        entries.sort()
+        return entries
+
+    def evict(self):
+        """Delete the least recently used entries until under max_bytes."""
+        entries = self.entries()
+        total = sum(size for (mtime, size, path) in entries)
+        for (mtime, size, path) in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+            except OSError:
+                self.errors += 1
+                continue
+            total -= size
+
+    def stats(self):
+        """Return this instance's counts and the directory's current size."""
+        entries = self.entries()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "errors": self.errors,
+            "entries": len(entries),
+            "bytes": sum(size for (mtime, size, path) in entries),
+        }
+
+
+def write_entry(tree, stream):
+    """Write the cache entry for a parse tree to the binary stream."""
+    statements = []
+    node = tree
+    while "Program0" == node[0]:
+        statements.append(node[1])
+        node = node[2]
+    statements.append(node[1])
+    try:
+        data = marshal.dumps(statements)
+    except ValueError:
+        # a statement is nested too deeply for marshal
+        treeformat.write_tree(tree, stream)
+        return
+    stream.write(MAGIC)
+    stream.write(data)
+
+
+def decode_entry(data):
+    """
+    Return the parse tree held in a cache entry (bytes). Raises ValueError,
+    EOFError or TypeError if it isn't a well-formed entry.
+    """
+    if treeformat.is_binary_tree(data):
+        return treeformat.read_tree(data)
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("not a Quirk cache entry")
+
+    # paused like in treeformat.read_tree()
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        statements = marshal.loads(data[len(MAGIC):])
+        if not isinstance(statements, list) or not statements:
+            raise ValueError("not a list of statements")
+        tree = ["Program1", statements.pop()]
+        while statements:
+            tree = ["Program0", statements.pop(), tree]
+        return tree
+    finally:
+        if gc_was_enabled:
+            gc.enable()
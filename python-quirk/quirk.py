@@ -0,0 +1,202 @@
+"""
+Run Quirk programs in a single process.
+
+    python quirk.py [--engine tree|closure|vm] [--cache DIR] [--memoize N]
+                    [--optimize] [--profile FILE] [file.q ...]
+
+Lexes, parses and interprets each file (or standard input) in turn, passing
+the token list and parse tree between the stages as Python objects instead of
+piping text between three processes. Other code can import this module and
+call run() for each program; the modules are then loaded, and the lexer's
+pattern compiled (when lexer.py is imported), once for all the programs run
+in the process. With --cache, parse trees are kept in a directory and
+programs that have been parsed before skip the lexer and parser altogether;
+see programcache.py. With --memoize, calls of pure functions are memoized;
+see memo.py. With --optimize, parse trees go through optimizer.py before they
+are run. --profile uses interpreter.py's profiler.
+"""
+import io
+import sys
+import json
+import array
+import argparse
+
+import memo
+import lexer
+import bytecode
+import compiler
+import fastparser
+import optimizer
+import interpreter
+import programcache
+
+
+def tokenize(source, offsets=None):
+    """
+    Return the list of lexer.Tokens for Quirk source text, ending in EOF.
+
+    offsets - if given, a list or array that gets the source offset of each
+        token, including the EOF.
+    """
+    tokens = lexer.lex(source, offsets)
+    tokens.append(lexer.eofToken)
+    if offsets is not None:
+        offsets.append(len(source))
+    return tokens
+
+
+def parse(source, cache=None):
+    """
+    Return the parse tree for Quirk source text.
+
+    Unlike the parser.py pipeline, which quietly drops anything after the
+    longest parsable prefix, this raises an Exception if the whole program
+    doesn't parse. The message gives the line and column of the furthest
+    token the parser couldn't get past and what it expected there, e.g.
+    "Syntax error at line 3, column 12: expected ')' but found 'print'".
+
+    cache - a programcache.ProgramCache to look the tree up in first, and to
+        store it in after parsing.
+    """
+    if cache is not None:
+        tree = cache.get(source)
+        if tree is not None:
+            return tree
+    offsets = array.array('l')
+    tokens = tokenize(source, offsets)
+    (result, ret_index, tree) = fastparser.parse(tokens)
+    if not result or lexer.EOF != tokens[ret_index].kind:
+        raise syntax_error(source, tokens, offsets)
+    if cache is not None:
+        cache.put(source, tree)
+    return tree
+
+
+def syntax_error(source, tokens, offsets):
+    """
+    Return the Exception parse() raises for the furthest failure of the last
+    fastparser parse of tokens, which were lexed from source with offsets.
+    """
+    position = lexer.line_column(source, offsets[fastparser.failure.index])
+    return Exception('Syntax error at line %d, column %d: %s' %
+                     (position + (fastparser.failure_message(tokens),)))
+
+
+def run_tree(tree, scope, out):
+    """Run a parse tree by walking it with interpreter.py."""
+    interpreter.Interpreter(tree, out).run(scope)
+
+
+def run_closure(tree, scope, out):
+    """Run a parse tree by compiling it to closures with compiler.py."""
+    compiler.compile_program(tree)(scope, out)
+
+
+def run_vm(tree, scope, out):
+    """Run a parse tree by compiling it to bytecode for the stack VM."""
+    bytecode.run_code(bytecode.compile_program(tree), scope, out)
+
+
+# Execution engines for execute(), by name. Each takes a parse tree, the
+# scope to run it in and the file-like object to print to (None for
+# sys.stdout).
+engines = {
+    "tree": run_tree,
+    "closure": run_closure,
+    "vm": run_vm,
+}
+
+
+def execute(tree, out=None, engine="closure"):
+    """
+    Run a parse tree and return its global scope.
+
+    out - a file-like object that receives the printed output instead of
+        sys.stdout.
+    engine - the name of the execution engine in engines to use.
+
+    Programs can be run on several threads at once, each with its own out.
+    """
+    scope = {}
+    engines[engine](tree, scope, out)
+    return scope
+
+
+def run(source, out=None, engine="closure", cache=None, optimize=False):
+    """
+    Lex, parse and run Quirk source text; see parse() and execute(). With
+    optimize, the tree is run through optimizer.optimize() first.
+    """
+    tree = parse(source, cache)
+    if optimize:
+        tree = optimizer.optimize(tree)
+    return execute(tree, out, engine)
+
+
+def run_to_string(source, engine="closure", optimize=False):
+    """Run Quirk source text and return everything it printed."""
+    out = io.StringIO()
+    run(source, out, engine, optimize=optimize)
+    return out.getvalue()
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Run Quirk programs")
+    arg_parser.add_argument("files", nargs="*")
+    arg_parser.add_argument("--engine", choices=sorted(engines),
+                            default="closure",
+                            help="execution engine (default: closure)")
+    arg_parser.add_argument("--cache", metavar="DIR",
+                            help="keep parse trees in this directory")
+    arg_parser.add_argument("--cache-size", type=int, default=64 << 20,
+                            metavar="BYTES",
+                            help="evict cached trees over this total size")
+    arg_parser.add_argument("--cache-stats", action="store_true",
+                            help="write cache statistics to stderr")
+    arg_parser.add_argument("--memoize", type=int, default=0, metavar="N",
+                            help="remember the last N results of each pure "
+                                 "function")
+    arg_parser.add_argument("--memo-stats", action="store_true",
+                            help="write memoization statistics to stderr")
+    arg_parser.add_argument("--optimize", action="store_true",
+                            help="optimize parse trees before running them")
+    arg_parser.add_argument("--optimize-stats", action="store_true",
+                            help="write optimizer statistics to stderr")
+    arg_parser.add_argument("--profile", metavar="FILE",
+                            help="profile Quirk functions and statements "
+                                 "and write collapsed stacks to FILE "
+                                 "('-' for stderr); needs --engine tree")
+    arg_parser.add_argument("--profile-stats", action="store_true",
+                            help="write a profile table to stderr; needs "
+                                 "--engine tree")
+    args = arg_parser.parse_args()
+    memo.memo_size = args.memoize
+    if args.profile or args.profile_stats:
+        if args.engine != "tree":
+            arg_parser.error("profiling needs --engine tree")
+        interpreter.enable_profile()
+
+    cache = None
+    if args.cache:
+        cache = programcache.ProgramCache(args.cache, args.cache_size)
+    if not args.files:
+        run(sys.stdin.read(), engine=args.engine, cache=cache,
+            optimize=args.optimize)
+    for path in args.files:
+        with open(path) as source_file:
+            run(source_file.read(), engine=args.engine, cache=cache,
+                optimize=args.optimize)
+    if cache is not None and args.cache_stats:
+        sys.stderr.write(json.dumps(cache.stats()) + "\n")
+    if args.memo_stats:
+        for function_stats in memo.stats():
+            sys.stderr.write(json.dumps(function_stats) + "\n")
+    if args.optimize and args.optimize_stats:
+        sys.stderr.write(json.dumps(optimizer.stats()) + "\n")
+    if args.profile:
+        profile_stream = interpreter.open_trace(args.profile)
+        interpreter.write_collapsed_stacks(profile_stream)
+        if profile_stream is not sys.stderr:
+            profile_stream.close()
+    if args.profile_stats:
+        sys.stderr.write(interpreter.profile_report())
@@ -0,0 +1,211 @@
+"""
+Run many Quirk programs on a pool of worker processes.
+
+    python runner.py [--workers N] [--timeout SECONDS] [--output-dir DIR]
+                     [--engine tree|closure|vm] [--cache DIR] [--memoize N]
+                     [--optimize] (DIRECTORY | PROGRAM.q | MANIFEST) ...
+
+Runs every .q file under each DIRECTORY, each PROGRAM.q, and every file
+listed in each MANIFEST - any other file, with one path per line, relative to
+the manifest's directory (blank lines and lines starting with # are
+skipped) - on a concurrent.futures.ProcessPoolExecutor. Each worker imports
+the modules once and keeps them, with the lexer's compiled pattern and, with
+--cache, a programcache.ProgramCache, for every program it runs, so a
+program costs about what quirk.run() does instead of three new Python
+processes.
+
+Each program's printed output and error are captured separately. By default
+a JSON object is written to stdout for every program, in the order they were
+given:
+
+    {"program": "a/x.q", "output": "2.0\\n", "error": null, "seconds": 0.0012}
+
+With --output-dir, the output of a/x.q goes to DIR/a/x.out instead, and its
+error, if it had one, to DIR/a/x.err. A program that raised an error keeps
+the output it printed before; one that runs longer than --timeout seconds is
+stopped (with a SIGALRM timer in the worker, so only where signal.setitimer()
+exists) and gets the error "timeout". A summary with the number of programs,
+errors and timeouts and the programs run per second goes to stderr.
+"""
+import io
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import concurrent.futures
+
+import memo
+import quirk
+import programcache
+
+# Set in each worker process by start_worker()
+worker_options = None
+worker_cache = None
+
+
+class ProgramTimeout(Exception):
+    """Raised in a worker when a program runs out of time."""
+
+
+def find_programs(path):
+    """
+    Return the .q files under a directory, sorted, a .q file itself, or the
+    files a manifest lists.
+    """
+    if os.path.isdir(path):
+        programs = []
+        for (directory, subdirectories, files) in os.walk(path):
+            subdirectories.sort()
+            programs.extend(os.path.join(directory, name)
+                            for name in sorted(files) if name.endswith(".q"))
+        return programs
+    if path.endswith(".q"):
+        return [path]
+    base = os.path.dirname(path)
+    with open(path) as manifest:
+        return [os.path.join(base, line.strip()) for line in manifest
+                if line.strip() and not line.startswith("#")]
+
+
+def start_worker(options):
+    """
+    Set up a worker process. options is a dict with the engine, timeout,
+    cache and cache_size, memoize and optimize settings.
+    """
+    global worker_options, worker_cache
+    worker_options = options
+    memo.memo_size = options["memoize"]
+    if options["cache"]:
+        worker_cache = programcache.ProgramCache(options["cache"],
+                                                 options["cache_size"])
+    if options["timeout"] and hasattr(signal, "setitimer"):
+        signal.signal(signal.SIGALRM, time_out)
+
+
+def time_out(signum, frame):
+    """SIGALRM handler that stops the program running in a worker."""
+    raise ProgramTimeout()
+
+
+def run_program(path):
+    """
+    Run the program in a file in a worker process and return its result
+    dict: the path, the output it printed, the error it raised ("Type:
+    message", "timeout" or None) and the seconds it took.
+    """
+    out = io.StringIO()
+    error = None
+    timeout = worker_options["timeout"]
+    timed = timeout and hasattr(signal, "setitimer")
+    start = time.perf_counter()
+    try:
+        if timed:
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+        try:
+            with open(path) as source_file:
+                source = source_file.read()
+            quirk.run(source, out, worker_options["engine"], worker_cache,
+                      worker_options["optimize"])
+        finally:
+            if timed:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+    except ProgramTimeout:
+        error = "timeout"
+    except Exception as e:
+        error = "%s: %s" % (type(e).__name__, e)
+    seconds = time.perf_counter() - start
+    # a worker runs many programs, so it mustn't keep counts for them all
+    memo.reset_stats()
+    return {"program": path, "output": out.getvalue(), "error": error,
+            "seconds": seconds}
+
+
+def run_programs(paths, workers=None, chunk_size=8, engine="closure",
+                 timeout=None, cache=None, cache_size=64 << 20, memoize=0,
+                 optimize=False):
+    """
+    Run the programs in the files at paths on a pool of workers
+    (os.cpu_count() of them by default) and yield the result dict of each,
+    in order; see run_program(). Programs are handed to the workers
+    chunk_size at a time. The other arguments are as for the command-line
+    options.
+    """
+    options = {"engine": engine, "timeout": timeout, "cache": cache,
+               "cache_size": cache_size, "memoize": memoize,
+               "optimize": optimize}
+    with concurrent.futures.ProcessPoolExecutor(
+            workers, initializer=start_worker,
+            initargs=(options,)) as executor:
+        for result in executor.map(run_program, paths, chunksize=chunk_size):
+            yield result
+
+
+def write_result(result, output_dir):
+    """Write the output and error of a result to files in output_dir."""
+    (stem, extension) = os.path.splitext(os.path.relpath(result["program"]))
+    parts = [part for part in stem.split(os.sep)
+             if part not in ("", ".", "..")]
+    stem = os.path.join(output_dir, *parts)
+    os.makedirs(os.path.dirname(stem) or ".", exist_ok=True)
+    with open(stem + ".out", "w") as out_file:
+        out_file.write(result["output"])
+    if result["error"] is not None:
+        with open(stem + ".err", "w") as err_file:
+            err_file.write(result["error"] + "\n")
+    elif os.path.exists(stem + ".err"):
+        os.remove(stem + ".err")
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("paths", nargs="+",
+                            metavar="DIRECTORY|PROGRAM.q|MANIFEST")
+    arg_parser.add_argument("--workers", type=int, default=None,
+                            help="worker processes (default: one per CPU)")
+    arg_parser.add_argument("--chunk-size", type=int, default=8,
+                            help="programs handed to a worker at a time")
+    arg_parser.add_argument("--timeout", type=float, default=None,
+                            metavar="SECONDS",
+                            help="stop programs that run longer than this")
+    arg_parser.add_argument("--output-dir", metavar="DIR",
+                            help="write each program's output and error to "
+                                 "files in DIR instead of JSON to stdout")
+    arg_parser.add_argument("--engine", choices=sorted(quirk.engines),
+                            default="closure",
+                            help="execution engine (default: closure)")
+    arg_parser.add_argument("--cache", metavar="DIR",
+                            help="keep parse trees in this directory")
+    arg_parser.add_argument("--cache-size", type=int, default=64 << 20,
+                            metavar="BYTES",
+                            help="evict cached trees over this total size")
+    arg_parser.add_argument("--memoize", type=int, default=0, metavar="N",
+                            help="remember the last N results of each pure "
+                                 "function")
+    arg_parser.add_argument("--optimize", action="store_true",
+                            help="optimize parse trees before running them")
+    args = arg_parser.parse_args()
+
+    paths = []
+    for path in args.paths:
+        if not os.path.exists(path):
+            arg_parser.error("no such file or directory: %s" % path)
+        paths.extend(find_programs(path))
+    counts = {"programs": 0, "errors": 0, "timeouts": 0}
+    start = time.perf_counter()
+    for result in run_programs(paths, args.workers, args.chunk_size,
+                               args.engine, args.timeout, args.cache,
+                               args.cache_size, args.memoize, args.optimize):
+        counts["programs"] += 1
+        if "timeout" == result["error"]:
+            counts["timeouts"] += 1
+        elif result["error"] is not None:
+            counts["errors"] += 1
+        if args.output_dir:
+            write_result(result, args.output_dir)
+        else:
+            sys.stdout.write(json.dumps(result) + "\n")
+    counts["seconds"] = time.perf_counter() - start
+    counts["programs_per_second"] = counts["programs"] / counts["seconds"]
+    sys.stderr.write(json.dumps(counts) + "\n")
@@ -0,0 +1,195 @@
+"""
+Compact binary interchange format for Quirk parse trees.
+
+A parse tree is a nested list whose first element is a node label such as
+"Expression0" and whose other elements are subtrees or token strings. It is
+written as a pre-order stream of unsigned LEB128 varints after a short header:
+
+    MAGIC
+    item := varint h
+        h even: a list of h >> 1 items follows
+        h odd:  the string with index h >> 1 in the string table; if that
+                index is the size of the table, the string is new and is
+                followed by varint length and its UTF-8 bytes, and it is
+                appended to the table
+
+The string table starts out holding every node label and bare token kind in
+node_kinds, so those are written as a single small integer code. Identifier
+and number tokens are written in full once and referenced by index after
+that. Both the writer and the reader use an explicit stack, so trees of any
+depth can be exchanged.
+"""
+
+import gc
+
+MAGIC = b"QRKT\x01"
+
+# Initial string table. The position of a string is its code in the stream,
+# so new entries must only ever be added at the end (or MAGIC bumped).
+node_kinds = [
+    "Program0", "Program1",
+    "Statement0", "Statement1", "Statement2",
+    "FunctionDeclaration0",
+    "FunctionParams0", "FunctionParams1",
+    "FunctionBody0", "FunctionBody1",
+    "Return0",
+    "Assignment0", "Assignment1",
+    "SingleAssignment0", "MultipleAssignment0",
+    "Print0",
+    "NameList0", "NameList1",
+    "ParameterList0", "ParameterList1",
+    "Parameter0", "Parameter1",
+    "Expression0", "Expression1", "Expression2",
+    "Term0", "Term1", "Term2",
+    "Factor0", "Factor1", "Factor2", "Factor3", "Factor4",
+    "FunctionCall0", "FunctionCall1",
+    "FunctionCallParams0", "FunctionCallParams1",
+    "SubExpression0",
+    "Value0", "Value1",
+    "Name0", "Name1", "Name2",
+    "Number0", "Number1", "Number2",
+    "FUNCTION", "VAR", "RETURN", "PRINT", "ASSIGN", "ADD", "SUB", "MULT",
+    "DIV", "EXP", "LPAREN", "RPAREN", "LBRACE", "RBRACE", "COMMA", "COLON",
+    "EOF",
+]
+
+# Buffered output is handed to the stream in chunks of about this size.
+flush_size = 1 << 16
+
+
+def is_binary_tree(data):
+    """Return True if data (bytes) starts with the binary tree header."""
+    return data[:len(MAGIC)] == MAGIC
+
+
+def write_tree(tree, stream):
+    """
+    Write tree to the binary stream in the compact format.
+
+    The encoding is produced incrementally and flushed to stream every
+    flush_size bytes, so the whole encoding is never held in memory.
+    """
+    codes = {}
+    for kind in node_kinds:
+        codes[kind] = len(codes)
+
+    out = bytearray(MAGIC)
+    stack = [tree]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, list):
+            value = len(item) << 1
+            stack.extend(reversed(item))
+        else:
+            code = codes.get(item)
+            if code is None:
+                code = codes[item] = len(codes)
+                append_varint(out, (code << 1) | 1)
+                data = item.encode("utf-8")
+                value = len(data)
+                append_varint(out, value)
+                out += data
+                continue
+            value = (code << 1) | 1
+        if value < 0x80:
+            out.append(value)
+        else:
+            append_varint(out, value)
+        if len(out) >= flush_size:
+            stream.write(out)
+            out = bytearray()
+    stream.write(out)
+
+
+def append_varint(out, value):
+    """Append the unsigned LEB128 encoding of value to the bytearray out."""
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_tree(data):
+    """
+    Return the parse tree encoded in data (bytes) by write_tree().
+
+    Raises ValueError if data is not a well-formed encoding. Like
+    fastparser.parse(), this pauses the cyclic garbage collector while the
+    millions of small lists of a large tree are being created.
+    """
+    if not is_binary_tree(data):
+        raise ValueError("not a binary Quirk parse tree")
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return decode_items(data)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+def decode_items(data):
+    """Decode the item stream following the header of data; see read_tree."""
+    table = list(node_kinds)
+    index = len(MAGIC)
+    end = len(data)
+
+    # Each stack entry is a list under construction and the number of items
+    # it is still waiting for. A sentinel entry collects the root.
+    root = []
+    stack = [[root, 1]]
+    top = stack[-1]
+    while stack:
+        byte = data[index] if index < end else 0x80
+        if byte < 0x80:
+            value = byte
+            index += 1
+        else:
+            (value, index) = read_varint(data, index)
+
+        if value & 1:
+            code = value >> 1
+            if code == len(table):
+                (length, index) = read_varint(data, index)
+                if index + length > end:
+                    raise ValueError("truncated parse tree")
+                table.append(data[index:index + length].decode("utf-8"))
+                index += length
+            elif code > len(table):
+                raise ValueError("bad string reference %d" % code)
+            top[0].append(table[code])
+            top[1] -= 1
+        else:
+            item = []
+            top[0].append(item)
+            top[1] -= 1
+            if value:
+                top = [item, value >> 1]
+                stack.append(top)
+                continue
+
+        # pop every list that is now complete
+        while top[1] == 0:
+            stack.pop()
+            if not stack:
+                break
+            top = stack[-1]
+
+    if index != end:
+        raise ValueError("trailing data after parse tree")
+    return root[0]
+
+
+def read_varint(data, index):
+    """Return (value, next_index) for the varint starting at data[index]."""
+    value = 0
+    shift = 0
+    while True:
+        if index >= len(data):
+            raise ValueError("truncated parse tree")
+        byte = data[index]
+        index += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return (value, index)
+        shift += 7